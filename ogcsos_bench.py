@@ -0,0 +1,396 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+# micro benchmarks for OGC SOS API module
+#
+# usage: python ogcsos_bench.py [-n NUMBER] [align] [catalog] [parser] [result] [templates]
+#        python ogcsos_bench.py [--calls CALLS] [--nodes NODES] [--samples SAMPLES]
+#                               [--latency LATENCY] [--compression gzip] operations
+#
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timedelta
+from io import BytesIO
+from xml.etree.ElementTree import tostring
+import ogcsosapi
+from ogcsosapi import default_ogc_namespaces
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+PROCEDURE = 'TEST:Field:SensorNode001'
+PROPERTIES = ['air_temperature', 'relative_humidity', 'wind_speed']
+TIME_RANGE = [datetime(2017, 1, 1, 0, 0, 0), datetime(2017, 1, 1, 0, 10, 0)]
+
+
+def report(name, number, seconds):
+    """prints cost of a call (or an observation) and calls per second."""
+    print('%-40s %10.2f us/call %12.0f calls/s' % (name, seconds / number * 1e6,
+                                                   number / seconds))
+
+
+def compare(name, number, old, new):
+    """runs old and new callables number times each and reports them."""
+    if old() != new():
+        print('%s: outputs differ' % (name))
+    old_sec = min(timeit.repeat(old, number=number, repeat=3))
+    new_sec = min(timeit.repeat(new, number=number, repeat=3))
+    report(name + ' (builder)', number, old_sec)
+    report(name + ' (template)', number, new_sec)
+    print('%-40s %10.1fx' % ('', old_sec / new_sec))
+
+
+def bench_templates(opts):
+    """request XML by build_*_request + tostring vs render_*_request."""
+    number = opts.number
+    compare('GetObservation', number,
+            lambda: tostring(ogcsosapi.build_get_observation_request(
+                PROCEDURE, PROPERTIES, TIME_RANGE, default_ogc_namespaces()), 'utf-8'),
+            lambda: ogcsosapi.render_get_observation_request(
+                PROCEDURE, PROPERTIES, TIME_RANGE))
+    compare('GetResult', number,
+            lambda: tostring(ogcsosapi.build_get_result_request(
+                PROCEDURE, PROPERTIES, TIME_RANGE, default_ogc_namespaces()), 'utf-8'),
+            lambda: ogcsosapi.render_get_result_request(
+                PROCEDURE, PROPERTIES, TIME_RANGE))
+    compare('GetCapabilities', number,
+            lambda: tostring(ogcsosapi.build_get_capabitilies_request(
+                default_ogc_namespaces()), 'utf-8'),
+            lambda: ogcsosapi.render_get_capabilities_request())
+    compare('DescribeSensor', number,
+            lambda: tostring(ogcsosapi.build_describe_sensor_request(
+                PROCEDURE, default_ogc_namespaces()), 'utf-8'),
+            lambda: ogcsosapi.render_describe_sensor_request(PROCEDURE))
+
+
+def make_observation_response(count):
+    """returns GetObservation response (bytes) which has count observations."""
+    namespaces = default_ogc_namespaces()
+    xmlns = ' '.join(['%s="%s"' % (qname, uri)
+                      for qname, uri in sorted(namespaces.items())])
+    obs = []
+    for i in range(count):
+        dt = TIME_RANGE[0] + timedelta(minutes=i // len(PROPERTIES))
+        obs.append('<sos:observationData><om:OM_Observation gml:id="o%d">'
+                   '<om:phenomenonTime><gml:TimeInstant gml:id="t%d">'
+                   '<gml:timePosition>%s</gml:timePosition></gml:TimeInstant>'
+                   '</om:phenomenonTime>'
+                   '<om:observedProperty>%s</om:observedProperty>'
+                   '<om:result xsi:type="gml:MeasureType" uom="Cel">%.1f</om:result>'
+                   '</om:OM_Observation></sos:observationData>' %
+                   (i, i, dt.strftime(ogcsosapi.ISO8601_JST),
+                    PROPERTIES[i % len(PROPERTIES)], 20.0 + i % 10))
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<sos:GetObservationResponse %s>%s</sos:GetObservationResponse>' %
+            (xmlns, ''.join(obs))).encode('utf-8')
+
+
+def bench_parser(opts):
+    """per observation cost of parsing GetObservation response,
+    converting XPath for every observation vs once per response."""
+    count = max(opts.number // 10, 1)
+    resp_body = make_observation_response(count)
+    (resp_root, namespaces) = ogcsosapi.parse_response(resp_body)
+    elems = resp_root.findall(ogcsosapi.get_cn_tag('.//om:OM_Observation', namespaces))
+    paths = ogcsosapi._observation_paths(namespaces)
+
+    def parse_elements_old():
+        return [ogcsosapi.parse_observation(elem, namespaces) for elem in elems]
+
+    def parse_elements_new():
+        return [ogcsosapi.parse_observation(elem, namespaces, paths) for elem in elems]
+
+    def parse_stream_old():
+        return [ogcsosapi.parse_observation(elem, ns)
+                for elem, ns in ogcsosapi.iter_observation_elements(BytesIO(resp_body))]
+
+    def parse_stream_new():
+        return list(ogcsosapi.iter_parse_observations(BytesIO(resp_body)))
+
+    for name, old, new in (('parse_observation', parse_elements_old, parse_elements_new),
+                           ('iter_parse_observations', parse_stream_old, parse_stream_new)):
+        if old() != new():
+            print('%s: outputs differ' % (name))
+        old_sec = min(timeit.repeat(old, number=10, repeat=3))
+        new_sec = min(timeit.repeat(new, number=10, repeat=3))
+        report(name + ' (per observation)', count * 10, old_sec)
+        report(name + ' (per response)', count * 10, new_sec)
+        print('%-40s %10.1fx' % ('', old_sec / new_sec))
+
+
+def decode_result_values_strptime(text):
+    """decodes sos:resultValues line by line, as parse_result did before."""
+    times = []
+    values = []
+    for l in text.strip().split('\n'):
+        elem = l.split(',')
+        if len(elem) == 2:
+            times.append(ogcsosapi.parse_iso8601_datetime(elem[0]))
+            values.append(float(elem[1]))
+    return times, values
+
+
+def bench_result(opts):
+    """per sample cost of decoding sos:resultValues in GetResult response."""
+    count = max(opts.number // len(PROPERTIES), 1)
+    lines = []
+    for prop in PROPERTIES:
+        for i in range(count):
+            dt = TIME_RANGE[0] + timedelta(minutes=i)
+            lines.append('%s,%.1f' % (dt.strftime(ogcsosapi.ISO8601_JST), 20.0 + i % 10))
+    text = '\n'.join(lines)
+
+    decoders = [('strptime per line', decode_result_values_strptime),
+                ('bulk (python)', ogcsosapi._decode_result_values_python)]
+    if ogcsosapi.np is not None:
+        decoders.append(('bulk (numpy)', ogcsosapi._decode_result_values_numpy))
+    for name, decoder in decoders:
+        seconds = min(timeit.repeat(lambda: decoder(text), number=1, repeat=3))
+        report(name, len(lines), seconds)
+
+
+def pivot_by_probing(measurements, properties):
+    """pivots measurements dict into rows, as ogcsos_shell did before."""
+    rows = []
+    for dt, measure in sorted(measurements.items()):
+        rows.append((dt, [measure[prop]['value'] if prop in measure else None
+                          for prop in properties]))
+    return rows
+
+
+def bench_align(opts):
+    """per sample cost of pivoting measurements into rows on common time grid."""
+    count = max(opts.number // len(PROPERTIES), 1)
+    measurements = {}
+    for i in range(count):
+        measurements[TIME_RANGE[0] + timedelta(minutes=i)] = \
+            dict((prop, {'value' : 20.0 + i % 10, 'uom' : 'Cel'})
+                 for j, prop in enumerate(PROPERTIES) if (i + j) % 4)
+    samples = ogcsosapi.count_samples(measurements)
+
+    def aligned(measurements):
+        table = ogcsosapi.align_series(ogcsosapi.measurement_series(measurements, PROPERTIES))
+        return list(table.iter_rows())
+
+    pivots = [('dict probing', lambda: pivot_by_probing(measurements, PROPERTIES)),
+              ('align_series (dict)', lambda: aligned(measurements))]
+    if ogcsosapi.np is not None:
+        columnar = ogcsosapi.to_columnar(measurements, PROPERTIES)
+        pivots.append(('align_series (columnar)', lambda: ogcsosapi.align_series(
+            ogcsosapi.measurement_series(columnar, PROPERTIES))))
+        pivots.append(('align_series (columnar, ffill 5min)', lambda: ogcsosapi.align_series(
+            ogcsosapi.measurement_series(columnar, PROPERTIES), timedelta(minutes=5),
+            'ffill', timedelta(minutes=10))))
+    if pivots[0][1]() != pivots[1][1]():
+        print('align: outputs differ')
+    for name, pivot in pivots:
+        seconds = min(timeit.repeat(pivot, number=1, repeat=3))
+        report(name, samples, seconds)
+
+
+def bench_catalog(opts):
+    """time to parse GetCapabilities response and memory of parsed offerings."""
+    from ogcsos_mockserver import MockSOSServer
+    mock = MockSOSServer(nodes=max(opts.number // 10, 1))
+    try:
+        resp_body = mock.render_GetCapabilities(None).encode('utf-8')
+    finally:
+        mock.stop()
+
+    def parse():
+        (resp_root, namespaces) = ogcsosapi.parse_response(resp_body)
+        return ogcsosapi.parse_capabilities(resp_root, namespaces)[4]
+
+    seconds = min(timeit.repeat(parse, number=1, repeat=3))
+    report('parse_capabilities', mock.nodes, seconds)
+    if tracemalloc is not None:
+        (resp_root, namespaces) = ogcsosapi.parse_response(resp_body)
+        tracemalloc.start()
+        observations = ogcsosapi.parse_capabilities(resp_root, namespaces)[4]
+        catalog = ogcsosapi.Catalog(observations=observations)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('%-40s %10.0f bytes/offering' % ('catalog memory', size / float(mock.nodes)))
+
+
+def start_mock_server(opts):
+    """runs ogcsos_mockserver.py in another process, returns (process, endpoint)."""
+    args = [sys.executable, '-u',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ogcsos_mockserver.py'),
+            '--port', '0', '--nodes', str(opts.nodes), '--properties', str(len(PROPERTIES)),
+            '--latency', str(opts.latency)]
+    if opts.compression:
+        args += ['--compression', opts.compression]
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, universal_newlines=True)
+    # first line is 'serving at ENDPOINT'
+    endpoint = proc.stdout.readline().split()[-1]
+    return proc, endpoint
+
+
+class quiet(object):
+    """context manager which discards stdout."""
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def measure(func, calls):
+    """calls func calls times, returns (list of seconds of each call, samples of
+    a call, peak bytes allocated in a call or None)."""
+    samples = func()
+    timings = []
+    for _ in range(calls):
+        begin = time.time()
+        func()
+        timings.append(time.time() - begin)
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return timings, samples, peak
+
+
+def bench_operations(opts):
+    """throughput, latency and peak memory of SOSServer operations against
+    the mock server."""
+    from ogcsos_mockserver import MockSOSServer, PROPERTIES as MOCK_PROPERTIES
+    props = [prop for (prop, _, _, _) in MOCK_PROPERTIES[:len(PROPERTIES)]]
+    procedures = [MockSOSServer.procedure(i) for i in range(opts.nodes)]
+    time_range = [TIME_RANGE[0], TIME_RANGE[0] + timedelta(minutes=opts.samples - 1)]
+    measurements = {}
+    for i in range(opts.samples):
+        measurements[TIME_RANGE[0] + timedelta(minutes=i)] = \
+            dict((prop, {'value' : '%.1f' % (20.0 + i % 10), 'uom' : 'Cel'})
+                 for prop in props)
+
+    count_samples = ogcsosapi.count_samples
+
+    (proc, endpoint) = start_mock_server(opts)
+    directory = tempfile.mkdtemp()
+    catalog_path = os.path.join(directory, 'catalog.json')
+    try:
+        server = ogcsosapi.SOSServer(endpoint, 'token', pool_size=opts.nodes)
+        # a poll of all nodes after the first one, which fetched whole lag
+        poller = server.poll(procedures, props, 0,
+                             start=datetime.now().replace(microsecond=0) -
+                             timedelta(minutes=opts.samples),
+                             max_workers=opts.nodes, lag=timedelta(minutes=opts.samples))
+
+        def poll():
+            return sum([count_samples(next(poller)[1] or {}) for _ in procedures])
+
+        poll()
+        operations = [
+            ('get_capabilities',
+             lambda: len(server.get_capabilities()[4])),
+            ('update_capabilities',
+             lambda: server.update_capabilities() or len(server.observations)),
+            ('update_capabilities (cached)',
+             lambda: server.update_capabilities(catalog_path) or len(server.observations)),
+            ('describe_sensor',
+             lambda: server.describe_sensor(procedures[0]) or 0),
+            ('get_observation',
+             lambda: count_samples(server.get_observation(procedures[0], props, time_range,
+                                                          use_cache=False))),
+            ('iter_observation',
+             lambda: len(list(server.iter_observation(procedures[0], props, time_range)))),
+            ('get_result',
+             lambda: count_samples(server.get_result(procedures[0], props, time_range,
+                                                     use_cache=False))),
+            ('get_observations_many',
+             lambda: sum([count_samples(result) for result in
+                          server.get_observations_many(procedures, props,
+                                                       time_range)[0].values()])),
+            ('aggregate_observation',
+             lambda: len(list(server.aggregate_observation(procedures[0], props, time_range,
+                                                           timedelta(minutes=10))))),
+            ('poll', poll),
+            ('insert_observation',
+             lambda: server.insert_observation(procedures[0], measurements) and
+                     count_samples(measurements)),
+            ('insert_observations_many',
+             lambda: len(server.insert_observations_many(
+                 procedures[0], ogcsosapi.iter_measurements(measurements))) and
+                     count_samples(measurements)),
+        ]
+
+        print('%-30s %9s %10s %9s %9s %9s %9s %10s' %
+              ('operation', 'calls/s', 'samples/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+               'peak KiB'))
+        for name, func in operations:
+            if name == 'describe_sensor':
+                # it prints request and response
+                with quiet():
+                    (timings, samples, peak) = measure(func, opts.calls)
+            else:
+                (timings, samples, peak) = measure(func, opts.calls)
+            timings.sort()
+
+            def percentile(q):
+                return timings[min(int(q * len(timings)), len(timings) - 1)] * 1000
+
+            seconds = sum(timings)
+            print('%-30s %9.1f %10.0f %9.2f %9.2f %9.2f %9.2f %10s' %
+                  (name, len(timings) / seconds, samples * len(timings) / seconds,
+                   percentile(0.5), percentile(0.9), percentile(0.99), timings[-1] * 1000,
+                   '%.0f' % (peak / 1024.0) if peak is not None else '-'))
+    finally:
+        shutil.rmtree(directory)
+        proc.terminate()
+        proc.wait()
+
+
+BENCHMARKS = {
+    'align'     : bench_align,
+    'catalog'   : bench_catalog,
+    'operations': bench_operations,
+    'parser'    : bench_parser,
+    'result'    : bench_result,
+    'templates' : bench_templates,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='micro benchmarks for ogcsosapi')
+    parser.add_argument('-n', '--number', type=int, default=10000,
+                        help='number of calls for each micro benchmark')
+    parser.add_argument('--calls', type=int, default=100,
+                        help='number of calls of each operation (operations)')
+    parser.add_argument('--nodes', type=int, default=10,
+                        help='number of sensor nodes of the mock server (operations)')
+    parser.add_argument('--samples', type=int, default=60,
+                        help='number of samples per property in a request (operations)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='response latency of the mock server in seconds (operations)')
+    parser.add_argument('--compression', choices=['gzip', 'deflate'],
+                        help='compress responses of the mock server (operations)')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run, one of %s (default: all)' %
+                        (', '.join(sorted(BENCHMARKS))))
+    opts = parser.parse_args()
+    for name in opts.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: %s' % (name))
+
+    for name in opts.benchmarks or sorted(BENCHMARKS):
+        print('# %s' % (name))
+        BENCHMARKS[name](opts)
+
+
+if __name__ == '__main__':
+    main()
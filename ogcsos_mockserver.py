@@ -0,0 +1,360 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+# local mock SOS server for benchmarks and offline development
+#
+# usage: python ogcsos_mockserver.py [--port PORT] [--nodes NODES] [--step STEP]
+#                                    [--latency LATENCY] [--compression gzip]
+#
+from __future__ import print_function
+import sys
+if sys.version_info[0] == 2:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+import argparse
+import gzip
+import math
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from io import BytesIO
+from xml.etree.ElementTree import fromstring
+
+ISO8601_JST = '%Y-%m-%dT%H:%M:%S+09:00'
+EPOCH = datetime(1970, 1, 1)
+
+NAMESPACES = ('xmlns:sos="http://www.opengis.net/sos/2.0" '
+              'xmlns:ows="http://www.opengis.net/ows/1.1" '
+              'xmlns:gml="http://www.opengis.net/gml/3.2" '
+              'xmlns:swes="http://www.opengis.net/swes/2.0" '
+              'xmlns:om="http://www.opengis.net/om/2.0" '
+              'xmlns:xlink="http://www.w3.org/1999/xlink" '
+              'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"')
+
+PROPERTIES = [('air_temperature', 'Cel', 20.0, 10.0),
+              ('relative_humidity', '%', 60.0, 30.0),
+              ('air_pressure', 'hPa', 1013.0, 15.0),
+              ('wind_speed', 'm/s', 3.0, 3.0),
+              ('soil_temperature', 'Cel', 15.0, 5.0),
+              ('soil_moisture', '%', 30.0, 10.0),
+              ('solar_radiation', 'W/m2', 400.0, 400.0),
+              ('rainfall', 'mm', 1.0, 1.0)]
+
+
+def _tag(elem):
+    return elem.tag.split('}')[-1]
+
+
+def _compress(body, encoding):
+    if encoding == 'gzip':
+        out = BytesIO()
+        with gzip.GzipFile(fileobj=out, mode='wb') as f:
+            f.write(body)
+        return out.getvalue()
+    return zlib.compress(body)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _MockSOSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b''.join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        encoding = self.headers.get('Content-Encoding', '').lower()
+        if encoding == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+        return body
+
+    def do_POST(self):
+        mock = self.server.mock
+        root = fromstring(self._read_body())
+        operation = _tag(root)
+        mock._count(operation)
+        if mock.latency or mock.jitter:
+            time.sleep(max(0.0, random.gauss(mock.latency, mock.jitter)))
+
+        handler = getattr(mock, 'render_' + operation, None)
+        if handler is None:
+            body = mock.render_exception('OperationNotSupported')
+            status = 400
+        else:
+            body = handler(root)
+            status = 200
+        body = body.encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml')
+        accepted = self.headers.get('Accept-Encoding', '')
+        if mock.compression and mock.compression in accepted:
+            body = _compress(body, mock.compression)
+            self.send_header('Content-Encoding', mock.compression)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockSOSServer(object):
+    """a local stand-in of SOS server which responds synthetic data.
+
+    Sensor nodes are named 'MOCK:Field:Node-0000', 'MOCK:Field:Node-0001', ...
+    and each of them has a sample of every property at every step seconds.
+    Values are smooth waves, same for same node, property and time.
+
+    Args:
+      nodes (int): number of sensor nodes (offerings)
+      properties (int): number of observed properties of each node (max 8)
+      step (int): seconds between samples
+      latency (float): seconds to wait before each response
+      jitter (float): standard deviation of the latency (seconds)
+      compression (str): 'gzip' or 'deflate' to compress responses for clients
+                         accepting it, None for no compression
+      host (str): address to listen
+      port (int): port to listen, 0 for any free port
+
+    Attributes:
+      counts (dict): has operation name as key and number of requests as value
+
+    Examples:
+      mock = MockSOSServer(nodes=100, latency=0.05)
+      mock.start()
+      server = SOSServer(mock.endpoint, 'token')
+      ...
+      mock.stop()
+
+    """
+    def __init__(self, nodes=10, properties=4, step=60, latency=0.0, jitter=0.0,
+                 compression=None, host='127.0.0.1', port=0):
+        self.nodes = nodes
+        self.properties = PROPERTIES[:properties]
+        self.uoms = dict((prop, uom) for (prop, uom, _, _) in self.properties)
+        self._waves = dict((prop, (base, amplitude))
+                           for (prop, _, base, amplitude) in self.properties)
+        self._procedures = set([self.procedure(i) for i in range(nodes)])
+        self.step = step
+        self.latency = latency
+        self.jitter = jitter
+        self.compression = compression
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._httpd = _ThreadingHTTPServer((host, port), _MockSOSHandler)
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%d/sos' % (host, port)
+
+    @staticmethod
+    def procedure(index):
+        return 'MOCK:Field:Node-%04d' % (index)
+
+    def _count(self, operation):
+        with self._lock:
+            self.counts[operation] = self.counts.get(operation, 0) + 1
+
+    def start(self):
+        """starts serving in a background thread, returns endpoint."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self.endpoint
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        if self._thread is not None:
+            # shutdown waits for serve_forever to return
+            self._httpd.shutdown()
+            self._thread = None
+        self._httpd.server_close()
+
+    def value(self, procedure, prop, dt):
+        """returns synthetic value of prop of procedure at dt, a daily wave."""
+        (base, amplitude) = self._waves[prop]
+        seconds = (dt - EPOCH).total_seconds()
+        phase = (sum(bytearray(procedure.encode('utf-8'))) % 100) / 10.0
+        return round(base + amplitude * math.sin(seconds / 43200.0 * math.pi + phase), 2)
+
+    def _parse_request(self, root):
+        procedure = [e.text for e in root if _tag(e) == 'offering'][0]
+        props = [e.text for e in root if _tag(e) == 'observedProperty']
+        times = [e.text for e in root.iter()
+                 if _tag(e) in ('beginPosition', 'endPosition', 'timePosition')]
+        if times and times[0] != 'last':
+            times = [datetime.strptime(t[:19], '%Y-%m-%dT%H:%M:%S') for t in times]
+        else:
+            # latest sample
+            now = datetime.now()
+            times = [now - timedelta(seconds=self.step), now]
+        if len(times) == 1:
+            times = [times[0], times[0]]
+
+        # samples are aligned to step
+        start = int(math.ceil((times[0] - EPOCH).total_seconds() / self.step)) * self.step
+        end = int((times[1] - EPOCH).total_seconds())
+        dts = [EPOCH + timedelta(seconds=t) for t in range(start, end + 1, self.step)]
+        if procedure not in self._procedures:
+            dts = []
+        return procedure, [prop for prop in props if prop in self.uoms], dts
+
+    def render_exception(self, code):
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<ows:ExceptionReport %s version="2.0.0">'
+                '<ows:Exception exceptionCode="%s"/></ows:ExceptionReport>' %
+                (NAMESPACES, code))
+
+    def render_GetCapabilities(self, root):
+        observed = ''.join(['<swes:observableProperty>%s</swes:observableProperty>' % (prop)
+                            for (prop, _, _, _) in self.properties])
+        offerings = []
+        for i in range(self.nodes):
+            offerings.append(
+                '<swes:offering><sos:ObservationOffering>'
+                '<swes:description>Mock sensor node %d</swes:description>'
+                '<swes:identifier>http://mock/offering/%d</swes:identifier>'
+                '<swes:name>Node-%04d</swes:name>'
+                '<swes:procedure>%s</swes:procedure>%s'
+                '<sos:observedArea><gml:Envelope srsName="http://www.opengis.net/def/crs/EPSG/0/4326">'
+                '<gml:lowerCorner>%.4f %.4f</gml:lowerCorner>'
+                '<gml:upperCorner>%.4f %.4f</gml:upperCorner></gml:Envelope></sos:observedArea>'
+                '<sos:phenomenonTime><gml:TimePeriod gml:id="pt_%d">'
+                '<gml:beginPosition>2017-01-01T00:00:00.000+09:00</gml:beginPosition>'
+                '<gml:endPosition>%s</gml:endPosition></gml:TimePeriod></sos:phenomenonTime>'
+                '</sos:ObservationOffering></swes:offering>' %
+                (i, i, i, self.procedure(i), observed,
+                 35.0 + i * 0.001, 139.0 + i * 0.001, 35.0 + i * 0.001, 139.0 + i * 0.001,
+                 i, datetime.now().strftime(ISO8601_JST)))
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<sos:Capabilities %s version="2.0.0">'
+                '<ows:ServiceIdentification><ows:Title>Mock SOS Server</ows:Title>'
+                '<ows:Abstract>synthetic data for benchmarks</ows:Abstract>'
+                '<ows:ServiceType codeSpace="http://opengeospatial.net">OGC:SOS</ows:ServiceType>'
+                '<ows:ServiceTypeVersion>2.0.0</ows:ServiceTypeVersion>'
+                '<ows:Fees>NONE</ows:Fees><ows:AccessConstraints>NONE</ows:AccessConstraints>'
+                '</ows:ServiceIdentification>'
+                '<ows:ServiceProvider><ows:ProviderName>Mock Provider</ows:ProviderName>'
+                '<ows:ProviderSite xlink:href="http://localhost/"/>'
+                '<ows:ServiceContact><ows:IndividualName>Admin</ows:IndividualName>'
+                '<ows:PositionName>admin</ows:PositionName><ows:ContactInfo><ows:Address>'
+                '<ows:DeliveryPoint>1-1</ows:DeliveryPoint><ows:City>Tokyo</ows:City>'
+                '<ows:AdministrativeArea>Tokyo</ows:AdministrativeArea>'
+                '<ows:PostalCode>100-0001</ows:PostalCode><ows:Country>Japan</ows:Country>'
+                '<ows:ElectronicMailAddress>admin@localhost</ows:ElectronicMailAddress>'
+                '</ows:Address></ows:ContactInfo></ows:ServiceContact></ows:ServiceProvider>'
+                '<ows:OperationsMetadata>'
+                '<ows:Operation name="GetCapabilities"/><ows:Operation name="GetObservation"/>'
+                '<ows:Operation name="GetResult"/><ows:Operation name="InsertObservation"/>'
+                '<ows:Operation name="DescribeSensor"/></ows:OperationsMetadata>'
+                '<sos:filterCapabilities/>'
+                '<sos:contents><sos:Contents>%s</sos:Contents></sos:contents>'
+                '</sos:Capabilities>' % (NAMESPACES, ''.join(offerings)))
+
+    def render_GetObservation(self, root):
+        (procedure, props, dts) = self._parse_request(root)
+        uoms = self.uoms
+        observations = []
+        for i, dt in enumerate(dts):
+            time_str = dt.strftime(ISO8601_JST)
+            for prop in props:
+                observations.append(
+                    '<sos:observationData><om:OM_Observation gml:id="o_%d">'
+                    '<om:type xlink:href="http://www.opengis.net/def/observationType/'
+                    'OGC-OM/2.0/OM_Measurement"/>'
+                    '<om:phenomenonTime><gml:TimeInstant gml:id="t_%d">'
+                    '<gml:timePosition>%s</gml:timePosition></gml:TimeInstant></om:phenomenonTime>'
+                    '<om:resultTime xlink:href="#t_%d"/>'
+                    '<om:procedure xlink:href="%s"/>'
+                    '<om:observedProperty>%s</om:observedProperty>'
+                    '<om:featureOfInterest xlink:href="%s"/>'
+                    '<om:result xsi:type="gml:MeasureType" uom="%s">%s</om:result>'
+                    '</om:OM_Observation></sos:observationData>' %
+                    (len(observations), i, time_str, i, procedure, prop, procedure,
+                     uoms[prop], self.value(procedure, prop, dt)))
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<sos:GetObservationResponse %s>%s</sos:GetObservationResponse>' %
+                (NAMESPACES, ''.join(observations)))
+
+    def render_GetResult(self, root):
+        (procedure, props, dts) = self._parse_request(root)
+        lines = []
+        for prop in props:
+            for dt in dts:
+                lines.append('%s,%s' % (dt.strftime(ISO8601_JST),
+                                        self.value(procedure, prop, dt)))
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<sos:GetResultResponse %s><sos:resultValues>\n%s\n</sos:resultValues>'
+                '</sos:GetResultResponse>' % (NAMESPACES, '\n'.join(lines)))
+
+    def render_InsertObservation(self, root):
+        # same as the real server, without namespace definition
+        return ('<sos:InsertObservationResponse><sos:observation>Inserted</sos:observation>'
+                '</sos:InsertObservationResponse>')
+
+    def render_DescribeSensor(self, root):
+        procedure = [e.text for e in root if _tag(e) == 'procedure'][0]
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<swes:DescribeSensorResponse %s>'
+                '<swes:procedureDescriptionFormat>http://www.opengis.net/sensorML/1.0.1'
+                '</swes:procedureDescriptionFormat>'
+                '<swes:description><swes:SensorDescription><swes:data>%s</swes:data>'
+                '</swes:SensorDescription></swes:description>'
+                '</swes:DescribeSensorResponse>' % (NAMESPACES, procedure))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='local mock SOS server')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen')
+    parser.add_argument('--nodes', type=int, default=10, help='number of sensor nodes')
+    parser.add_argument('--properties', type=int, default=4,
+                        help='number of observed properties of each node (max %d)' %
+                        (len(PROPERTIES)))
+    parser.add_argument('--step', type=int, default=60, help='seconds between samples')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to wait before each response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='standard deviation of latency')
+    parser.add_argument('--compression', choices=['gzip', 'deflate'],
+                        help='compress responses')
+    opts = parser.parse_args()
+
+    mock = MockSOSServer(opts.nodes, opts.properties, opts.step, opts.latency, opts.jitter,
+                         opts.compression, opts.host, opts.port)
+    print('serving at %s' % (mock.endpoint))
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
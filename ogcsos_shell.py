@@ -13,13 +13,20 @@ if sys.version_info[0] == 2:
 else:
     user_input = input
 import argparse
+import hashlib
 import os
+import shutil
 import ogcsosapi
 from ogcsosapi import SOSServer
 from datetime import datetime, timedelta
 import readline
 
 HISTORY_FILE = '.ogcsos_shell_history'
+CATALOG_FILE = '.ogcsos_catalog.json'
+EXPORT_BUFFER_SIZE = 1 << 20
+
+# os.rename can not overwrite existing file on Windows
+replace_file = getattr(os, 'replace', os.rename)
 
 class AP(argparse.ArgumentParser):
     """inherits ArgumentParser to prevent it to exit after printing help.
@@ -38,15 +45,24 @@ def parse_args():
     parser.add_argument('--command', help='command to execute')
     parser.add_argument('--debug', action='store_true', help='enable debug mode')
     parser.add_argument('--instant', action='store_true',
-                        help='prevent to call GetCapability, you must specify node or sensor by name.')
+                        help='prevent to call GetCapability, you must specify node or sensor by name'
+                        ' unless capabilities have been saved.')
+    parser.add_argument('--catalog', help='file to save capabilities (default: ~/%s)' % (CATALOG_FILE))
+    parser.add_argument('--catalog_ttl', type=float, default=3600,
+                        help='seconds saved capabilities are used without refreshing')
+    parser.add_argument('--no_catalog', action='store_true', help='do not save capabilities')
     args = parser.parse_args()
     return args
 
 def print_help():
     print('''
-    nodes                          : list all sensor nodes served by the server
+    nodes [pattern]                : list all sensor nodes served by the server
     sensors [node]                 : list all sensors in the node
     measures -n [node] [sensors..] : get measurements of sensors of a node
+                                     (node can be glob pattern, eg. 'Weather*')
+    export -n [node] [-o path] [--merge] [--format csv|parquet] [sensors..]
+                                   : export measurements of nodes to CSV/Parquet files
+                                     (node can be glob pattern, sensors default to all)
     put-measures -n [node] [date,property,value,uom]
                                    : put measurement to a sensor of a node
     server                         : show server info
@@ -58,17 +74,23 @@ def print_help():
 def list_nodes(args, sosserver):
     parser = AP(prog='nodes')
     parser.add_argument('-l', action='store_true')
+    parser.add_argument('pattern', nargs='?', help='name or glob pattern of nodes to list')
     try:
         opts = parser.parse_args(args)
     except:
         return 
-    for i, node in enumerate(sosserver.observations):
+    if opts.pattern:
+        nodes = sosserver.find_offerings(opts.pattern)
+    else:
+        nodes = sosserver.observations
+    for node in nodes:
+        i = sosserver.catalog.numbers[node.procedure]
         if opts.l:
-            print('%2d: %s (%s) : %s' % (i+1, node.name, node.procedure, node.description))
+            print('%2d: %s (%s) : %s' % (i, node.name, node.procedure, node.description))
             print('    location  : %s %s' % (node.location[0], node.location[1]))
             print('    time range: %s %s' % (node.time_range[0], node.time_range[1]))
         else:
-            print('%2d: %s' % (i+1, node.name))
+            print('%2d: %s' % (i, node.name))
 
 def show_server(sosserver):
     print('%s: ' % (sosserver.server.name))
@@ -86,25 +108,29 @@ def show_provider(sosserver):
     print('    %s, %s, %s' % (sosserver.provider.city, 
                               sosserver.provider.pref, sosserver.provider.country))
 
-def get_node_from_name_or_number(ind, nodes):
+def get_node_from_name_or_number(ind, sosserver):
     the_node = None
     if ind.isdigit():
         # node number
         try:
-            the_node = nodes[int(ind)-1]
+            the_node = sosserver.observations[int(ind)-1]
         except IndexError:
             pass
     else:
-        for node in nodes:
-            if node.name == ind:
-                the_node = node
-                break
-        else:
+        the_node = sosserver.catalog.by_name.get(ind)
+        if the_node is None:
             return ind
                 
     return the_node
 
-def get_prop_from_name_or_number(ind, node):
+def get_nodes_from_pattern(ind, sosserver):
+    """returns list of nodes matching glob pattern, or specified by name or number."""
+    if any(c in ind for c in '*?['):
+        return sosserver.find_offerings(ind)
+    the_node = get_node_from_name_or_number(ind, sosserver)
+    return [the_node] if the_node else []
+
+def get_prop_from_name_or_number(ind, node, sosserver):
     the_prop = None
     if ind.isdigit():
         # sensor number
@@ -113,10 +139,8 @@ def get_prop_from_name_or_number(ind, node):
         except IndexError:
             pass
     elif node and type(node) != str:
-        for prop in node.properties:
-            if prop == ind:
-                the_prop = prop
-                break
+        if sosserver.has_property(node, ind):
+            the_prop = ind
     else:
         return ind
     return the_prop
@@ -129,7 +153,7 @@ def list_sensors(args, sosserver):
     except:
         return
     
-    the_node = get_node_from_name_or_number(opts.sensor, sosserver.observations)
+    the_node = get_node_from_name_or_number(opts.sensor, sosserver)
     if the_node:
         for i, prop in enumerate(the_node.properties):
             print('%2d: %s' % (i+1, prop))
@@ -144,7 +168,7 @@ def inspect_node(args, sosserver):
     except:
         return
     
-    the_node = get_node_from_name_or_number(opts.node, sosserver.observations)
+    the_node = get_node_from_name_or_number(opts.node, sosserver)
     if the_node:
         sosserver.describe_sensor(the_node)
     else:
@@ -177,20 +201,34 @@ def parse_cmd_datetime(dtstr):
 
     raise ValueError
 
-def get_measurements(args, sosserver):
-    parser = AP(prog='measurements')
-    parser.add_argument('-s', help='start datetime')
-    parser.add_argument('-e', help='end datetime')
-    parser.add_argument('-t', help='datetime of the data')
-    parser.add_argument('-n', help='node name or number', required=True)
-    parser.add_argument('-r', action='store_true', help='use GetResult')
-    #parser.add_argument('--header', action='store_true', help='with header')
-    parser.add_argument('sensors', nargs='+', help='sensors to get')
-    try:
-        opts = parser.parse_args(args)
-    except:
-        return
+DURATION_UNITS = {'s' : 1, 'm' : 60, 'h' : 3600, 'd' : 86400}
+
+def parse_duration(text):
+    """parses duration such as '90', '30s', '10m', '1h' and '1d' into timedelta."""
+    unit = DURATION_UNITS.get(text[-1:].lower())
+    number = text[:-1] if unit else text
+    seconds = float(number) * (unit or 1)
+    if seconds <= 0:
+        raise ValueError
+    return timedelta(seconds=seconds)
 
+def parse_aggregation(text):
+    """parses WINDOW[/STEP]:FUNCS, eg. '1h:mean' or '1h/10m:mean,max'.
+
+    Returns:
+      (timedelta, timedelta, list): window, step (None for tumbling) and functions
+
+    """
+    (windows, functions) = text.split(':') if ':' in text else (text, 'mean')
+    (size, step) = windows.split('/') if '/' in windows else (windows, None)
+    functions = functions.split(',')
+    for function in functions:
+        if function not in ogcsosapi.WindowAggregator.FUNCTIONS:
+            raise ValueError
+    return (parse_duration(size), parse_duration(step) if step else None, functions)
+
+def parse_time_range(opts):
+    """returns time range (list) given by -s, -e and -t options, None if invalid."""
     try:
         if opts.s:
             s_dt = parse_cmd_datetime(opts.s)
@@ -200,28 +238,120 @@ def get_measurements(args, sosserver):
                 e_dt = datetime.now()
             if s_dt >= e_dt:
                 print('start datetime must be less than end datetime !')
-                return
-            t_param = [ s_dt, e_dt ]
-        elif opts.t:
-            t_param = [ parse_cmd_datetime(opts.t) ]
+                return None
+            return [ s_dt, e_dt ]
+        elif getattr(opts, 't', None):
+            return [ parse_cmd_datetime(opts.t) ]
         else:
-            t_param = []
+            return []
     except ValueError:
         print('invalid datetime is specified. Please use format, 2016-10-26T00:00:00')
+        return None
+
+def get_measurements(args, sosserver):
+    parser = AP(prog='measurements')
+    parser.add_argument('-s', help='start datetime')
+    parser.add_argument('-e', help='end datetime')
+    parser.add_argument('-t', help='datetime of the data')
+    parser.add_argument('-n', help='node name, number or glob pattern', required=True)
+    parser.add_argument('-r', action='store_true', help='use GetResult')
+    #parser.add_argument('--header', action='store_true', help='with header')
+    add_align_arguments(parser)
+    parser.add_argument('--agg', help='aggregate in time windows, WINDOW[/STEP]:FUNCS '
+                        'eg. 1h:mean or 1d/1h:min,max. FUNCS are %s' %
+                        (','.join(ogcsosapi.WindowAggregator.FUNCTIONS)))
+    parser.add_argument('sensors', nargs='+', help='sensors to get')
+    try:
+        opts = parser.parse_args(args)
+    except:
         return
 
-    the_node = get_node_from_name_or_number(opts.n, sosserver.observations)
-    if not the_node:
+    t_param = parse_time_range(opts)
+    if t_param is None:
+        return
+    if opts.agg:
+        try:
+            opts.agg = parse_aggregation(opts.agg)
+        except ValueError:
+            print('invalid aggregation is specified. Please use format, 1h/10m:mean,max')
+            return
+
+    nodes = get_nodes_from_pattern(opts.n, sosserver)
+    if not nodes:
         print('No node was found !!')
         return
 
+    for the_node in nodes:
+        if len(nodes) > 1:
+            print('# %s' % (the_node.name))
+        print_measurements(the_node, opts, t_param, sosserver)
+
+def get_props_from_names_or_numbers(sensors, node, sosserver):
+    """returns properties of node specified by sensors, None if one is not found."""
     properties = []
-    for sensor in opts.sensors:
-        prop = get_prop_from_name_or_number(sensor, the_node)
+    for sensor in sensors:
+        prop = get_prop_from_name_or_number(sensor, node, sosserver)
         if not prop:
-            'No sensor was found in %s !!' % (the_node.name)
-            return
+            return None
         properties.append(prop)
+    return properties
+
+def add_align_arguments(parser):
+    parser.add_argument('--grid', type=int, help='align rows to time grid of this seconds')
+    parser.add_argument('--align', choices=['exact', 'nearest', 'ffill'], default='exact',
+                        help='value for a time: at the time (exact), at nearest time '
+                        '(nearest) or last one (ffill) (default: exact)')
+    parser.add_argument('--tolerance', type=int,
+                        help='seconds values can be apart from the time for nearest and ffill')
+
+def get_align_params(opts):
+    """returns (grid, method, tolerance) for format_csv_lines from options."""
+    grid = timedelta(seconds=opts.grid) if opts.grid else None
+    tolerance = timedelta(seconds=opts.tolerance) if opts.tolerance is not None else None
+    return (grid, opts.align, tolerance)
+
+def format_csv_lines(measurements, properties, prefix='', align=(None, 'exact', None)):
+    """returns CSV lines of measurements in time order.
+
+    Args:
+      measurements (dict): measurements dict
+      properties (list): observed properties for columns after time
+      prefix (str): added to head of each line, eg. 'node name,'
+      align (tuple): (grid, method, tolerance) given to ogcsosapi.align_series
+
+    Returns:
+      list: lines (str) which end with newline
+
+    """
+    (grid, method, tolerance) = align
+    lines = []
+    if grid is None and method == 'exact':
+        # times of the measurements as they are, pivot the dict directly
+        for dt, measure in sorted(measurements.items()):
+            values = [str(measure[prop]['value']) if prop in measure else ''
+                      for prop in properties]
+            if any(values):
+                # str(datetime) is same as strftime('%Y-%m-%d %H:%M:%S') without microseconds
+                lines.append('%s%s,%s\n' % (prefix, dt, ','.join(values)))
+        return lines
+
+    table = ogcsosapi.align_series(ogcsosapi.measurement_series(measurements, properties),
+                                   grid, method, tolerance)
+    for dt, row in table.iter_rows(skip_empty=True):
+        # str(datetime) is same as strftime('%Y-%m-%d %H:%M:%S') without microseconds
+        lines.append('%s%s,%s\n' % (prefix, dt, ','.join(['' if value is None else str(value)
+                                                           for value in row])))
+    return lines
+
+def print_measurements(the_node, opts, t_param, sosserver):
+    properties = get_props_from_names_or_numbers(opts.sensors, the_node, sosserver)
+    if properties is None:
+        print('No sensor was found in %s !!' % (the_node.name))
+        return
+
+    if opts.agg:
+        print_aggregations(the_node, properties, opts, t_param, sosserver)
+        return
 
     if opts.r:
         measurements = sosserver.get_result(the_node, properties, t_param)
@@ -229,15 +359,255 @@ def get_measurements(args, sosserver):
         measurements = sosserver.get_observation(the_node, properties, t_param)
 
     print('time,%s' % (','.join(properties)))
-    for dt, measure in sorted(measurements.items()):
-        line = []
-        line.append(dt.strftime('%Y-%m-%d %H:%M:%S'))
+    sys.stdout.write(''.join(format_csv_lines(measurements, properties,
+                                              align=get_align_params(opts))))
+
+def print_aggregations(the_node, properties, opts, t_param, sosserver):
+    (size, step, functions) = opts.agg
+    if opts.r:
+        measurements = sosserver.get_result(the_node, properties, t_param)
+        observations = ((dt, prop, value) for dt in sorted(measurements)
+                        for prop, value in measurements[dt].items())
+        windows = ogcsosapi.aggregate_observations(observations, size, step, functions,
+                                                   t_param)
+    else:
+        # aggregated while reading response
+        windows = sosserver.aggregate_observation(the_node, properties, t_param,
+                                                  size, step, functions)
+
+    rows = {}
+    for prop, start, results in windows:
+        rows.setdefault(start, {})[prop] = results
+
+    print('time,%s' % (','.join(['%s_%s' % (prop, function)
+                                 for prop in properties for function in functions])))
+    lines = []
+    for start, row in sorted(rows.items()):
+        values = []
         for prop in properties:
-            if prop in measure:
-                line.append(str(measure[prop]['value']))
+            results = row.get(prop, {})
+            for function in functions:
+                value = results.get(function)
+                values.append('' if value is None else str(round(value, 6)))
+        lines.append('%s,%s\n' % (start, ','.join(values)))
+    sys.stdout.write(''.join(lines))
+
+def get_node_name(node):
+    return node if type(node) == str else node.name
+
+def get_export_path(node, output, format='csv'):
+    """returns path of CSV (or Parquet) file for node in output directory."""
+    name = get_node_name(node)
+    for c in ':/\\':
+        name = name.replace(c, '_')
+    return os.path.join(output, '%s.%s' % (name, format))
+
+def get_export_paths(nodes, output, format='csv'):
+    """returns paths of files for nodes in output directory.
+
+    Names which would be the same file (also on case insensitive file systems)
+    get a short hash of the node name, so each node has its own file.
+
+    Raises:
+      ValueError: when nodes have the same name.
+
+    """
+    paths = [get_export_path(the_node, output, format) for the_node in nodes]
+    counts = {}
+    for path in paths:
+        counts[path.lower()] = counts.get(path.lower(), 0) + 1
+    for i, the_node in enumerate(nodes):
+        if counts[paths[i].lower()] > 1:
+            name = get_node_name(the_node)
+            digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+            paths[i] = '%s-%s.%s' % (paths[i][:-len(format) - 1], digest, format)
+    if len(set([path.lower() for path in paths])) < len(paths):
+        raise ValueError('nodes have the same name')
+    return paths
+
+def iter_time_chunks(t_param, size):
+    """splits time range into sub ranges of size, which do not share a second."""
+    if len(t_param) != 2 or size is None:
+        yield t_param
+        return
+    (cursor, end) = t_param
+    while cursor <= end:
+        chunk_end = min(cursor + size - timedelta(seconds=1), end)
+        yield [cursor, chunk_end]
+        cursor = chunk_end + timedelta(seconds=1)
+
+def merge_export_files(paths, output, header):
+    """concatenates files of nodes into output + '.part', and renames it to output."""
+    part = output + '.part'
+    if header is None:
+        with ogcsosapi.ParquetSink(part) as sink:
+            for path in paths:
+                sink.write_file(path)
+    else:
+        with open(part, 'w', EXPORT_BUFFER_SIZE) as f:
+            f.write(header)
+            for path in paths:
+                with open(path, 'r', EXPORT_BUFFER_SIZE) as node_file:
+                    shutil.copyfileobj(node_file, f, EXPORT_BUFFER_SIZE)
+    replace_file(part, output)
+
+def show_progress(done, total, rows, failed):
+    if sys.stderr.isatty():
+        sys.stderr.write('\rexported %d/%d nodes, %d rows, %d failed' %
+                         (done, total, rows, failed))
+        if done == total:
+            sys.stderr.write('\n')
+    else:
+        sys.stderr.write('exported %d/%d nodes, %d rows, %d failed\n' %
+                         (done, total, rows, failed))
+    sys.stderr.flush()
+
+def export_measurements(args, sosserver):
+    parser = AP(prog='export')
+    parser.add_argument('-s', help='start datetime')
+    parser.add_argument('-e', help='end datetime')
+    parser.add_argument('-n', help='node name, number or glob pattern', required=True)
+    parser.add_argument('-r', action='store_true', help='use GetResult')
+    parser.add_argument('-o', default='.',
+                        help='output directory, or output file with --merge (default: .)')
+    parser.add_argument('--merge', action='store_true',
+                        help='export all nodes to one file, with node name in 1st column')
+    parser.add_argument('-f', action='store_true',
+                        help='export again nodes which have been exported')
+    parser.add_argument('-j', type=int, default=8, help='number of nodes fetched concurrently')
+    parser.add_argument('--chunk', default='1d',
+                        help='time range fetched and written at a time, such as 6h '
+                        '(default: 1d)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='output format, parquet requires pyarrow (default: csv)')
+    add_align_arguments(parser)
+    parser.add_argument('sensors', nargs='*',
+                        help='sensors to export (default: all sensors of each node)')
+    try:
+        opts = parser.parse_args(args)
+    except:
+        return
+
+    if opts.format == 'parquet' and ogcsosapi.pyarrow is None:
+        print('pyarrow is required for parquet format !!')
+        return
+
+    t_param = parse_time_range(opts)
+    if t_param is None:
+        return
+    try:
+        opts.chunk = parse_duration(opts.chunk)
+    except ValueError:
+        print('invalid chunk is specified. Please use format, 1d')
+        return
+
+    nodes = get_nodes_from_pattern(opts.n, sosserver)
+    if not nodes:
+        print('No node was found !!')
+        return
+
+    # properties of each node
+    jobs = []
+    for the_node in nodes:
+        if opts.sensors:
+            properties = get_props_from_names_or_numbers(opts.sensors, the_node, sosserver)
+        elif type(the_node) != str:
+            properties = the_node.properties
+        else:
+            print('sensors must be specified for %s !!' % (the_node))
+            return
+        if properties is None:
+            print('No sensor was found in %s !!' % (get_node_name(the_node)))
+            return
+        jobs.append((the_node, properties))
+
+    if opts.merge:
+        columns = []
+        for (_, properties) in jobs:
+            columns.extend([prop for prop in properties if prop not in columns])
+        if os.path.dirname(opts.o) and not os.path.isdir(os.path.dirname(opts.o)):
+            os.makedirs(os.path.dirname(opts.o))
+        # files of nodes are kept here until all nodes are exported
+        directory = opts.o + '.nodes'
+    else:
+        directory = opts.o
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        paths = get_export_paths([the_node for (the_node, _) in jobs], directory, opts.format)
+    except ValueError as e:
+        print('%s !!' % (e))
+        return
+    remaining = jobs
+    if not opts.f:
+        # restart: nodes whose file exists have been exported
+        remaining = [job for (job, path) in zip(jobs, paths) if not os.path.exists(path)]
+        if len(remaining) < len(jobs):
+            print('skip %d nodes exported already' % (len(jobs) - len(remaining)))
+    properties_of = dict((id(the_node), properties) for (the_node, properties) in jobs)
+    path_of = dict((id(the_node), path) for ((the_node, _), path) in zip(jobs, paths))
+    align = get_align_params(opts)
+    # nearest and ffill need values around a time, which can be in other chunk
+    chunk = opts.chunk if opts.align == 'exact' else None
+
+    def fetch(the_node, properties, time_range):
+        if opts.r:
+            return sosserver.get_result(the_node, properties, time_range)
+        return sosserver.get_observation(the_node, properties, time_range)
+
+    def export_node(the_node):
+        """writes rows of the node to its file chunk by chunk, returns number of rows."""
+        properties = properties_of[id(the_node)]
+        path = path_of[id(the_node)]
+        part = path + '.part'
+        rows = 0
+        if opts.format == 'parquet':
+            procedure = the_node if type(the_node) == str else the_node.procedure
+            with ogcsosapi.ParquetSink(part) as sink:
+                for time_range in iter_time_chunks(t_param, chunk):
+                    measurements = fetch(the_node, properties, time_range)
+                    sink.write(procedure, measurements)
+                    rows += ogcsosapi.count_samples(measurements)
+        else:
+            if opts.merge:
+                # values are aligned to merged columns
+                (prefix, header, row_columns) = (get_node_name(the_node) + ',', '', columns)
             else:
-                line.append('')
-        print(','.join(line))
+                (prefix, header, row_columns) = ('', 'time,%s\n' % (','.join(properties)),
+                                                 properties)
+            with open(part, 'w', EXPORT_BUFFER_SIZE) as f:
+                f.write(header)
+                for time_range in iter_time_chunks(t_param, chunk):
+                    lines = format_csv_lines(fetch(the_node, properties, time_range),
+                                             row_columns, prefix, align)
+                    f.writelines(lines)
+                    rows += len(lines)
+        replace_file(part, path)
+        return rows
+
+    done = rows = 0
+    errors = {}
+    # nodes are written in parallel, and reported in order of completion
+    nodes = [the_node for (the_node, _) in remaining]
+    for procedure, result, error in sosserver.iter_many(export_node, nodes, opts.j):
+        done += 1
+        if error is not None:
+            errors[procedure] = error
+        else:
+            rows += result
+        show_progress(done, len(remaining), rows, len(errors))
+
+    for procedure, error in sorted(errors.items()):
+        print('failed to export %s: %s' % (procedure, error))
+    if opts.merge:
+        if errors:
+            print('%s is not written, run export again.' % (opts.o))
+            return
+        header = None if opts.format == 'parquet' else 'node,time,%s\n' % (','.join(columns))
+        merge_export_files(paths, opts.o, header)
+        for path in paths:
+            os.remove(path)
+        os.rmdir(directory)
 
 def put_measurements(args, sosserver):
     parser = AP(prog='put-measurements')
@@ -249,7 +619,7 @@ def put_measurements(args, sosserver):
         return
 
    
-    the_node = get_node_from_name_or_number(opts.n, sosserver.observations)
+    the_node = get_node_from_name_or_number(opts.n, sosserver)
     if not the_node:
         print('No node was found !!')
         return
@@ -273,7 +643,7 @@ def put_measurements(args, sosserver):
         if dt not in measurements:
             measurements[dt] = {}
 
-        prop = get_prop_from_name_or_number(elms[offset], the_node)
+        prop = get_prop_from_name_or_number(elms[offset], the_node, sosserver)
         if prop not in measurements[dt]:
             measurements[dt][prop] = {}
 
@@ -303,6 +673,8 @@ def exec_command(cmd, sosserver):
         list_sensors(args[1:], sosserver)
     elif args[0] == 'measurements' or args[0] == 'measures':
         get_measurements(args[1:], sosserver)
+    elif args[0] == 'export':
+        export_measurements(args[1:], sosserver)
     elif args[0] == 'put-measurements' or args[0] == 'put-measures':
         put_measurements(args[1:], sosserver)
     elif args[0] == 'inspect-node':
@@ -321,8 +693,16 @@ def main():
         print('Simple Shell Interface for OGC SOS API by Satoru MIYAMOTO\n')
         
     sosserver = SOSServer(opts.endpoint, opts.token, opts.is_token_header)
-    if not opts.instant:
-        sosserver.update_capabilities()
+    if opts.no_catalog:
+        catalog_path = None
+    else:
+        catalog_path = opts.catalog or os.path.join(os.path.expanduser('~'), CATALOG_FILE)
+    if opts.instant:
+        if catalog_path:
+            # saved capabilities allow to specify node or sensor by number
+            sosserver.load_capabilities(catalog_path)
+    else:
+        sosserver.update_capabilities(catalog_path, opts.catalog_ttl)
         if not opts.command:
             print('Welcome to %s by %s !' % (sosserver.server.name, sosserver.provider.name))
 
@@ -16,17 +16,61 @@ __license__ = 'MIT'
 import sys
 if sys.version_info[0] == 2:
     from HTMLParser import HTMLParser
-    from urllib2 import urlopen, Request, HTTPError
+    unescape = HTMLParser().unescape
+    from urllib2 import urlopen, Request, HTTPError, URLError
+    from urlparse import urlsplit
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+
+    try:
+        # 'futures' package, backport of concurrent.futures
+        from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+    except ImportError:
+        ThreadPoolExecutor = None
+
+    def _intern(text):
+        # intern accepts only str (bytes) in python 2
+        return intern(text) if type(text) == str else text
 else:
-    from html.parser import HTMLParser
+    from html import unescape
     from urllib.request import urlopen, Request
-    from urllib.error import HTTPError
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlsplit
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+    _intern = sys.intern
+import bisect
 import copy
-from io import StringIO
-from datetime import datetime, timedelta, tzinfo
+import json
+import math
+import os
+import random
+import re
+import socket
+from fnmatch import fnmatchcase
+import threading
+import zlib
+from io import BytesIO
+from datetime import date, datetime, timedelta, tzinfo
 from xml.etree import ElementTree as ET
-from xml.etree.ElementTree import Element, SubElement, tostring, fromstring, ParseError
+from xml.etree.ElementTree import Element, SubElement, tostring, ParseError
+from xml.sax.saxutils import escape
+from array import array
+import sqlite3
 import time
+try:
+    import numpy as np
+except ImportError:
+    # numpy is needed only for columnar format
+    np = None
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # pyarrow is needed only for ParquetSink
+    pyarrow = None
+
+# high resolution clock for instrumentation
+_clock = getattr(time, 'perf_counter', time.time)
 
 ISO8601_NO_TZ = '%Y-%m-%dT%H:%M:%S'
 ISO8601_JST = '%Y-%m-%dT%H:%M:%S+0900'
@@ -125,19 +169,215 @@ def default_ogc_namespaces():
     return ns
 
 
-class Server(object):
-    def __init__(self, **kwds):
-        self.__dict__.update(kwds)
+class _Record(object):
+    """base of catalog records, which keep attributes in __slots__ instead of __dict__.
 
+    Attributes not given are not set, same as plain objects.
+
+    """
+    __slots__ = ()
+    _fields = ()
 
-class Provider(object):
     def __init__(self, **kwds):
-        self.__dict__.update(kwds)
+        for name, value in kwds.items():
+            setattr(self, name, value)
 
+    def to_dict(self):
+        """returns attributes which have been set, as vars() returns for plain objects."""
+        return dict((name, getattr(self, name)) for name in self._fields if hasattr(self, name))
 
-class Observation(object):
-    def __init__(self, **kwds):
-        self.__dict__.update(kwds)
+
+class Server(_Record):
+    __slots__ = ('name', 'service_type', 'service_version', 'fees')
+    _fields = __slots__
+
+
+class Provider(_Record):
+    __slots__ = ('name', 'indiviual_name', 'posision_name', 'point', 'city', 'pref', 'country')
+    _fields = __slots__
+
+
+_NO_EXTENT = (float('nan'),) * 6
+
+
+class _Extents(object):
+    """numbers of locations and time ranges of offerings, in one array.
+
+    Each offering has a row of 6 numbers, latitude and longitude of lower corner and
+    upper corner, and begin and end of phenomenon time (EPOCH seconds, timezone
+    is ignored same as parse_iso8601_datetime). NaN for unknown.
+
+    It also keeps what offerings parsed together share, so the shared values
+    live as long as the catalog, not in the module.
+
+    """
+    __slots__ = ('values', 'local_names', '_time_ranges', '_property_sets')
+
+    def __init__(self):
+        self.values = array('d')
+        # local names of qualified tags in the response, '{uri}name' to 'name'
+        self.local_names = {}
+        # offerings share same time range mostly, it is kept once with its numbers
+        self._time_ranges = {}
+        # most of offerings have one of few sets of observed properties
+        self._property_sets = {}
+
+    def add(self, numbers=_NO_EXTENT):
+        """appends a row of numbers, returns its index."""
+        self.values.extend(numbers)
+        return len(self.values) // 6 - 1
+
+    def time_range(self, time_range):
+        """returns shared tuple of time_range and its 2 numbers (None if unknown)."""
+        time_range = tuple(time_range)
+        shared = self._time_ranges.get(time_range)
+        if shared is None:
+            shared = self._time_ranges[time_range] = (time_range, _parse_period(time_range))
+        return shared
+
+    def properties(self, properties):
+        """returns shared tuple of interned properties."""
+        properties = tuple(properties)
+        shared = self._property_sets.get(properties)
+        if shared is None:
+            shared = tuple([_intern(prop) for prop in properties])
+            self._property_sets[shared] = shared
+        return shared
+
+    def local_name(self, tag):
+        """returns local name of qualified tag, '{uri}name' to 'name'."""
+        name = self.local_names.get(tag)
+        if name is None:
+            name = self.local_names[tag] = tag[tag.rfind('}') + 1:]
+        return name
+
+
+def _parse_coordinates(location):
+    # 'lat lon' pairs of lower and upper corner into 4 floats
+    try:
+        coordinates = [float(value) for corner in location for value in corner.split()]
+    except (AttributeError, ValueError):
+        return None
+    return coordinates if len(coordinates) == 4 else None
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _parse_period(time_range):
+    # ISO8601 begin and end into 2 EPOCH seconds
+    try:
+        period = [(date(int(t[0:4]), int(t[5:7]), int(t[8:10])).toordinal() - _EPOCH_ORDINAL) *
+                  86400 + int(t[11:13]) * 3600 + int(t[14:16]) * 60 + int(t[17:19])
+                  for t in time_range]
+    except (TypeError, ValueError):
+        return None
+    return period if len(period) == 2 else None
+
+
+class Observation(_Record):
+    """observation offering (sensor node) in catalog.
+
+    Records are compact for catalogs of many offerings. Observed properties are
+    interned and tuples of same properties and same time ranges are shared between
+    offerings. Numbers of location and time_range are kept in an array shared by
+    offerings parsed together.
+
+    Attributes:
+      name (str): name of the offering
+      description (str): description of the offering
+      procedure (str): procedure (SOSName) of the offering
+      properties (tuple): observed properties
+      location (tuple): lower corner and upper corner, 'latitude longitude' (str)
+      time_range (tuple): begin and end of phenomenon time (str)
+      coordinates (tuple): location in 4 floats, None if it is unknown
+      period (tuple): time_range in 2 datetime, None if it is unknown
+
+    """
+    __slots__ = ('name', 'description', 'procedure', '_properties', '_extents', '_row',
+                 '_location', '_time_range')
+    _fields = ('name', 'description', 'procedure', 'properties', 'location', 'time_range')
+
+    def __init__(self, _extents=None, **kwds):
+        self._extents = _extents
+        self._row = -1
+        _Record.__init__(self, **kwds)
+
+    def _set_extent(self, location, time_range):
+        # sets location and time_range at once, used by parse_offering
+        if self._extents is None:
+            self._extents = _Extents()
+        self._location = tuple(location)
+        (self._time_range, period) = self._extents.time_range(time_range)
+        coordinates = _parse_coordinates(location)
+        if coordinates is None and period is None:
+            return
+        numbers = tuple(coordinates or _NO_EXTENT[:4]) + tuple(period or _NO_EXTENT[4:])
+        if self._row < 0:
+            self._row = self._extents.add(numbers)
+        else:
+            base = self._row * 6
+            self._extents.values[base:base + 6] = array('d', numbers)
+
+    def _set_numbers(self, offset, numbers):
+        if self._row < 0:
+            if self._extents is None:
+                self._extents = _Extents()
+            self._row = self._extents.add()
+        base = self._row * 6 + offset
+        self._extents.values[base:base + len(numbers)] = array('d', numbers)
+
+    def _get_numbers(self, offset, count):
+        if self._row < 0:
+            return None
+        base = self._row * 6 + offset
+        numbers = tuple(self._extents.values[base:base + count])
+        # NaN is unknown
+        return numbers if numbers[0] == numbers[0] else None
+
+    @property
+    def properties(self):
+        return self._properties
+
+    @properties.setter
+    def properties(self, properties):
+        if self._extents is None:
+            self._extents = _Extents()
+        self._properties = self._extents.properties(properties)
+
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, location):
+        self._location = tuple(location)
+        coordinates = _parse_coordinates(location)
+        if coordinates is not None or self._row >= 0:
+            self._set_numbers(0, coordinates or _NO_EXTENT[:4])
+
+    @property
+    def coordinates(self):
+        return self._get_numbers(0, 4)
+
+    @property
+    def time_range(self):
+        return self._time_range
+
+    @time_range.setter
+    def time_range(self, time_range):
+        if self._extents is None:
+            self._extents = _Extents()
+        (self._time_range, period) = self._extents.time_range(time_range)
+        if period is not None or self._row >= 0:
+            self._set_numbers(4, period or _NO_EXTENT[4:])
+
+    @property
+    def period(self):
+        seconds = self._get_numbers(4, 2)
+        if seconds is not None:
+            return tuple([EPOCH + timedelta(seconds=second) for second in seconds])
+        return None
 
 
 class Measurement(object):
@@ -145,6 +385,683 @@ class Measurement(object):
         self.__dict__.update(kwds)
 
 
+class ColumnarMeasurements(object):
+    """measurements in columnar format (requires numpy).
+
+    Attributes:
+      times (numpy.ndarray): sorted unique timestamps (datetime64[s])
+      values (dict): has observed property as key and values (float64 ndarray)
+                     aligned with times as value. missing value is NaN.
+      uoms (dict): has observed property as key and unit name as value
+
+    """
+    def __init__(self, times, values, uoms):
+        self.times = times
+        self.values = values
+        self.uoms = uoms
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def properties(self):
+        return list(self.values)
+
+    def to_dict(self):
+        """returns measurements dict such as get_observation returns in dict format."""
+        measurements = {}
+        for i, dt in enumerate(self.times.astype(object)):
+            measure = {}
+            for prop, values in self.values.items():
+                if not np.isnan(values[i]):
+                    measure[prop] = {'value' : float(values[i]), 'uom' : self.uoms.get(prop, '')}
+            if measure:
+                measurements[dt] = measure
+        return measurements
+
+
+def to_columnar(measurements, properties):
+    """converts measurements dict into ColumnarMeasurements.
+
+    Args:
+      measurements (dict): such as get_observation returns in dict format
+      properties (list): list of observed properties
+
+    Returns:
+      ColumnarMeasurements
+
+    """
+    properties = list(properties)
+    prop_index = dict((prop, i) for i, prop in enumerate(properties))
+    uoms = {}
+    times = []
+    prop_ids = array('i')
+    values = array('d')
+    for dt, measure in measurements.items():
+        time_str = dt.strftime(ISO8601_NO_TZ)
+        for prop, value in measure.items():
+            if prop not in prop_index:
+                prop_index[prop] = len(properties)
+                properties.append(prop)
+            times.append(time_str)
+            prop_ids.append(prop_index[prop])
+            values.append(float(value['value']))
+            uoms.setdefault(prop, value['uom'])
+    return build_columnar(times, prop_ids, values, properties, uoms)
+
+
+def _check_format(format):
+    if format not in ('dict', 'columnar'):
+        raise ValueError('unknown format: %s' % (format))
+    if format == 'columnar' and np is None:
+        raise ImportError('numpy is required for columnar format')
+
+
+def build_columnar(times, prop_ids, values, properties, uoms):
+    """builds ColumnarMeasurements from flat sample arrays.
+
+    Args:
+      times (list): timestamp of each sample, ISO8601 str without timezone,
+                    or datetime64 ndarray
+      prop_ids (array): index of observed property in properties of each sample
+      values (array): value (float) of each sample
+      properties (list): observed properties
+      uoms (dict): has observed property as key and unit name as value
+
+    Returns:
+      ColumnarMeasurements
+
+    """
+    sample_times = np.asarray(times, dtype='datetime64[s]')
+    (unique_times, inverse) = np.unique(sample_times, return_inverse=True)
+    prop_ids = np.asarray(prop_ids, dtype=np.int32)
+    values = np.asarray(values, dtype=np.float64)
+    columns = {}
+    for i, prop in enumerate(properties):
+        column = np.full(len(unique_times), np.nan)
+        selected = prop_ids == i
+        column[inverse[selected]] = values[selected]
+        columns[prop] = column
+    return ColumnarMeasurements(unique_times, columns, dict(uoms))
+
+
+def concat_columnar(results):
+    """concatenates ColumnarMeasurements into one.
+
+    Args:
+      results (list): list of ColumnarMeasurements, they may overlap.
+
+    Returns:
+      ColumnarMeasurements
+
+    """
+    properties = []
+    uoms = {}
+    for result in results:
+        for prop in result.values:
+            if prop not in properties:
+                properties.append(prop)
+        uoms.update(result.uoms)
+
+    if not results:
+        return ColumnarMeasurements(np.zeros(0, dtype='datetime64[s]'), {}, {})
+    all_times = np.concatenate([result.times for result in results])
+    (unique_times, inverse) = np.unique(all_times, return_inverse=True)
+    columns = dict((prop, np.full(len(unique_times), np.nan)) for prop in properties)
+    offset = 0
+    for result in results:
+        positions = inverse[offset:offset + len(result.times)]
+        for prop, values in result.values.items():
+            present = ~np.isnan(values)
+            columns[prop][positions[present]] = values[present]
+        offset += len(result.times)
+    return ColumnarMeasurements(unique_times, columns, uoms)
+
+
+def measurement_series(measurements, properties, procedure=None):
+    """splits measurements into time series of each observed property.
+
+    Args:
+      measurements (dict/ColumnarMeasurements): such as get_observation returns
+      properties (list): observed properties, a series is returned for each of them
+                         even if it has no sample
+      procedure (str): if specified, key of each series is (procedure, property)
+
+    Returns:
+      list: list of (key, times, values) in order of properties.
+            times are sorted, list of datetime from dict (values are as they are) or
+            datetime64[s] ndarray from ColumnarMeasurements (values are float64 ndarray).
+
+    """
+    keys = [prop if procedure is None else (procedure, prop) for prop in properties]
+    if isinstance(measurements, ColumnarMeasurements):
+        series = []
+        for key, prop in zip(keys, properties):
+            values = measurements.values.get(prop)
+            if values is None:
+                series.append((key, measurements.times[:0], np.zeros(0)))
+            else:
+                present = ~np.isnan(values)
+                series.append((key, measurements.times[present], values[present]))
+        return series
+
+    columns = dict((prop, ([], [])) for prop in properties)
+    for dt in sorted(measurements):
+        for prop, value in measurements[dt].items():
+            column = columns.get(prop)
+            if column is not None:
+                column[0].append(dt)
+                column[1].append(value['value'])
+    return [(key, columns[prop][0], columns[prop][1]) for key, prop in zip(keys, properties)]
+
+
+class AlignedTable(object):
+    """time series aligned on common time grid (wide format).
+
+    Attributes:
+      times (list/numpy.ndarray): time grid, list of datetime or datetime64[s] ndarray
+      keys (list): key of each column, such as observed property or (procedure, property)
+      columns (list): values of each column aligned with times,
+                      list (None for missing) or float64 ndarray (NaN for missing)
+
+    """
+    def __init__(self, times, keys, columns):
+        self.times = times
+        self.keys = keys
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.times)
+
+    def column(self, key):
+        return self.columns[self.keys.index(key)]
+
+    def iter_rows(self, skip_empty=False):
+        """yields rows in order of time (wide format).
+
+        Args:
+          skip_empty (bool): skip rows which have no value
+
+        Yields:
+          (datetime, list): time and values of columns, None for missing
+
+        """
+        times = self.times
+        columns = self.columns
+        if np is not None and isinstance(times, np.ndarray):
+            times = times.astype(object)
+            object_columns = []
+            for column in columns:
+                object_column = column.astype(object)
+                object_column[np.isnan(column)] = None
+                object_columns.append(object_column)
+            columns = object_columns
+        for dt, row in zip(times, zip(*columns) if columns else [()] * len(times)):
+            if skip_empty and all(value is None for value in row):
+                continue
+            yield dt, list(row)
+
+    def iter_long(self):
+        """yields (datetime, key, value) of present values in order of time (long format)."""
+        for dt, row in self.iter_rows():
+            for key, value in zip(self.keys, row):
+                if value is not None:
+                    yield dt, key, value
+
+
+def _regular_grid(start, end, step):
+    # aligned to multiples of step from EPOCH
+    step_seconds = int(step.total_seconds())
+    first = start - timedelta(seconds=int((start - EPOCH).total_seconds()) % step_seconds)
+    grid = []
+    dt = first
+    while dt <= end:
+        grid.append(dt)
+        dt += step
+    return grid
+
+
+def _align_python(times, values, grid, method, tolerance):
+    # merges sorted times into sorted grid
+    n = len(times)
+    i = 0
+    column = []
+    if method == 'exact':
+        for g in grid:
+            while i < n and times[i] < g:
+                i += 1
+            column.append(values[i] if i < n and times[i] == g else None)
+    elif method == 'ffill':
+        for g in grid:
+            while i < n and times[i] <= g:
+                i += 1
+            if i > 0 and (tolerance is None or g - times[i - 1] <= tolerance):
+                column.append(values[i - 1])
+            else:
+                column.append(None)
+    else:
+        for g in grid:
+            while i < n and times[i] < g:
+                i += 1
+            # nearest is the last before g or the first at or after g
+            j = i
+            if i == n or (i > 0 and g - times[i - 1] <= times[i] - g):
+                j = i - 1
+            if j >= 0 and (tolerance is None or abs(times[j] - g) <= tolerance):
+                column.append(values[j])
+            else:
+                column.append(None)
+    return column
+
+
+def _merge_times(arrays):
+    # union of sorted datetime64 arrays, merge sort runs on concatenated sorted runs
+    merged = np.sort(np.concatenate(arrays or [np.zeros(0, dtype='datetime64[s]')]),
+                     kind='mergesort')
+    if len(merged) == 0:
+        return merged
+    keep = np.empty(len(merged), dtype=bool)
+    keep[0] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return merged[keep]
+
+
+def _align_numpy(times, values, grid, method, tolerance):
+    n = len(times)
+    column = np.full(len(grid), np.nan)
+    if n == 0:
+        return column
+    if method == 'ffill':
+        index = np.searchsorted(times, grid, side='right') - 1
+        valid = index >= 0
+        index = np.maximum(index, 0)
+    else:
+        right = np.searchsorted(times, grid, side='left')
+        after = np.minimum(right, n - 1)
+        if method == 'exact':
+            index = after
+            valid = (right < n) & (times[after] == grid)
+        else:
+            before = np.maximum(right - 1, 0)
+            use_before = (right == n) | ((right > 0) &
+                                         (grid - times[before] <= times[after] - grid))
+            index = np.where(use_before, before, after)
+            valid = np.ones(len(grid), dtype=bool)
+    if tolerance is not None and method != 'exact':
+        valid &= np.abs(grid - times[index]) <= tolerance
+    column[valid] = values[index[valid]]
+    return column
+
+
+def align_series(series, grid=None, method='exact', tolerance=None):
+    """aligns time series (of several nodes) on common time grid.
+
+    Each series is merged into the grid in a single pass over sorted times
+    (vectorized binary search with numpy arrays), dicts are never probed.
+
+    Args:
+      series (list): list of (key, times, values) such as measurement_series returns.
+                     if all of them are ndarray, numpy is used and the result has ndarray.
+      grid (list/timedelta): time grid. None for all times in series (union),
+                             timedelta for regular grid of the step (aligned to
+                             multiples of it) from first to last time in series,
+                             or sorted list of datetime.
+      method (str): 'exact' (only value at same time),
+                    'nearest' (value at nearest time) or
+                    'ffill' (last value at or before the time)
+      tolerance (timedelta): for 'nearest' and 'ffill', values farther than this
+                             are treated as missing. None for no limit.
+
+    Returns:
+      AlignedTable
+
+    Examples:
+      series = []
+      for procedure, measurements in results.items():
+        series.extend(measurement_series(measurements, properties, procedure))
+      table = align_series(series, timedelta(minutes=10), 'ffill', timedelta(minutes=30))
+      for dt, values in table.iter_rows():
+        print(dt, values)
+
+    """
+    if method not in ('exact', 'nearest', 'ffill'):
+        raise ValueError('unknown method: %s' % (method))
+    keys = [key for (key, _, _) in series]
+    use_numpy = (np is not None and
+                 all(isinstance(times, np.ndarray) for (_, times, _) in series))
+
+    if use_numpy:
+        if grid is None:
+            grid = _merge_times([times for (_, times, _) in series])
+        elif isinstance(grid, timedelta):
+            present = [times for (_, times, _) in series if len(times)]
+            if present:
+                grid = np.array(_regular_grid(min(times[0] for times in present).astype(object),
+                                              max(times[-1] for times in present).astype(object),
+                                              grid), dtype='datetime64[s]')
+            else:
+                grid = np.zeros(0, dtype='datetime64[s]')
+        else:
+            grid = np.asarray(grid, dtype='datetime64[s]')
+        if tolerance is not None:
+            tolerance = np.timedelta64(int(tolerance.total_seconds()), 's')
+        columns = [_align_numpy(times, values, grid, method, tolerance)
+                   for (_, times, values) in series]
+        return AlignedTable(grid, keys, columns)
+
+    if np is not None:
+        # mixed with columnar ones
+        converted = []
+        for (key, times, values) in series:
+            if isinstance(times, np.ndarray):
+                times = times.astype(object).tolist()
+                values = [None if value != value else value for value in values.tolist()]
+            converted.append((key, times, values))
+        series = converted
+    if grid is None:
+        # sorting set of times runs in C, faster than merging them in python
+        grid = sorted(set().union(*[times for (_, times, _) in series]))
+    elif isinstance(grid, timedelta):
+        present = [times for (_, times, _) in series if times]
+        grid = _regular_grid(min(times[0] for times in present),
+                             max(times[-1] for times in present), grid) if present else []
+    else:
+        grid = list(grid)
+    columns = [_align_python(times, values, grid, method, tolerance)
+               for (_, times, values) in series]
+    return AlignedTable(grid, keys, columns)
+
+
+class WindowAggregator(object):
+    """streaming aggregation of samples in tumbling or sliding time windows.
+
+    Windows start at multiples of step from EPOCH and are size long.
+    Only accumulators of open windows are kept, a window is closed when a sample
+    of same key at or after its end arrives, so samples of each key must arrive
+    in order of time (as SOS responses list them). Samples arriving after their
+    windows were closed are dropped and counted in late.
+    If time_range is specified, windows which are not entirely in it, such as
+    sliding windows starting before it, are not made (they would be partial).
+
+    Args:
+      size (timedelta): length of a window
+      step (timedelta): interval of window starts. None for tumbling windows (same as
+                        size), shorter than size for sliding windows.
+      functions (list): aggregate functions, 'mean', 'min', 'max', 'count' and 'last'
+      time_range (list): has 2 datetime object, start time and end time of samples
+
+    Attributes:
+      late (int): number of samples dropped from closed windows
+
+    Examples:
+      aggregator = WindowAggregator(timedelta(hours=1), functions=['mean', 'max'])
+      for dt, prop, value in samples:
+        for window in aggregator.add(dt, prop, value):
+          print(window)
+      for window in aggregator.flush():
+        print(window)
+
+    """
+    FUNCTIONS = ('mean', 'min', 'max', 'count', 'last')
+
+    def __init__(self, size, step=None, functions=('mean',), time_range=None):
+        for function in functions:
+            if function not in self.FUNCTIONS:
+                raise ValueError('unknown aggregate function: %s' % (function))
+        self.size = int(size.total_seconds())
+        self.step = int((step or size).total_seconds())
+        if self.size <= 0 or self.step <= 0:
+            raise ValueError('size and step of window must be positive seconds')
+        self.functions = list(functions)
+        self.late = 0
+        # first and last start of windows
+        self._first = self._last = None
+        if time_range is not None and len(time_range) == 2:
+            self._first = (time_range[0] - EPOCH).total_seconds()
+            self._last = (time_range[1] - EPOCH).total_seconds() - self.size
+        # key -> {start: [count, sum, min, max, time of last, last]}
+        self._windows = {}
+        # key -> latest time (seconds) of samples
+        self._watermarks = {}
+
+    def add(self, dt, key, value):
+        """adds a sample.
+
+        Args:
+          dt (datetime): time of the sample
+          key (object): key of the series, such as observed property
+          value (float): value of the sample
+
+        Returns:
+          list: windows closed by the sample, (key, start datetime, results dict)
+                results has aggregate function as key.
+
+        """
+        t = (dt - EPOCH).total_seconds()
+        windows = self._windows.get(key)
+        if windows is None:
+            windows = self._windows[key] = {}
+        watermark = self._watermarks.get(key)
+        closed = []
+        if watermark is None or t > watermark:
+            self._watermarks[key] = watermark = t
+            if windows:
+                closed = self._close(key, windows, watermark)
+
+        start = int(t // self.step) * self.step
+        dropped = False
+        while start + self.size > t:
+            if self._first is not None and not (self._first <= start <= self._last):
+                start -= self.step
+                continue
+            window = windows.get(start)
+            if window is not None:
+                window[0] += 1
+                window[1] += value
+                if value < window[2]:
+                    window[2] = value
+                if value > window[3]:
+                    window[3] = value
+                if t >= window[4]:
+                    window[4] = t
+                    window[5] = value
+            elif start + self.size > watermark:
+                windows[start] = [1, value, value, value, t, value]
+            else:
+                dropped = True
+            start -= self.step
+        if dropped:
+            self.late += 1
+        return closed
+
+    def _close(self, key, windows, watermark):
+        ended = sorted(start for start in windows if start + self.size <= watermark)
+        return [self._result(key, start, windows.pop(start)) for start in ended]
+
+    def _result(self, key, start, window):
+        (count, total, minimum, maximum, _, last) = window
+        values = {'mean' : total / count, 'min' : minimum, 'max' : maximum,
+                  'count' : count, 'last' : last}
+        return (key, EPOCH + timedelta(seconds=start),
+                dict((function, values[function]) for function in self.functions))
+
+    def flush(self):
+        """closes all open windows and returns them, in order of key and start."""
+        closed = []
+        for key, windows in self._windows.items():
+            closed.extend(self._result(key, start, windows[start]) for start in sorted(windows))
+        self._windows = {}
+        return closed
+
+
+def aggregate_observations(observations, size, step=None, functions=('mean',),
+                           time_range=None):
+    """aggregates observation stream in time windows in a single pass.
+
+    Samples dropped as they arrived after their windows were closed are reported
+    after the last window.
+
+    Args:
+      observations (iterable): (datetime, property, value dict) such as iter_observation
+                               yields. values which are not number are ignored.
+      size (timedelta): length of a window
+      step (timedelta): interval of window starts, None for tumbling windows
+      functions (list): aggregate functions, 'mean', 'min', 'max', 'count' and 'last'
+      time_range (list): time range of observations, windows not entirely in it
+                         are not yielded
+
+    Yields:
+      (str, datetime, dict): observed property, start of window and results which has
+                             aggregate function as key, as windows are closed.
+
+    """
+    aggregator = WindowAggregator(size, step, functions, time_range)
+    for dt, prop, value in observations:
+        value = _to_float(value['value'])
+        if value is None:
+            continue
+        for window in aggregator.add(dt, prop, value):
+            yield window
+    for window in aggregator.flush():
+        yield window
+    if aggregator.late:
+        print('%d samples arrived out of order and were dropped' % (aggregator.late))
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ParquetSink(object):
+    """writes measurements to Parquet file as they arrive (requires pyarrow).
+
+    Each sample is a row of timestamp, procedure, property, value (float, null if
+    not a number) and uom. Rows are buffered until row_group_size of them arrive,
+    then written as a row group, so whole data is never held in memory.
+
+    Args:
+      path (str): path of Parquet file
+      row_group_size (int): number of rows in a row group
+      compression (str): compression codec, 'snappy', 'gzip', 'zstd' or 'none'
+
+    Attributes:
+      rows (int): number of rows written (including buffered ones)
+      row_groups (int): number of row groups written
+
+    Examples:
+      with ParquetSink('measurements.parquet') as sink:
+        for procedure, measurements, error in server.iter_many(get, offerings):
+          sink.write(procedure, measurements)
+
+    """
+    def __init__(self, path, row_group_size=65536, compression='snappy'):
+        if pyarrow is None:
+            raise ImportError('pyarrow is required for ParquetSink')
+        self.path = path
+        self.row_group_size = row_group_size
+        self.schema = pyarrow.schema([('timestamp', pyarrow.timestamp('s')),
+                                      ('procedure', pyarrow.string()),
+                                      ('property', pyarrow.string()),
+                                      ('value', pyarrow.float64()),
+                                      ('uom', pyarrow.string())])
+        self.rows = 0
+        self.row_groups = 0
+        self._batches = []
+        self._buffered = 0
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema,
+                                                     compression=compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, procedure, measurements):
+        """appends measurements of procedure.
+
+        Args:
+          procedure (str): procedure (sensor node) of measurements
+          measurements (dict/ColumnarMeasurements): get_observation/get_result returns
+
+        """
+        if isinstance(measurements, ColumnarMeasurements):
+            for prop, values in measurements.values.items():
+                present = ~np.isnan(values)
+                count = int(np.count_nonzero(present))
+                self._append(count, [measurements.times[present],
+                                     [procedure] * count, [prop] * count, values[present],
+                                     [measurements.uoms.get(prop)] * count])
+            return
+
+        columns = ([], [], [], [], [])
+        (times, procedures, props, values, uoms) = columns
+        for dt, measure in sorted(measurements.items()):
+            for prop, value in measure.items():
+                times.append(dt)
+                props.append(prop)
+                values.append(_to_float(value['value']))
+                uoms.append(value.get('uom'))
+        procedures.extend([procedure] * len(times))
+        self._append(len(times), columns)
+
+    def write_file(self, path):
+        """appends rows of a Parquet file written by ParquetSink, a row group at a time.
+
+        Args:
+          path (str): path of the Parquet file
+
+        """
+        source = pyarrow.parquet.ParquetFile(path)
+        for i in range(source.num_row_groups):
+            # Parquet has no timestamp in seconds, it is read in milliseconds
+            for batch in source.read_row_group(i).cast(self.schema).to_batches():
+                self._append_batch(batch)
+
+    def _append(self, count, columns):
+        if count == 0:
+            return
+        arrays = [pyarrow.array(column, type=field.type)
+                  for column, field in zip(columns, self.schema)]
+        self._append_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def _append_batch(self, batch):
+        if batch.num_rows == 0:
+            return
+        self._batches.append(batch)
+        self._buffered += batch.num_rows
+        self.rows += batch.num_rows
+        if self._buffered >= self.row_group_size:
+            self._write_row_groups(False)
+
+    def _write_row_groups(self, all_rows):
+        table = pyarrow.Table.from_batches(self._batches, schema=self.schema)
+        offset = 0
+        while (table.num_rows - offset >= self.row_group_size or
+               (all_rows and offset < table.num_rows)):
+            self._writer.write_table(table.slice(offset, self.row_group_size),
+                                     row_group_size=self.row_group_size)
+            offset += self.row_group_size
+            self.row_groups += 1
+        rest = table.slice(offset)
+        self._batches = rest.to_batches()
+        self._buffered = rest.num_rows
+
+    def flush(self):
+        """writes buffered rows as a row group."""
+        if self._buffered:
+            self._write_row_groups(True)
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+            self._writer = None
+
+
 def parse_observed_area(observed_area, namespaces):
     envelope = observed_area.find(get_cn_tag('gml:Envelope', namespaces))
     lc = envelope.find(get_cn_tag('gml:lowerCorner', namespaces))
@@ -159,25 +1076,37 @@ def parse_phenomenon_time(phenomenon_time, namespaces):
     return (begin.text, end.text) if (begin is not None and end is not None) else ('', '')
 
 
-def parse_offering(offering, namespaces):
-    observation_offering = offering.find(get_cn_tag('sos:ObservationOffering', namespaces))
-    observation = Observation()
-    observation.properties = []
-    observation.location = ('', '')
-    observation.time_range = ('', '')
+def parse_offering(offering, namespaces, extents=None):
+    if extents is None:
+        extents = _Extents()
+    local_names = extents.local_names
+    for observation_offering in offering:
+        if (local_names.get(observation_offering.tag) or
+            extents.local_name(observation_offering.tag)) == 'ObservationOffering':
+            break
+    else:
+        observation_offering = ()
+    observation = Observation(extents)
+    properties = []
+    # lowerCorner, upperCorner, beginPosition and endPosition
+    positions = {}
     for child in observation_offering:
-        if child.tag.endswith('}description'):
+        tag = local_names.get(child.tag) or extents.local_name(child.tag)
+        if tag == 'observableProperty':
+            properties.append(child.text)
+        elif tag == 'description':
             observation.description = child.text
-        elif child.tag.endswith('}name'):
+        elif tag == 'name':
             observation.name = child.text
-        elif child.tag.endswith('}procedure'):
+        elif tag == 'procedure':
             observation.procedure = child.text
-        elif child.tag.endswith('}observableProperty'):
-            observation.properties.append(child.text)
-        elif child.tag.endswith('}observedArea'):
-            observation.location = parse_observed_area(child, namespaces)
-        elif child.tag.endswith('}phenomenonTime'):
-            observation.time_range = parse_phenomenon_time(child, namespaces)
+        elif tag == 'observedArea' or tag == 'phenomenonTime':
+            for elem in child.iter():
+                positions[local_names.get(elem.tag) or extents.local_name(elem.tag)] = elem.text
+    observation.properties = properties
+    observation._set_extent(
+        (positions.get('lowerCorner', ''), positions.get('upperCorner', '')),
+        (positions.get('beginPosition', ''), positions.get('endPosition', '')))
     return observation
 
 
@@ -213,15 +1142,33 @@ def parse_provider(provider_, namespaces):
     return provider
 
 
-def parse_observation(observation, namespaces):
-    time = observation.find(get_cn_tag('om:phenomenonTime/gml:TimeInstant/gml:timePosition',
-                                       namespaces)).text
-    dt = parse_iso8601_datetime(time)
-    result = observation.find(get_cn_tag('om:result', namespaces))
-    return (dt, observation.find(get_cn_tag('om:observedProperty',
-                                            namespaces)).text.strip('"'),
+def _observation_paths(namespaces):
+    # XPaths of time, observed property and result in om:OM_Observation
+    return (get_cn_tag('om:phenomenonTime/gml:TimeInstant/gml:timePosition', namespaces),
+            get_cn_tag('om:observedProperty', namespaces),
+            get_cn_tag('om:result', namespaces))
+
+
+def _with_paths(elements):
+    # adds XPaths to (Element, dict), converted once per response
+    # unless the response declares namespaces on the way
+    current = paths = None
+    size = 0
+    for elem, namespaces in elements:
+        if namespaces is not current or len(namespaces) != size:
+            current = namespaces
+            size = len(namespaces)
+            paths = _observation_paths(namespaces)
+        yield elem, namespaces, paths
+
+
+def parse_observation(observation, namespaces, paths=None):
+    (time_path, property_path, result_path) = paths or _observation_paths(namespaces)
+    dt = parse_iso8601_datetime(observation.find(time_path).text)
+    result = observation.find(result_path)
+    return (dt, observation.find(property_path).text.strip('"'),
             dict(value=float(result.text),
-                 uom=HTMLParser().unescape(result.attrib['uom'])))
+                 uom=_intern(unescape(result.attrib['uom']))))
 
 
 def parse_operations(operations_root, namespaces):
@@ -367,223 +1314,2155 @@ def build_insert_observation_request(procedure, measurements, namespaces):
     
     return root
 
-def build_describe_sensor_request(procedure, namespaces):
-    attrib = copy.deepcopy(namespaces)
-    attrib['service'] = 'SOS'
-    attrib['version'] = '2.0.0'
-    root = Element('swes:DescribeSensor', attrib)
-    SubElement(root, 'procedure').text = procedure
-    SubElement(root, 'procedureDescriptionFormat').text = 'http://www.opengis.net/sensorml/1.0.1'
-    return root
 
+# Request XML is rendered from templates, which are cut out of the XML
+# the build_* functions make with marks in place of the values,
+# so that the output is same as tostring(build_*(...), 'utf-8').
+_TEMPLATE_MARK = '\x00%s\x00'
+_TEMPLATE_TIMES = (datetime(1900, 1, 1), datetime(1900, 1, 2))
+_templates = {}
+_templates_lock = threading.Lock()
 
-def call_ogc_api(url, req_body, token=None, token_param=None, verbose=False):
-    """call ogc API
+# same escaping as ElementTree serializer does
+_ATTRIB_ENTITIES = {'"' : '&quot;', '\r' : '&#13;', '\n' : '&#10;', '\t' : '&#09;'}
 
-    Args:
-      url (str): URL of API, including Token in parameter.
-      req_body (str): request body, XML string
 
-    Returns:
-      (Element, dict): 1st returned Element is a response body XML tree.
-                       2nd returned dict is namespace dictionary from response.
+def _escape_cdata(text):
+    return escape(text)
 
-    """
-    if debug or verbose:
-        print(req_body)
 
-    if type(req_body) == bytes:
-        pass
-    else:
-        req_body = req_body.encode('utf-8')
+def _escape_attrib(text):
+    return escape(text, _ATTRIB_ENTITIES)
 
-    headers = {'content-type' : 'application/xml; charset="utf-8"'}
-    if 'header' in url:
-        headers.update(url['header'])
-    req = Request(url['url'],
-                  req_body,
-                  headers)
-    try:
-        resp = urlopen(req)
-    except HTTPError as e:
-        print(e.code, e.reason)
-        print(e.read())
-        raise
-        return '<HTTPError><Code>{}</Code><Reason>{}</Reason></HTTPError>' \
-            .format(e.code, e.reason), None
-        
-    resp_body = resp.read()
 
-    if debug or verbose:
-        print(resp_body)
+def _mark(name):
+    return _TEMPLATE_MARK % (name)
 
-    try:
-        namespaces = get_namespaces(StringIO(resp_body.decode('utf-8')))
-        return fromstring(resp_body), namespaces
-    except ParseError:
-        # some response seems to be illegal.
-        return resp_body, None
 
+def _compile_template(xml):
+    """splits XML with marks into list of literal str and field name alternately."""
+    for i, dt in enumerate(_TEMPLATE_TIMES):
+        xml = xml.replace(dt.strftime(ISO8601_JST), _mark('time%d' % (i)))
+    return re.split('\x00(\\w+)\x00', xml)
 
-def get_capabilities(url):
-    """execute GetCapabilities operation.
 
-    Args:
-      url (str): URL of API, including Token in parameter.
+def _render_template(parts, fields):
+    chunks = [parts[0]]
+    for i in range(1, len(parts), 2):
+        chunks.append(fields[parts[i]])
+        chunks.append(parts[i + 1])
+    return ''.join(chunks)
 
-    Returns:
-      (Server, Provider, list of Operation (str), list of Filter (str), list of Observation)
 
-    Examples:
-      (server, provider, operations, filters, observations) = \
-            get_capabilities('https://sos.foo.com/api?Key=xxxxxx')
+def _get_template(key, namespaces, build):
+    """returns cached template for key, build(namespaces) makes its XML (str).
+
+    namespaces None means default_ogc_namespaces().
 
     """
-    req = build_get_capabitilies_request(default_ogc_namespaces())
-    (resp_root, namespaces) = call_ogc_api(url, tostring(req, 'utf-8'))
+    ns_key = None if namespaces is None else tuple(sorted(namespaces.items()))
+    template = _templates.get((key, ns_key))
+    if template is None:
+        if namespaces is None:
+            namespaces = default_ogc_namespaces()
+        template = _compile_template(build(namespaces))
+        with _templates_lock:
+            _templates[(key, ns_key)] = template
+    return template
+
+
+def _get_insert_observation_template(namespaces):
+    """returns (head, observation, tail) templates of InsertObservation request."""
+    def build(namespaces):
+        value = {'value' : _mark('value'), 'uom' : _mark('uom')}
+        root = build_insert_observation_request(_mark('procedure'),
+                                                {_TEMPLATE_TIMES[0] : {_mark('property') : value}},
+                                                namespaces)
+        return tostring(root, 'utf-8').decode('utf-8')
+
+    parts = _get_template(('InsertObservation',), namespaces, build)
+    # the observation is in the middle literal, between the two procedure fields
+    head_end = parts[2].index('<sos:observation>')
+    tail_start = parts[-1].rindex('</sos:InsertObservation>')
+    head = parts[:2] + [parts[2][:head_end]]
+    observation = [parts[2][head_end:]] + parts[3:-1] + [parts[-1][:tail_start]]
+    return head, observation, parts[-1][tail_start:]
+
+
+def iter_insert_observation_body(procedure, measurements, namespaces=None, chunk_size=65536):
+    """writes request XML for InsertObservation without building XML tree.
+
+    The output is same as tostring(build_insert_observation_request(...), 'utf-8').
 
-    server = parse_service(resp_root.find(get_cn_tag('ows:ServiceIdentification', namespaces)),
-                           namespaces)
+    Args:
+      procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
+      measurements (dict/iterable): measurements dict such as
+                                    build_insert_observation_request takes, or
+                                    (datetime, property, value) tuples.
+      namespaces (dict): has qname as key and URI as value, represents namespaces for XML
+                         None for default_ogc_namespaces()
+      chunk_size (int): approximate size of each chunk
 
-    provider = parse_provider(resp_root.find(get_cn_tag('ows:ServiceProvider', namespaces)),
-                              namespaces)
+    Yields:
+      bytes: chunks of request body
 
-    operations = parse_operations(resp_root.find(get_cn_tag('ows:OperationsMetadata', namespaces)),
-                                  namespaces)
+    """
+    if isinstance(measurements, dict):
+        measurements = iter_measurements(measurements)
+    (head, parts, tail) = _get_insert_observation_template(namespaces)
 
-    filters = []
-    #filters = resp_root.find(get_cn_tag('sos:filterCapabilities', namespaces))
-    #self.filters = self.parse_filters(filters, namespaces)
+    fields = {'procedure' : _escape_cdata(procedure)}
+    yield _render_template(head, fields).encode('utf-8')
 
-    offerings = resp_root.findall(get_cn_tag('sos:contents/sos:Contents/swes:offering',
-                                             namespaces))
-    observations = []
-    for offering in offerings:
-        observations.append(parse_offering(offering, namespaces))
+    chunk = []
+    size = 0
+    prev_dt = None
+    for (dt, prop, value) in measurements:
+        if dt != prev_dt:
+            fields['time0'] = dt.strftime(ISO8601_JST)
+            prev_dt = dt
+        fields['property'] = _escape_cdata(prop)
+        fields['uom'] = _escape_attrib(value['uom'])
+        text = value['value']
+        fields['value'] = _escape_cdata(text if isinstance(text, str) else str(text))
+        part = _render_template(parts, fields)
+        chunk.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+            size = 0
+
+    chunk.append(tail)
+    yield ''.join(chunk).encode('utf-8')
 
-    return server, provider, operations, filters, observations
 
+def build_describe_sensor_request(procedure, namespaces):
+    attrib = copy.deepcopy(namespaces)
+    attrib['service'] = 'SOS'
+    attrib['version'] = '2.0.0'
+    root = Element('swes:DescribeSensor', attrib)
+    SubElement(root, 'procedure').text = procedure
+    SubElement(root, 'procedureDescriptionFormat').text = 'http://www.opengis.net/sensorml/1.0.1'
+    return root
 
-def get_observation(url, procedure, properties, time_range):
-    """execute GetObservation operation.
+
+def _render_get_data_request(procedure, properties, time_range, operation, namespaces):
+    n_times = len(time_range) if len(time_range) in (1, 2) else 0
+
+    def build(namespaces):
+        root = _build_get_data_request(_mark('procedure'),
+                                       [_mark('property%d' % (i)) for i in range(len(properties))],
+                                       _TEMPLATE_TIMES[:n_times], operation, namespaces)
+        return tostring(root, 'utf-8').decode('utf-8')
+
+    parts = _get_template((operation, len(properties), n_times), namespaces, build)
+    fields = {'procedure' : _escape_cdata(procedure)}
+    for i, prop in enumerate(properties):
+        fields['property%d' % (i)] = _escape_cdata(prop)
+    for i in range(n_times):
+        fields['time%d' % (i)] = time_range[i].strftime(ISO8601_JST)
+    return _render_template(parts, fields).encode('utf-8')
+
+
+def render_get_observation_request(procedure, properties, time_range, namespaces=None):
+    """renders request XML for GetObservation from cached template.
+
+    The output is same as tostring(build_get_observation_request(...), 'utf-8').
 
     Args:
-      url (str): URL of API, including Token in parameter.
       procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
       properties (list): list of observed properties. (str) ex. 'air_temperature'
       time_range (list): has 2 datetime object, start time and end time.
+      namespaces (dict): has qname as key and URI as value, represents namespaces for XML
+                         None for default_ogc_namespaces()
 
     Returns:
-      dict: has datetime object as key and result (dict) as value.
-            result (dict) has observed property as key and value (dict) as value.
-            value (dict) has 'value' (value)  and 'uom' (unit name)
+      bytes: request XML
 
-    Examples:
-      measurements = get_observation('https://sos.foo.com/api?Key=xxxxxx',
-                                 'TEST:Field:SensorNodeName',
-                                 ['air_temperature', 'relative_humidity'],
-                                 [datetime(2017, 1, 1, 0, 0, 0), datetime(2017, 1, 1, 0, 5, 0)])
     """
-    req = build_get_observation_request(procedure, properties, time_range,
-                                        default_ogc_namespaces())
-    (resp_root, namespaces) = call_ogc_api(url, tostring(req, 'utf-8'))
-    exception = resp_root.find(get_cn_tag(':Exception', namespaces))
-    if exception is not None:
-        print('Exception: {}'.format(exception.attrib['exceptionCode']))
-        return {}
-
-    observations = resp_root.findall(get_cn_tag('sos:observationData/om:OM_Observation',
-                                                namespaces))
-    measurements = {}
-    for observation in observations:
-        (dt, prop, value) = parse_observation(observation, namespaces)
-        if dt not in measurements:
-            measurements[dt] = {}
-        measurements[dt][prop] = value
+    return _render_get_data_request(procedure, properties, time_range,
+                                    'GetObservation', namespaces)
 
-    return measurements
 
+def render_get_result_request(procedure, properties, time_range, namespaces=None):
+    """renders request XML for GetResult from cached template.
 
-def get_result(url, procedure, properties, time_range):
-    """execute GetResult operation.
+    The output is same as tostring(build_get_result_request(...), 'utf-8').
 
     Args:
-      url (str): URL of API, including Token in parameter.
       procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
       properties (list): list of observed properties. (str) ex. 'air_temperature'
       time_range (list): has 2 datetime object, start time and end time.
+      namespaces (dict): has qname as key and URI as value, represents namespaces for XML
+                         None for default_ogc_namespaces()
 
     Returns:
-      dict: has datetime object as key and result (dict) as value.
-            result (dict) has observed property as key and value (dict) as value.
-            value (dict) has 'value' (value)  and 'uom' (unit name)
-
-    Note:
-      cloudSense SOS server accepts multiple observed properties for GetResult,
-      but in the specification it is not allowed.
-
-    Examples:
-      measurements = get_result('https://sos.foo.com/api?Key=xxxxxx',
-                                'TEST:Field:SensorNodeName',
-                                ['air_temperature', 'relative_humidity'],
-                                [datetime(2017, 1, 1, 0, 0, 0), datetime(2017, 1, 1, 0, 5, 0)])
+      bytes: request XML
 
     """
-    req = build_get_result_request(procedure, properties, time_range,
-                                   default_ogc_namespaces())
-    (resp_root, namespaces) = call_ogc_api(url, tostring(req, 'utf-8'))
-    exception = resp_root.find(get_cn_tag(':Exception', namespaces))
-    if exception is not None:
-        print('Exception: {}'.format(exception.attrib['exceptionCode']))
-        return {}
+    return _render_get_data_request(procedure, properties, time_range,
+                                    'GetResult', namespaces)
 
-    results = resp_root.find(get_cn_tag('sos:resultValues',
-                                        namespaces)).text.strip().split('\n')
 
-    measurements = {}
-    prop_idx = 0
-    prev_dt = None
-    for l in results:
-        elem = l.split(',')
-        if len(elem) == 2:
-            dt = parse_iso8601_datetime(elem[0])
-            value = {'value' : float(elem[1]), 'uom' : ''}
+def render_get_capabilities_request(namespaces=None):
+    """renders request XML for GetCapabilities from cached template.
 
-            if prev_dt and dt <= prev_dt:
-                # next prop
-                prop_idx += 1
+    Args:
+      namespaces (dict): has qname as key and URI as value, represents namespaces for XML
+                         None for default_ogc_namespaces()
 
-            prop = properties[prop_idx]
-            if dt not in measurements:
-                measurements[dt] = {}
-            measurements[dt][prop] = value
-            prev_dt = dt
+    Returns:
+      bytes: request XML
 
+    """
+    def build(namespaces):
+        return tostring(build_get_capabitilies_request(namespaces), 'utf-8').decode('utf-8')
+
+    return _render_template(_get_template(('GetCapabilities',), namespaces, build),
+                            {}).encode('utf-8')
+
+
+def render_describe_sensor_request(procedure, namespaces=None):
+    """renders request XML for DescribeSensor from cached template.
+
+    Args:
+      procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
+      namespaces (dict): has qname as key and URI as value, represents namespaces for XML
+                         None for default_ogc_namespaces()
+
+    Returns:
+      bytes: request XML
+
+    """
+    def build(namespaces):
+        root = build_describe_sensor_request(_mark('procedure'), namespaces)
+        return tostring(root, 'utf-8').decode('utf-8')
+
+    return _render_template(_get_template(('DescribeSensor',), namespaces, build),
+                            {'procedure' : _escape_cdata(procedure)}).encode('utf-8')
+
+
+class PooledResponse(object):
+    """a response read from a connection of ConnectionPool.
+
+    The connection goes back to the pool when the body has been read to the end,
+    or it is closed when the response is closed before that.
+
+    """
+    def __init__(self, pool, key, conn, resp):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.resp = resp
+        self.code = resp.status
+        self.reason = resp.reason
+        self.headers = resp.msg
+
+    def read(self, amt=None):
+        if self.conn is None:
+            return b''
+        data = self.resp.read() if amt is None else self.resp.read(amt)
+        if amt is None or not data:
+            self.close()
+        return data
+
+    def close(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        if self.resp.isclosed() and not self.resp.will_close:
+            # whole body has been read, the connection can be used again
+            self.pool.put_connection(self.key, conn)
+        else:
+            self.resp.close()
+            conn.close()
+
+
+class ConnectionPool(object):
+    """a pool of persistent HTTP/1.1 (keep-alive) connections per host.
+
+    Args:
+      maxsize (int): max number of idle connections kept for each host
+      idle_timeout (float): idle connections older than this (seconds) are not reused
+      timeout (float): socket timeout (seconds) of connections, None for default
+
+    Attributes:
+      hits (int): number of requests sent on a reused connection
+      misses (int): number of requests which needed a new connection
+
+    Examples:
+      pool = ConnectionPool(maxsize=4)
+      resp = pool.urlopen('https://sos.foo.com/api?Key=xxxxxx', req_body, headers)
+      resp_body = resp.read()
+
+    """
+    def __init__(self, maxsize=10, idle_timeout=60.0, timeout=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        conn_class = HTTPSConnection if scheme == 'https' else HTTPConnection
+        if self.timeout is None:
+            return conn_class(host, port)
+        return conn_class(host, port, timeout=self.timeout)
+
+    def get_connection(self, key, reuse=True):
+        """returns (connection, True if it is reused) for the host key."""
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key) if reuse else None
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    self.hits += 1
+                    return conn, True
+                conn.close()
+            self.misses += 1
+        return self._new_connection(key), False
+
+    def put_connection(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def clear(self):
+        """closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def urlopen(self, url, body, headers, timeout=None, record=None):
+        """sends POST request on a pooled connection.
+
+        Args:
+          url (str): URL of API
+          body (bytes/iterable): request body, iterable of bytes is sent
+                                 with chunked transfer encoding.
+          headers (dict): request headers
+          timeout (float): socket timeout (seconds) for this request,
+                           None for timeout of the pool
+          record (OperationRecord): records time of phases if specified
+
+        Returns:
+          PooledResponse: response, its connection goes back to the pool after reading it.
+
+        Raises:
+          HTTPError: when the server responds with error status.
+
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        # streamed body cannot be sent again when a reused connection turns out to be closed
+        replayable = isinstance(body, bytes)
+        if timeout is None:
+            timeout = self.timeout if self.timeout is not None else socket.getdefaulttimeout()
+        while True:
+            conn, reused = self.get_connection(key, replayable)
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                if record is None:
+                    conn.request('POST', path, body, headers)
+                    resp = conn.getresponse()
+                    break
+                if conn.sock is None:
+                    with record.phase('connect'):
+                        conn.connect()
+                with record.phase('send'):
+                    conn.request('POST', path, body, headers)
+                with record.phase('wait'):
+                    resp = conn.getresponse()
+                break
+            except (HTTPException, socket.error):
+                conn.close()
+                if not reused:
+                    raise
+                # the server has closed the idle connection, try again with another one
+
+        presp = PooledResponse(self, key, conn, resp)
+        if resp.status >= 400:
+            raise HTTPError(url, resp.status, resp.reason, resp.msg, presp)
+        return presp
+
+
+class CircuitOpenError(Exception):
+    """raised instead of sending a request while CircuitBreaker is open."""
+    pass
+
+
+class ExceptionReportError(Exception):
+    """raised for ows:Exception in GetObservation/GetResult response,
+       if 'strict' in url dict is True. Otherwise it is printed and
+       the response is treated as no measurements.
+
+    Attributes:
+      code (str): exceptionCode of ows:Exception
+
+    """
+    def __init__(self, code):
+        Exception.__init__(self, 'Exception: {}'.format(code))
+        self.code = code
+
+
+class RetryPolicy(object):
+    """retry of idempotent requests with jittered exponential backoff.
+
+    A request is retried when it failed with connection error, timeout or
+    HTTP status in retry_statuses. n-th retry waits random time
+    between 0 and min(max_backoff, backoff * 2 ** (n - 1)) seconds.
+
+    Args:
+      max_attempts (int): max number of attempts including the first one
+      backoff (float): base of backoff time (seconds)
+      max_backoff (float): max backoff time (seconds)
+      retry_statuses (tuple): HTTP status codes to be retried
+
+    Attributes:
+      retries (int): number of retries
+      backoff_time (float): total seconds spent waiting for retries
+
+    """
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=10.0,
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+        self.retries = 0
+        self.backoff_time = 0.0
+        self._lock = threading.Lock()
+
+    def is_retriable(self, error):
+        if isinstance(error, HTTPError):
+            return error.code in self.retry_statuses
+        return isinstance(error, (URLError, HTTPException, socket.error, socket.timeout))
+
+    def delay(self, attempt):
+        """returns seconds to wait before retry after attempt (0 for the first one)."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def record_retry(self, delay):
+        with self._lock:
+            self.retries += 1
+            self.backoff_time += delay
+
+
+class CircuitBreaker(object):
+    """fails requests to an endpoint fast while it keeps failing.
+
+    After failure_threshold consecutive failures the circuit opens and requests
+    raise CircuitOpenError without being sent. After reset_timeout seconds
+    one request is let through, the circuit closes if it succeeds, or opens again.
+    HTTP errors other than 5xx are responses of healthy server and are counted
+    as successes.
+
+    Args:
+      failure_threshold (int): number of consecutive failures to open the circuit
+      reset_timeout (float): seconds until a request is tried again
+
+    Attributes:
+      trips (int): number of times the circuit opened
+      rejected (int): number of requests failed fast while the circuit is open
+
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trips = 0
+        self.rejected = 0
+        self._failures = 0
+        self._opened = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened is not None
+
+    def before_request(self):
+        """raises CircuitOpenError if the request should not be sent."""
+        with self._lock:
+            if self._opened is None:
+                return
+            if not self._trial and time.time() - self._opened >= self.reset_timeout:
+                # half open, let this request through
+                self._trial = True
+                return
+            self.rejected += 1
+            opened = self._opened
+            failures = self._failures
+        raise CircuitOpenError('circuit is open for %.1f seconds after %d failures' %
+                               (time.time() - opened, failures))
+
+    def is_failure(self, error):
+        if isinstance(error, HTTPError):
+            return error.code >= 500
+        return isinstance(error, (URLError, HTTPException, socket.error, socket.timeout))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._opened is None and
+                               self._failures >= self.failure_threshold):
+                if self._opened is None:
+                    self.trips += 1
+                self._opened = time.time()
+                self._trial = False
+
+
+def _with_retry(url, idempotent, send):
+    """calls send() with RetryPolicy (if idempotent) and CircuitBreaker in url."""
+    policy = url.get('retry') if idempotent else None
+    breaker = url.get('breaker')
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            result = send()
+        except Exception as e:
+            if breaker is not None:
+                if breaker.is_failure(e):
+                    breaker.record_failure()
+                else:
+                    # the server responded (e.g. 4xx), it is not down
+                    breaker.record_success()
+            if (policy is None or attempt + 1 >= policy.max_attempts or
+                not policy.is_retriable(e)):
+                raise
+            delay = policy.delay(attempt)
+            policy.record_retry(delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+class TransferMetrics(object):
+    """counts bytes on wire and time for compression of requests and responses.
+
+    Attributes:
+      requests (int): number of requests
+      bytes_sent (int): bytes of request bodies sent, after compression
+      bytes_received (int): bytes of response bodies received, before decompression
+      bytes_decoded (int): bytes of response bodies after decompression
+      encode_time (float): seconds spent compressing request bodies
+      decode_time (float): seconds spent decompressing response bodies
+
+    """
+    def __init__(self):
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.encode_time = 0.0
+        self.decode_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    @property
+    def compression_ratio(self):
+        """bytes received on wire per decoded byte, 1.0 for no compression."""
+        if not self.bytes_decoded:
+            return 1.0
+        return float(self.bytes_received) / self.bytes_decoded
+
+
+class _PhaseTimer(object):
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.begin = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record.add_time(self.name, _clock() - self.begin)
+        return False
+
+
+class _NullPhaseTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_PHASE = _NullPhaseTimer()
+
+
+def _phase(url, name):
+    """returns context manager which adds its time to the phase of url['record']."""
+    record = url.get('record')
+    return record.phase(name) if record is not None else _NULL_PHASE
+
+
+class OperationRecord(object):
+    """timings and sizes of an operation (a request), passed to instrumentation hooks.
+
+    Phases are:
+      'build': rendering request XML
+      'serialize': making request body bytes (InsertObservation)
+      'connect': opening new connection
+      'send': sending request
+      'wait': waiting for response header (time to first byte)
+      'download': reading response body
+      'parse': parsing response XML, namespace definitions are read in same pass
+      'convert': converting parsed XML into measurements or objects
+
+    Attributes:
+      operation (str): operation name, ex. 'GetObservation'
+      procedure (str): procedure of the operation, None for GetCapabilities
+      started (float): time the operation started (seconds since the epoch)
+      elapsed (float): seconds the operation took
+      phases (dict): has phase name as key and seconds as value
+      requests (int): number of requests sent, more than 1 if retried
+      bytes_sent (int): bytes of request bodies sent, after compression
+      bytes_received (int): bytes of response bodies received, before decompression
+      bytes_decoded (int): bytes of response bodies after decompression
+      encode_time (float): seconds spent compressing request bodies
+      decode_time (float): seconds spent decompressing response bodies
+      observations (int): number of samples (or offerings for GetCapabilities)
+      error (Exception): exception raised by the operation, None if succeeded
+
+    """
+    PHASES = ('build', 'serialize', 'connect', 'send', 'wait', 'download', 'parse', 'convert')
+
+    def __init__(self, operation, procedure=None):
+        self.operation = operation
+        self.procedure = procedure
+        self.started = time.time()
+        self.elapsed = None
+        self.phases = {}
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.encode_time = 0.0
+        self.decode_time = 0.0
+        self.observations = 0
+        self.error = None
+        self._begin = _clock()
+
+    def add(self, **counts):
+        for name, count in counts.items():
+            setattr(self, name, getattr(self, name) + count)
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def phase(self, name):
+        """returns context manager which adds its time to the phase."""
+        return _PhaseTimer(self, name)
+
+    def finish(self):
+        self.elapsed = _clock() - self._begin
+
+
+class _Histogram(object):
+    # buckets grow by 2 ** (1 / STEPS) from 1 microsecond
+    STEPS = 4
+    BASE = 1e-6
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = int(math.floor(math.log(value / self.BASE, 2) * self.STEPS)) \
+                if value > self.BASE else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """returns upper bound of the bucket which has q (0.0 - 1.0) quantile."""
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.BASE * 2 ** (float(index + 1) / self.STEPS), self.max)
+        return self.max
+
+
+class HistogramAggregator(object):
+    """instrumentation hook which aggregates OperationRecord in memory.
+
+    Seconds of each phase (and 'total' for whole operation) are counted in
+    histograms with logarithmic buckets, per operation.
+
+    Examples:
+      histograms = HistogramAggregator()
+      server = SOSServer('https://sos.foo.com/api', 'XXXXXXXX', hooks=[histograms])
+      ...
+      print(histograms.report())
+
+    """
+    def __init__(self):
+        self._histograms = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            phases = list(record.phases.items()) + [('total', record.elapsed)]
+            for phase, seconds in phases:
+                key = (record.operation, phase)
+                if key not in self._histograms:
+                    self._histograms[key] = _Histogram()
+                self._histograms[key].add(seconds)
+            totals = self._totals.setdefault(record.operation,
+                                             dict(count=0, errors=0, requests=0, bytes_sent=0,
+                                                  bytes_received=0, observations=0))
+            totals['count'] += 1
+            totals['errors'] += record.error is not None
+            for name in ('requests', 'bytes_sent', 'bytes_received', 'observations'):
+                totals[name] += getattr(record, name)
+
+    def clear(self):
+        with self._lock:
+            self._histograms = {}
+            self._totals = {}
+
+    def summary(self):
+        """returns aggregated statistics.
+
+        Returns:
+          dict: has operation as key and dict as value, which has 'count', 'errors',
+                'requests', 'bytes_sent', 'bytes_received', 'observations' (totals)
+                and 'phases'. 'phases' has phase name as key and dict as value,
+                which has 'count', 'mean', 'p50', 'p90', 'p99' and 'max' in seconds.
+
+        """
+        with self._lock:
+            summary = dict((operation, dict(totals, phases={}))
+                           for operation, totals in self._totals.items())
+            for (operation, phase), histogram in self._histograms.items():
+                summary[operation]['phases'][phase] = {
+                    'count' : histogram.count,
+                    'mean'  : histogram.sum / histogram.count,
+                    'p50'   : histogram.percentile(0.5),
+                    'p90'   : histogram.percentile(0.9),
+                    'p99'   : histogram.percentile(0.99),
+                    'max'   : histogram.max,
+                }
+        return summary
+
+    def report(self):
+        """returns summary as text table, times in milliseconds."""
+        lines = []
+        for operation, stats in sorted(self.summary().items()):
+            lines.append('%s: %d calls, %d errors, %d requests, %d bytes sent, '
+                         '%d bytes received, %d observations' %
+                         (operation, stats['count'], stats['errors'], stats['requests'],
+                          stats['bytes_sent'], stats['bytes_received'], stats['observations']))
+            lines.append('  %-10s %8s %10s %10s %10s %10s %10s' %
+                         ('phase', 'count', 'mean', 'p50', 'p90', 'p99', 'max'))
+            phases = OperationRecord.PHASES + ('total',)
+            for phase in sorted(stats['phases'],
+                                key=lambda phase: (phases.index(phase) if phase in phases
+                                                   else len(phases), phase)):
+                phase_stats = stats['phases'][phase]
+                lines.append('  %-10s %8d' % (phase, phase_stats['count']) +
+                             ''.join(' %10.3f' % (phase_stats[name] * 1000)
+                                     for name in ('mean', 'p50', 'p90', 'p99', 'max')))
+        return '\n'.join(lines)
+
+
+class _TimedReader(object):
+    """file object which adds time to read source into 'download' phase."""
+    def __init__(self, source, record):
+        self.source = source
+        self.record = record
+
+    def read(self, amt=None):
+        with self.record.phase('download'):
+            return self.source.read() if amt is None else self.source.read(amt)
+
+    def close(self):
+        self.source.close()
+
+
+def _timed_elements(elements, record):
+    """yields elements, adding time to get next one into 'parse' phase
+       and time the consumer spends for each into 'convert' phase.
+
+    """
+    download = record.phases.get('download', 0.0)
+    parse = 0.0
+    try:
+        for_next = _clock()
+        for item in elements:
+            got = _clock()
+            parse += got - for_next
+            yield item
+            for_next = _clock()
+            record.add_time('convert', for_next - got)
+        parse += _clock() - for_next
+    finally:
+        # reading response while parsing is download
+        record.add_time('parse', parse - (record.phases.get('download', 0.0) - download))
+
+
+class _Sinks(object):
+    """passes counts to multiple TransferMetrics like objects."""
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def add(self, **counts):
+        for sink in self.sinks:
+            sink.add(**counts)
+
+
+def _new_decompressor(encoding):
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        return zlib.decompressobj(zlib.MAX_WBITS)
+    return None
+
+
+def decode_content(body, encoding):
+    """decompresses whole response body by Content-Encoding (gzip/deflate)."""
+    decompressor = _new_decompressor(encoding)
+    if decompressor is None:
+        return body
+    try:
+        out = decompressor.decompress(body) + decompressor.flush()
+    except zlib.error:
+        if encoding != 'deflate':
+            raise
+        # some servers send raw deflate stream without zlib header
+        return zlib.decompress(body, -zlib.MAX_WBITS)
+    _check_end_of_stream(decompressor)
+    return out
+
+
+def _check_end_of_stream(decompressor):
+    # a truncated or corrupted stream may decode to garbage without error
+    if not getattr(decompressor, 'eof', True):
+        raise zlib.error('incomplete or truncated compressed stream')
+
+
+class DecodingResponse(object):
+    """a response whose body is decompressed by Content-Encoding while it is read.
+
+    It can be passed to iterparse directly, the body is never held whole
+    in compressed form.
+
+    Args:
+      resp (file object): response
+      encoding (str): Content-Encoding of the response, 'gzip', 'deflate' or None
+      metrics (TransferMetrics): counts bytes and decode time if specified
+
+    """
+    def __init__(self, resp, encoding, metrics=None):
+        self.resp = resp
+        self.encoding = encoding
+        self.metrics = metrics
+        self.code = getattr(resp, 'code', None)
+        self.headers = getattr(resp, 'headers', None)
+        self._decompressor = _new_decompressor(encoding)
+        self._tail = b''
+        self._eof = False
+        self._started = False
+
+    def _decode(self, data, amt):
+        begin = time.time()
+        try:
+            out = self._decompressor.decompress(data, amt)
+        except zlib.error:
+            # only the start of the stream tells whether it has zlib header
+            if self.encoding != 'deflate' or self._started:
+                raise
+            # raw deflate stream without zlib header
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            out = self._decompressor.decompress(data, amt)
+        self._started = True
+        self._tail = self._decompressor.unconsumed_tail
+        if self.metrics is not None:
+            self.metrics.add(bytes_decoded=len(out), decode_time=time.time() - begin)
+        return out
+
+    def _read_raw(self, amt=None):
+        data = self.resp.read() if amt is None else self.resp.read(amt)
+        if self.metrics is not None:
+            self.metrics.add(bytes_received=len(data))
+        return data
+
+    def read(self, amt=None):
+        if self._eof:
+            return b''
+        if self._decompressor is None:
+            data = self._read_raw(amt)
+            if self.metrics is not None:
+                self.metrics.add(bytes_decoded=len(data))
+            self._eof = amt is None or not data
+            return data
+
+        if amt is None:
+            out = self._decode(self._tail + self._read_raw(), 0)
+            return out + self._finish()
+
+        while True:
+            data = self._tail or self._read_raw(amt)
+            if not data:
+                return self._finish()
+            out = self._decode(data, amt)
+            if out:
+                return out
+
+    def _finish(self):
+        self._eof = True
+        out = self._decompressor.flush()
+        _check_end_of_stream(self._decompressor)
+        if self.metrics is not None:
+            self.metrics.add(bytes_decoded=len(out))
+        return out
+
+    def close(self):
+        self.resp.close()
+
+
+def _compress_body(req_body, metrics):
+    """compresses request body (bytes/iterable of bytes) with gzip."""
+    def compress(chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            begin = time.time()
+            data = compressor.compress(chunk)
+            if metrics is not None:
+                metrics.add(encode_time=time.time() - begin)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    if isinstance(req_body, bytes):
+        return b''.join(compress([req_body]))
+    return compress(req_body)
+
+
+def _count_body(req_body, metrics):
+    if isinstance(req_body, bytes):
+        metrics.add(bytes_sent=len(req_body))
+        return req_body
+
+    def count(chunks):
+        for chunk in chunks:
+            metrics.add(bytes_sent=len(chunk))
+            yield chunk
+    return count(req_body)
+
+
+def open_ogc_api(url, req_body, verbose=False, idempotent=False, compress=False):
+    """send request to ogc API and return its response without reading it.
+
+    Args:
+      url (dict): 'url' is URL of API, including Token in parameter.
+                  'header' (optional) is additional request headers.
+                  'pool' (optional) is ConnectionPool to send the request with.
+                  'timeout' (optional) is socket timeout (seconds) of the request.
+                  'retry' (optional) is RetryPolicy for idempotent request.
+                  'breaker' (optional) is CircuitBreaker of the endpoint.
+                  'accept_encoding' (optional) True to accept gzip/deflate
+                  compressed response, it is decompressed while being read.
+                  'metrics' (optional) is TransferMetrics to count bytes.
+                  'record' (optional) is OperationRecord to record phases.
+      req_body (str/iterable): request body, XML string, or iterable of bytes
+                               which is sent with chunked transfer encoding.
+      idempotent (bool): True if the request can be retried
+      compress (bool): True to send request body compressed with gzip
+
+    Returns:
+      file object: response, it must be read to the end or closed.
+
+    Raises:
+      CircuitOpenError: when the circuit breaker of the endpoint is open.
+
+    """
+    if isinstance(req_body, type(u'')):
+        req_body = req_body.encode('utf-8')
+    # streamed body cannot be sent again
+    return _with_retry(url, idempotent and isinstance(req_body, bytes),
+                       lambda: _send_request(url, req_body, verbose, compress))
+
+
+def _send_request(url, req_body, verbose, compress=False):
+    if debug or verbose:
+        print(req_body)
+
+    headers = {'content-type' : 'application/xml; charset="utf-8"'}
+    if 'header' in url:
+        headers.update(url['header'])
+    if url.get('accept_encoding'):
+        headers['accept-encoding'] = 'gzip, deflate'
+    record = url.get('record')
+    metrics = url.get('metrics')
+    if record is not None:
+        metrics = record if metrics is None else _Sinks(metrics, record)
+    if compress:
+        req_body = _compress_body(req_body, metrics)
+        headers['content-encoding'] = 'gzip'
+    if metrics is not None:
+        metrics.add(requests=1)
+        req_body = _count_body(req_body, metrics)
+    try:
+        if 'pool' in url:
+            resp = url['pool'].urlopen(url['url'], req_body, headers, url.get('timeout'),
+                                       record)
+        else:
+            with _phase(url, 'wait'):
+                if url.get('timeout') is not None:
+                    resp = urlopen(Request(url['url'], req_body, headers),
+                                   timeout=url['timeout'])
+                else:
+                    resp = urlopen(Request(url['url'], req_body, headers))
+    except HTTPError as e:
+        print(e.code, e.reason)
+        error_body = e.read()
+        try:
+            error_body = decode_content(error_body, (e.info() or {}).get('content-encoding'))
+        except zlib.error:
+            pass
+        print(error_body)
+        raise
+
+    encoding = resp.headers.get('content-encoding')
+    if encoding or metrics is not None:
+        return DecodingResponse(resp, encoding and encoding.strip().lower(), metrics)
+    return resp
+
+
+def parse_response(resp_body):
+    """parse response XML and read its namespace definitions in one pass.
+
+    Args:
+      resp_body (bytes): response body
+
+    Returns:
+      (Element, dict): response body XML tree and namespace dictionary from response.
+
+    Raises:
+      ParseError: when resp_body is not XML.
+
+    """
+    namespaces = {}
+    parser = ET.iterparse(BytesIO(resp_body), ('start-ns',))
+    for _, elem in parser:
+        namespaces[elem[0]] = elem[1]
+    return parser.root, namespaces
+
+
+def call_ogc_api(url, req_body, token=None, token_param=None, verbose=False,
+                 idempotent=False, compress=False):
+    """call ogc API
+
+    Args:
+      url (dict): 'url' is URL of API, including Token in parameter.
+                  'header' (optional) is additional request headers.
+                  'pool' (optional) is ConnectionPool to send the request with.
+                  'timeout' (optional) is socket timeout (seconds) of the request.
+                  'retry' (optional) is RetryPolicy for idempotent request.
+                  'breaker' (optional) is CircuitBreaker of the endpoint.
+                  'accept_encoding' (optional) True to accept gzip/deflate
+                  compressed response.
+                  'metrics' (optional) is TransferMetrics to count bytes.
+                  'record' (optional) is OperationRecord to record phases.
+      req_body (str): request body, XML string
+      idempotent (bool): True if the request can be retried
+      compress (bool): True to send request body compressed with gzip
+
+    Returns:
+      (Element, dict): 1st returned Element is a response body XML tree.
+                       2nd returned dict is namespace dictionary from response.
+
+    """
+    if isinstance(req_body, type(u'')):
+        req_body = req_body.encode('utf-8')
+
+    def send():
+        resp = _send_request(url, req_body, verbose, compress)
+        try:
+            with _phase(url, 'download'):
+                return resp.read()
+        finally:
+            resp.close()
+
+    # reading response is retried together with sending request
+    resp_body = _with_retry(url, idempotent and isinstance(req_body, bytes), send)
+
+    if debug or verbose:
+        print(resp_body)
+
+    try:
+        with _phase(url, 'parse'):
+            return parse_response(resp_body)
+    except ParseError:
+        # some response seems to be illegal.
+        return resp_body, None
+
+
+def parse_capabilities(resp_root, namespaces):
+    """parse GetCapabilities response.
+
+    Args:
+      resp_root (Element): response body XML tree
+      namespaces (dict): namespace dictionary from response
+
+    Returns:
+      (Server, Provider, list of Operation (str), list of Filter (str), list of Observation)
+
+    """
+    server = parse_service(resp_root.find(get_cn_tag('ows:ServiceIdentification', namespaces)),
+                           namespaces)
+
+    provider = parse_provider(resp_root.find(get_cn_tag('ows:ServiceProvider', namespaces)),
+                              namespaces)
+
+    operations = parse_operations(resp_root.find(get_cn_tag('ows:OperationsMetadata', namespaces)),
+                                  namespaces)
+
+    filters = []
+    #filters = resp_root.find(get_cn_tag('sos:filterCapabilities', namespaces))
+    #self.filters = self.parse_filters(filters, namespaces)
+
+    offerings = resp_root.findall(get_cn_tag('sos:contents/sos:Contents/swes:offering',
+                                             namespaces))
+    # locations and time ranges of all offerings are in one array
+    extents = _Extents()
+    observations = []
+    for offering in offerings:
+        observations.append(parse_offering(offering, namespaces, extents))
+
+    return server, provider, operations, filters, observations
+
+
+def _decode_result_values_numpy(text):
+    lines = text.split()
+    fields = ','.join(lines).split(',')
+    if len(fields) != 2 * len(lines):
+        # lines with spaces or illegal lines, same as _decode_result_values_python does
+        lines = [l.strip() for l in text.split('\n') if l.count(',') == 1]
+        fields = ','.join(lines).split(',')
+    if not lines:
+        fields = []
+    # timestamps are fixed width, first 19 chars are date and time without timezone
+    times = np.array(fields[0::2], dtype='U19').astype('datetime64[s]')
+    values = np.array(fields[1::2], dtype=np.float64)
+    # timestamps go back at the start of next property
+    prop_ids = np.zeros(len(times), dtype=np.int32)
+    np.cumsum(np.diff(times) <= np.timedelta64(0, 's'), out=prop_ids[1:])
+    return times, prop_ids, values
+
+
+def _decode_result_values_python(text):
+    times = []
+    prop_ids = array('i')
+    values = array('d')
+    parsed = {}
+    prop_idx = 0
+    prev_time = None
+    for l in text.split('\n'):
+        elem = l.split(',')
+        if len(elem) == 2:
+            # timestamps are in same ISO8601 format, they can be compared as str
+            time_str = elem[0].strip()[:19]
+            if prev_time and time_str <= prev_time:
+                # next prop
+                prop_idx += 1
+            dt = parsed.get(time_str)
+            if dt is None:
+                dt = datetime(int(time_str[0:4]), int(time_str[5:7]), int(time_str[8:10]),
+                              int(time_str[11:13]), int(time_str[14:16]), int(time_str[17:19]))
+                parsed[time_str] = dt
+            times.append(dt)
+            prop_ids.append(prop_idx)
+            values.append(float(elem[1]))
+            prev_time = time_str
+    return times, prop_ids, values
+
+
+def decode_result_values(text):
+    """decode text of sos:resultValues in GetResult response in bulk.
+
+    Each line is 'timestamp,value', samples of each observed property
+    are in order of time, and properties follow one after another.
+    If numpy is available, whole text is parsed by vectorized operations.
+
+    Args:
+      text (str): text of sos:resultValues
+
+    Returns:
+      (times, prop_ids, values): timestamp, index of observed property in request and
+                                 value of each sample.
+                                 with numpy, they are ndarray of datetime64[s], int32
+                                 and float64, otherwise list of datetime,
+                                 array('i') and array('d').
+
+    """
+    if np is not None:
+        return _decode_result_values_numpy(text)
+    return _decode_result_values_python(text)
+
+
+def _find_exception(resp_root):
+    # ows:Exception, in default namespace or with any prefix
+    for child in resp_root:
+        if child.tag.endswith('}Exception'):
+            return child
+    return None
+
+
+def _find_result_values(resp_root, namespaces):
+    exception = _find_exception(resp_root)
+    if exception is not None:
+        print('Exception: {}'.format(exception.attrib['exceptionCode']))
+        return None
+    return resp_root.find(get_cn_tag('sos:resultValues', namespaces)).text or ''
+
+
+def parse_result(resp_root, namespaces, properties):
+    """parse GetResult response.
+
+    Args:
+      resp_root (Element): response body XML tree
+      namespaces (dict): namespace dictionary from response
+      properties (list): list of observed properties requested, in order of the request.
+
+    Returns:
+      dict: has datetime object as key and result (dict) as value.
+            result (dict) has observed property as key and value (dict) as value.
+            value (dict) has 'value' (value)  and 'uom' (unit name)
+
+    """
+    text = _find_result_values(resp_root, namespaces)
+    if text is None:
+        return {}
+
+    (times, prop_ids, values) = decode_result_values(text)
+    if np is not None:
+        # convert each distinct timestamp into datetime only once
+        (unique_times, inverse) = np.unique(times, return_inverse=True)
+        unique_times = unique_times.astype(object).tolist()
+        times = [unique_times[i] for i in inverse.tolist()]
+        prop_ids = prop_ids.tolist()
+        values = values.tolist()
+
+    measurements = {}
+    for dt, prop_idx, value in zip(times, prop_ids, values):
+        prop = properties[prop_idx]
+        if dt not in measurements:
+            measurements[dt] = {}
+        measurements[dt][prop] = {'value' : value, 'uom' : ''}
+
+    return measurements
+
+
+def parse_result_columnar(resp_root, namespaces, properties):
+    """parse GetResult response into ColumnarMeasurements.
+
+    Args:
+      resp_root (Element): response body XML tree
+      namespaces (dict): namespace dictionary from response
+      properties (list): list of observed properties requested, in order of the request.
+
+    Returns:
+      ColumnarMeasurements
+
+    """
+    text = _find_result_values(resp_root, namespaces)
+    if text is None:
+        return build_columnar([], array('i'), array('d'), [], {})
+
+    (times, prop_ids, values) = decode_result_values(text)
+    if len(prop_ids) and prop_ids[-1] >= len(properties):
+        raise IndexError('more properties in response than requested')
+    return build_columnar(times, prop_ids, values, properties,
+                          dict((prop, '') for prop in properties))
+
+
+def parse_insert_observation_response(resp_root, namespaces):
+    """parse InsertObservation response.
+
+    Args:
+      resp_root (Element/bytes): response body XML tree, or raw body if it was illegal XML
+      namespaces (dict): namespace dictionary from response, None if it was illegal XML
+
+    Returns:
+      str: result of insertion, ex. 'Inserted'
+
+    """
+    # <sos:InsertObservationResponse>
+    #   <sos:observation>Inserted</sos:observation>
+    # </sos:InsertObservationResponse>
+    # but, it should be
+    # <sos:InsertObservationResponse xmlns:sos="http://www.opengis.net/sos/2.0">
+    #   <sos:observation>Inserted</sos:observation>
+    # </sos:InsertObservationResponse>
+    if namespaces is None:
+        # illegal response
+        result = resp_root
+    else:
+        result = resp_root.find(get_cn_tag('sos:observation', namespaces)).text
+    return result
+
+
+def get_capabilities(url):
+    """execute GetCapabilities operation.
+
+    Args:
+      url (str): URL of API, including Token in parameter.
+
+    Returns:
+      (Server, Provider, list of Operation (str), list of Filter (str), list of Observation)
+
+    Examples:
+      (server, provider, operations, filters, observations) = \
+            get_capabilities('https://sos.foo.com/api?Key=xxxxxx')
+
+    """
+    with _phase(url, 'build'):
+        req_body = render_get_capabilities_request()
+    (resp_root, namespaces) = call_ogc_api(url, req_body, idempotent=True)
+    with _phase(url, 'convert'):
+        capabilities = parse_capabilities(resp_root, namespaces)
+    if url.get('record') is not None:
+        url['record'].observations = len(capabilities[4])
+    return capabilities
+
+
+def count_samples(measurements):
+    """returns number of samples in measurements dict or ColumnarMeasurements."""
+    if isinstance(measurements, ColumnarMeasurements):
+        return sum(int(np.count_nonzero(~np.isnan(values)))
+                   for values in measurements.values.values())
+    return sum(len(measure) for measure in measurements.values())
+
+
+def iter_observation_elements(source, strict=False):
+    """read om:OM_Observation elements from GetObservation response incrementally.
+
+    Each element is cleared after the caller has processed it,
+    so memory usage does not depend on the size of the response.
+
+    Args:
+      source (file object): GetObservation response
+      strict (bool): raise ExceptionReportError for ows:Exception instead of printing it
+
+    Yields:
+      (Element, dict): om:OM_Observation element and namespace dictionary from response
+
+    """
+    namespaces = {}
+    root = None
+    for event, elem in ET.iterparse(source, ('start-ns', 'start', 'end')):
+        if event == 'start-ns':
+            namespaces[elem[0]] = elem[1]
+        elif event == 'start':
+            if root is None:
+                root = elem
+        elif elem.tag.endswith('}OM_Observation'):
+            yield elem, namespaces
+            elem.clear()
+            root.clear()
+        elif elem.tag.endswith('}Exception'):
+            if strict:
+                raise ExceptionReportError(elem.attrib['exceptionCode'])
+            print('Exception: {}'.format(elem.attrib['exceptionCode']))
+            return
+
+
+def iter_parse_observations(source):
+    """parse GetObservation response incrementally.
+
+    Args:
+      source (file object): GetObservation response
+
+    Yields:
+      (datetime, str, dict): datetime, observed property and value (dict)
+                             which has 'value' (value) and 'uom' (unit name)
+
+    """
+    for elem, namespaces, paths in _with_paths(iter_observation_elements(source)):
+        yield parse_observation(elem, namespaces, paths)
+
+
+def parse_observations_columnar(elements, properties):
+    """parse om:OM_Observation elements into ColumnarMeasurements.
+
+    Values are stored into flat arrays directly, without measurements dict.
+
+    Args:
+      elements (iterable): (Element, dict) such as iter_observation_elements yields
+      properties (list): list of observed properties requested
+
+    Returns:
+      ColumnarMeasurements
+
+    """
+    properties = list(properties)
+    prop_index = dict((prop, i) for i, prop in enumerate(properties))
+    uoms = {}
+    times = []
+    prop_ids = array('i')
+    values = array('d')
+    for elem, namespaces, (time_path, property_path, result_path) in _with_paths(elements):
+        times.append(elem.find(time_path).text[:19])
+        prop = elem.find(property_path).text.strip('"')
+        if prop not in prop_index:
+            prop_index[prop] = len(properties)
+            properties.append(prop)
+        prop_ids.append(prop_index[prop])
+        result = elem.find(result_path)
+        values.append(float(result.text))
+        if prop not in uoms:
+            uoms[prop] = unescape(result.attrib['uom'])
+
+    return build_columnar(times, prop_ids, values, properties, uoms)
+
+
+def collect_measurements(observations):
+    """collect (datetime, property, value) tuples into measurements dict.
+
+    Args:
+      observations (iterable): (datetime, str, dict) such as iter_parse_observations yields
+
+    Returns:
+      dict: has datetime object as key and result (dict) as value.
+            result (dict) has observed property as key and value (dict) as value.
+            value (dict) has 'value' (value)  and 'uom' (unit name)
+
+    """
+    measurements = {}
+    for (dt, prop, value) in observations:
+        if dt not in measurements:
+            measurements[dt] = {}
+        measurements[dt][prop] = value
+
+    return measurements
+
+
+def iter_measurements(measurements):
+    """flatten measurements dict into (datetime, property, value) tuples.
+
+    Args:
+      measurements (dict): such as get_observation returns
+
+    Yields:
+      (datetime, str, dict): datetime, observed property and value (dict)
+                             which has 'value' (value) and 'uom' (unit name)
+
+    """
+    for dt, measure in measurements.items():
+        for prop, value in measure.items():
+            yield dt, prop, value
+
+
+def merge_measurements(measurements, other):
+    """merge measurements dict into another one.
+
+    Args:
+      measurements (dict): measurements dict to be updated
+      other (dict): measurements dict to be merged
+
+    Returns:
+      dict: updated measurements
+
+    """
+    for dt, measure in other.items():
+        if dt in measurements:
+            measurements[dt].update(measure)
+        else:
+            measurements[dt] = dict(measure)
+    return measurements
+
+
+def _iter_observation_response(url, procedure, properties, time_range):
+    with _phase(url, 'build'):
+        req_body = render_get_observation_request(procedure, properties, time_range)
+    resp = open_ogc_api(url, req_body, idempotent=True)
+    try:
+        if debug:
+            resp_body = resp.read()
+            print(resp_body)
+            source = BytesIO(resp_body)
+        elif url.get('record') is not None:
+            source = _TimedReader(resp, url['record'])
+        else:
+            source = resp
+        for elem, namespaces in iter_observation_elements(source, url.get('strict', False)):
+            yield elem, namespaces
+    finally:
+        resp.close()
+
+
+def iter_observation(url, procedure, properties, time_range):
+    """execute GetObservation operation and read its response as a stream.
+
+    Args:
+      url (str): URL of API, including Token in parameter.
+      procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
+      properties (list): list of observed properties. (str) ex. 'air_temperature'
+      time_range (list): has 2 datetime object, start time and end time.
+
+    Yields:
+      (datetime, str, dict): datetime, observed property and value (dict)
+                             which has 'value' (value) and 'uom' (unit name)
+
+    Examples:
+      for dt, prop, value in iter_observation('https://sos.foo.com/api?Key=xxxxxx',
+                                              'TEST:Field:SensorNodeName',
+                                              ['air_temperature'],
+                                              [datetime(2017, 1, 1), datetime(2017, 2, 1)]):
+          print(dt, prop, value['value'])
+
+    """
+    for elem, namespaces, paths in _with_paths(
+            _iter_observation_response(url, procedure, properties, time_range)):
+        yield parse_observation(elem, namespaces, paths)
+
+
+def get_observation(url, procedure, properties, time_range, format='dict'):
+    """execute GetObservation operation.
+
+    Args:
+      url (str): URL of API, including Token in parameter.
+      procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
+      properties (list): list of observed properties. (str) ex. 'air_temperature'
+      time_range (list): has 2 datetime object, start time and end time.
+      format (str): 'dict' or 'columnar'
+
+    Returns:
+      dict: (in dict format) has datetime object as key and result (dict) as value.
+            result (dict) has observed property as key and value (dict) as value.
+            value (dict) has 'value' (value)  and 'uom' (unit name)
+      ColumnarMeasurements: (in columnar format)
+
+    Examples:
+      measurements = get_observation('https://sos.foo.com/api?Key=xxxxxx',
+                                 'TEST:Field:SensorNodeName',
+                                 ['air_temperature', 'relative_humidity'],
+                                 [datetime(2017, 1, 1, 0, 0, 0), datetime(2017, 1, 1, 0, 5, 0)])
+    """
+    _check_format(format)
+    record = url.get('record')
+    elements = _iter_observation_response(url, procedure, properties, time_range)
+    if record is not None:
+        elements = _timed_elements(elements, record)
+    if format == 'columnar':
+        measurements = parse_observations_columnar(elements, properties)
+    else:
+        measurements = collect_measurements(parse_observation(elem, namespaces, paths)
+                                            for elem, namespaces, paths in _with_paths(elements))
+    if record is not None:
+        record.observations = count_samples(measurements)
+    return measurements
+
+
+def get_result(url, procedure, properties, time_range, format='dict'):
+    """execute GetResult operation.
+
+    Args:
+      url (str): URL of API, including Token in parameter.
+      procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
+      properties (list): list of observed properties. (str) ex. 'air_temperature'
+      time_range (list): has 2 datetime object, start time and end time.
+      format (str): 'dict' or 'columnar'
+
+    Returns:
+      dict: (in dict format) has datetime object as key and result (dict) as value.
+            result (dict) has observed property as key and value (dict) as value.
+            value (dict) has 'value' (value)  and 'uom' (unit name)
+      ColumnarMeasurements: (in columnar format)
+
+    Note:
+      cloudSense SOS server accepts multiple observed properties for GetResult,
+      but in the specification it is not allowed.
+
+    Examples:
+      measurements = get_result('https://sos.foo.com/api?Key=xxxxxx',
+                                'TEST:Field:SensorNodeName',
+                                ['air_temperature', 'relative_humidity'],
+                                [datetime(2017, 1, 1, 0, 0, 0), datetime(2017, 1, 1, 0, 5, 0)])
+
+    """
+    _check_format(format)
+    with _phase(url, 'build'):
+        req_body = render_get_result_request(procedure, properties, time_range)
+    (resp_root, namespaces) = call_ogc_api(url, req_body, idempotent=True)
+    if url.get('strict'):
+        exception = _find_exception(resp_root)
+        if exception is not None:
+            raise ExceptionReportError(exception.attrib['exceptionCode'])
+    with _phase(url, 'convert'):
+        if format == 'columnar':
+            measurements = parse_result_columnar(resp_root, namespaces, properties)
+        else:
+            measurements = parse_result(resp_root, namespaces, properties)
+    if url.get('record') is not None:
+        url['record'].observations = count_samples(measurements)
     return measurements
 
-def insert_observation(url, procedure, measurements):
-    req = build_insert_observation_request(procedure, measurements, default_ogc_namespaces())
-    (resp_root, namespaces) = call_ogc_api(url, tostring(req, 'utf-8'))
-    # <sos:InsertObservationResponse>
-    #   <sos:observation>Inserted</sos:observation>
-    # </sos:InsertObservationResponse>
-    # but, it should be
-    # <sos:InsertObservationResponse xmlns:sos="http://www.opengis.net/sos/2.0">
-    #   <sos:observation>Inserted</sos:observation>
-    # </sos:InsertObservationResponse>
-    if namespaces is None:
-        # illegal response
-        result = resp_root
-    else:
-        result = resp_root.find(get_cn_tag('sos:observation', namespaces)).text
-    return result
+
+def insert_observation(url, procedure, measurements, chunked=False, compress=False):
+    """execute InsertObservation operation.
+
+    Args:
+      url (str): URL of API, including Token in parameter.
+      procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
+      measurements (dict/iterable): measurements dict, or (datetime, property, value) tuples
+      chunked (bool): send request body with chunked transfer encoding while writing it
+      compress (bool): send request body compressed with gzip
+                       (the server must accept Content-Encoding: gzip)
+
+    Returns:
+      str: result of insertion, ex. 'Inserted'
+
+    """
+    if url.get('record') is not None and isinstance(measurements, dict):
+        url['record'].observations = count_samples(measurements)
+    req_body = iter_insert_observation_body(procedure, measurements)
+    if not chunked:
+        with _phase(url, 'serialize'):
+            req_body = b''.join(req_body)
+    (resp_root, namespaces) = call_ogc_api(url, req_body, compress=compress)
+    return parse_insert_observation_response(resp_root, namespaces)
+
 
 def describe_sensor(url, procedure):
-    req = build_describe_sensor_request(procedure, default_ogc_namespaces())
-    (resp_root, namespaces) = call_ogc_api(url, tostring(req, 'utf-8'), verbose=True)
+    with _phase(url, 'build'):
+        req_body = render_describe_sensor_request(procedure)
+    call_ogc_api(url, req_body, verbose=True, idempotent=True)
     return None
 
 
+EPOCH = datetime(1970, 1, 1)
+
+
+class ObservationCache(object):
+    """persistent cache of measurements in SQLite database.
+
+    Samples are stored per operation, procedure and observed property, indexed by
+    timestamp, together with time ranges which have been fetched (coverage).
+    Only uncovered parts of a requested time range need to be fetched.
+
+    Args:
+      path (str): path of database file
+      max_age (float): samples fetched more than this seconds ago are evicted.
+                       None for no limit.
+      max_samples (int): when more samples than this are stored, the oldest fetched
+                         ones are evicted. None for no limit.
+
+    Examples:
+      cache = ObservationCache(os.path.expanduser('~/.ogcsos_cache.db'), max_age=86400)
+      server = SOSServer('https://sos.foo.com/api', 'XXXXXXXX', cache=cache)
+
+    """
+    def __init__(self, path, max_age=None, max_samples=None):
+        self.path = path
+        self.max_age = max_age
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS samples ('
+                             ' operation TEXT, procedure TEXT, property TEXT, time INTEGER,'
+                             ' value REAL, uom TEXT, fetched REAL,'
+                             ' PRIMARY KEY (operation, procedure, property, time))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS coverage ('
+                             ' operation TEXT, procedure TEXT, property TEXT,'
+                             ' start INTEGER, end INTEGER, fetched REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS coverage_key'
+                             ' ON coverage (operation, procedure, property, start)')
+
+    @staticmethod
+    def _to_time(dt):
+        return int((dt - EPOCH).total_seconds())
+
+    @staticmethod
+    def _from_time(t):
+        return EPOCH + timedelta(seconds=t)
+
+    def _uncovered(self, operation, procedure, prop, start, end):
+        rows = self._db.execute('SELECT start, end FROM coverage'
+                                ' WHERE operation = ? AND procedure = ? AND property = ?'
+                                ' AND end >= ? AND start <= ? ORDER BY start',
+                                (operation, procedure, prop, start, end))
+        gaps = []
+        cursor = start
+        for (c_start, c_end) in rows:
+            if c_start > cursor:
+                gaps.append((cursor, c_start))
+            cursor = max(cursor, c_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def missing(self, operation, procedure, properties, time_range):
+        """returns time ranges which are not covered for some of properties.
+
+        Args:
+          operation (str): 'get_observation' or 'get_result'
+          procedure (str): SOSName, procedure. ex. 'TEST:Field:SensorNodeName'
+          properties (list): list of observed properties
+          time_range (list): has 2 datetime object, start time and end time.
+
+        Returns:
+          list: list of time range (list of 2 datetime object) to be fetched
+
+        """
+        start = self._to_time(time_range[0])
+        end = self._to_time(time_range[1])
+        gaps = []
+        with self._lock:
+            for prop in properties:
+                gaps.extend(self._uncovered(operation, procedure, prop, start, end))
+
+        merged = []
+        for (g_start, g_end) in sorted(gaps):
+            if merged and g_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], g_end)
+            else:
+                merged.append([g_start, g_end])
+        return [[self._from_time(g_start), self._from_time(g_end)]
+                for (g_start, g_end) in merged]
+
+    def load(self, operation, procedure, properties, time_range):
+        """returns cached measurements in the time range.
+
+        Returns:
+          dict: has datetime object as key and result (dict) as value.
+                result (dict) has observed property as key and value (dict) as value.
+                value (dict) has 'value' (value)  and 'uom' (unit name)
+
+        """
+        start = self._to_time(time_range[0])
+        end = self._to_time(time_range[1])
+        measurements = {}
+        with self._lock:
+            for prop in properties:
+                rows = self._db.execute('SELECT time, value, uom FROM samples'
+                                        ' WHERE operation = ? AND procedure = ? AND property = ?'
+                                        ' AND time BETWEEN ? AND ?',
+                                        (operation, procedure, prop, start, end))
+                for (t, value, uom) in rows:
+                    dt = self._from_time(t)
+                    if dt not in measurements:
+                        measurements[dt] = {}
+                    measurements[dt][prop] = {'value' : value, 'uom' : uom}
+        return measurements
+
+    def store(self, operation, procedure, properties, time_range, measurements):
+        """stores measurements fetched for the time range.
+
+        The time range is recorded as covered for all properties,
+        except for its future part which may get more samples later.
+
+        """
+        now = time.time()
+        start = self._to_time(time_range[0])
+        end = min(self._to_time(time_range[1]), self._to_time(datetime.now()))
+        rows = []
+        for dt, measure in measurements.items():
+            t = self._to_time(dt)
+            for prop, value in measure.items():
+                rows.append((operation, procedure, prop, t,
+                             float(value['value']), value['uom'], now))
+
+        with self._lock:
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                     rows)
+                if start < end:
+                    for prop in properties:
+                        self._add_coverage(operation, procedure, prop, start, end, now)
+                self._evict(now)
+
+    def _add_coverage(self, operation, procedure, prop, start, end, fetched):
+        key = (operation, procedure, prop)
+        overlaps = self._db.execute('SELECT rowid, start, end, fetched FROM coverage'
+                                    ' WHERE operation = ? AND procedure = ? AND property = ?'
+                                    ' AND end >= ? AND start <= ?',
+                                    key + (start, end)).fetchall()
+        for (rowid, c_start, c_end, c_fetched) in overlaps:
+            start = min(start, c_start)
+            end = max(end, c_end)
+            # merged range is as old as its oldest part, to be evicted with it
+            fetched = min(fetched, c_fetched)
+            self._db.execute('DELETE FROM coverage WHERE rowid = ?', (rowid,))
+        self._db.execute('INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?)',
+                         key + (start, end, fetched))
+
+    def _evict(self, now):
+        threshold = None
+        if self.max_age is not None:
+            threshold = now - self.max_age
+        if self.max_samples is not None:
+            row = self._db.execute('SELECT fetched FROM samples ORDER BY fetched DESC'
+                                   ' LIMIT 1 OFFSET ?', (self.max_samples,)).fetchone()
+            if row is not None:
+                threshold = row[0] if threshold is None else max(threshold, row[0])
+        if threshold is not None:
+            # samples just stored are kept even if they exceed max_samples by themselves
+            threshold = (threshold, now)
+            self._db.execute('DELETE FROM samples WHERE fetched <= ? AND fetched < ?', threshold)
+            self._db.execute('DELETE FROM coverage WHERE fetched <= ? AND fetched < ?', threshold)
+
+    def clear(self):
+        """removes all cached samples."""
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM samples')
+                self._db.execute('DELETE FROM coverage')
+
+    def close(self):
+        self._db.close()
+
+
+class AdaptiveWindow(object):
+    """decides size of sub-windows to split a long time range into.
+
+    The size is adjusted after each response so that a response takes about
+    target_time seconds and carries about target_samples samples.
+
+    Args:
+      size (timedelta): initial size of a sub-window
+      min_size (timedelta): lower limit of the size
+      max_size (timedelta): upper limit of the size
+      target_time (float): seconds a response should take
+      target_samples (int): number of samples a response should carry
+
+    """
+    def __init__(self, size=timedelta(days=1), min_size=timedelta(minutes=10),
+                 max_size=timedelta(days=31), target_time=5.0, target_samples=50000):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_time = target_time
+        self.target_samples = target_samples
+        self._lock = threading.Lock()
+
+    def split(self, start, end):
+        """returns next sub-window [start, end'] of [start, end]."""
+        with self._lock:
+            return [start, min(start + self.size, end)]
+
+    def update(self, span, elapsed, samples):
+        """adjusts the size from a response.
+
+        Args:
+          span (timedelta): time span of the request
+          elapsed (float): seconds the response took
+          samples (int): number of samples in the response
+
+        """
+        ratios = [2.0]
+        if elapsed > 0:
+            ratios.append(self.target_time / elapsed)
+        if samples > 0:
+            ratios.append(float(self.target_samples) / samples)
+        # do not change too much by one response
+        ratio = max(0.5, min(ratios))
+        size = timedelta(seconds=int(span.total_seconds() * ratio))
+        with self._lock:
+            self.size = max(self.min_size, min(self.max_size, size))
+
+
+class BatchStatus(object):
+    """status of a batch sent by SOSServer.insert_observations_many.
+
+    Attributes:
+      index (int): sequence number of the batch, from 0
+      count (int): number of samples in the batch
+      time_range (tuple): first and last datetime in the batch
+      result (str): response of InsertObservation (raw body if it was illegal XML),
+                    None if failed
+      error (Exception): exception raised for the batch, None if succeeded
+
+    """
+    def __init__(self, index, count, time_range, result=None, error=None):
+        self.index = index
+        self.count = count
+        self.time_range = time_range
+        self.result = result
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+class Catalog(object):
+    """parsed result of GetCapabilities.
+
+    SOSServer replaces whole Catalog at once, so readers never see
+    a half updated one.
+
+    Args:
+      server (Server): server information
+      provider (Provider): provider information
+      operations (list): list of Operation (str)
+      filters (list): list of Filter (str)
+      observations (list): list of Observation (offerings)
+      fetched (float): time (epoch seconds) when it was fetched from the server
+
+    """
+    def __init__(self, server=None, provider=None, operations=None, filters=None,
+                 observations=None, fetched=None):
+        self.server = server
+        self.provider = provider
+        self.operations = operations if operations is not None else []
+        self.filters = filters if filters is not None else []
+        self.observations = observations if observations is not None else []
+        self.fetched = fetched if fetched is not None else time.time()
+        self._build_indexes()
+
+    def _build_indexes(self):
+        self.by_name = {}
+        self.by_procedure = {}
+        self.by_property = {}
+        self.numbers = {}
+        for i, observation in enumerate(self.observations):
+            name = getattr(observation, 'name', None)
+            if name is not None and name not in self.by_name:
+                self.by_name[name] = observation
+            self.by_procedure.setdefault(observation.procedure, observation)
+            self.numbers.setdefault(observation.procedure, i + 1)
+            for prop in observation.properties:
+                self.by_property.setdefault(prop, {})[observation.procedure] = observation
+        self._sorted_names = sorted(self.by_name)
+        self._sorted_procedures = sorted(self.by_procedure)
+
+    @staticmethod
+    def _with_prefix(sorted_keys, prefix):
+        begin = bisect.bisect_left(sorted_keys, prefix)
+        end = begin
+        while end < len(sorted_keys) and sorted_keys[end].startswith(prefix):
+            end += 1
+        return sorted_keys[begin:end]
+
+    def find(self, pattern):
+        """returns observations whose name or procedure matches pattern.
+
+        Args:
+          pattern (str): exact name/procedure, or glob pattern such as 'Weather*'
+
+        Returns:
+          list: list of Observation, in order of the catalog
+
+        """
+        if not any(c in pattern for c in '*?['):
+            observation = self.by_name.get(pattern) or self.by_procedure.get(pattern)
+            return [observation] if observation is not None else []
+
+        # candidates are narrowed down by the prefix before wildcard
+        prefix = re.split(r'[*?\[]', pattern, 1)[0]
+        found = {}
+        for keys, index in ((self._sorted_names, self.by_name),
+                            (self._sorted_procedures, self.by_procedure)):
+            for key in self._with_prefix(keys, prefix):
+                if fnmatchcase(key, pattern):
+                    observation = index[key]
+                    found[observation.procedure] = observation
+        return sorted(found.values(), key=lambda observation: self.numbers[observation.procedure])
+
+
+def write_file_atomic(path, data):
+    """writes data (bytes) into a file, replacing it at once.
+
+    readers of the file see either old or new content, never partial one.
+
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    if hasattr(os, 'replace'):
+        os.replace(tmp_path, path)
+    else:
+        os.rename(tmp_path, path)
+
+
+def save_catalog(path, catalog, endpoint):
+    """saves Catalog into a JSON file.
+
+    Args:
+      path (str): path of the file
+      catalog (Catalog): catalog to be saved
+      endpoint (str): SOS API endpoint the catalog is from
+
+    """
+    data = {
+        'endpoint'    : endpoint,
+        'fetched'     : catalog.fetched,
+        'server'      : catalog.server.to_dict() if catalog.server else None,
+        'provider'    : catalog.provider.to_dict() if catalog.provider else None,
+        'operations'  : catalog.operations,
+        'filters'     : catalog.filters,
+        'observations': [observation.to_dict() for observation in catalog.observations],
+    }
+    write_file_atomic(path, json.dumps(data).encode('utf-8'))
+
+
+def load_catalog(path, endpoint):
+    """loads Catalog from a JSON file saved by save_catalog.
+
+    Args:
+      path (str): path of the file
+      endpoint (str): SOS API endpoint, the file for other endpoint is ignored.
+
+    Returns:
+      Catalog: None if the file does not exist or is not usable.
+
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return None
+    if data.get('endpoint') != endpoint:
+        return None
+
+    extents = _Extents()
+    observations = [Observation(extents, **kwds) for kwds in data['observations']]
+    return Catalog(Server(**data['server']) if data['server'] is not None else None,
+                   Provider(**data['provider']) if data['provider'] is not None else None,
+                   data['operations'], data['filters'], observations, data['fetched'])
+
+
+def save_poll_checkpoint(path, last_seen, endpoint):
+    """saves state of SOSServer.poll into a JSON file.
+
+    Args:
+      path (str): path of the file
+      last_seen (dict): has procedure as key and dict as value, which has
+                        observed property as key and last timestamp (datetime) as value.
+      endpoint (str): SOS API endpoint the state is for
+
+    """
+    data = {
+        'endpoint'  : endpoint,
+        'last_seen' : dict((procedure, dict((prop, dt.strftime(ISO8601_NO_TZ))
+                                            for prop, dt in props.items()))
+                           for procedure, props in last_seen.items()),
+    }
+    write_file_atomic(path, json.dumps(data).encode('utf-8'))
+
+
+def load_poll_checkpoint(path, endpoint):
+    """loads state of SOSServer.poll from a JSON file saved by save_poll_checkpoint.
+
+    Args:
+      path (str): path of the file
+      endpoint (str): SOS API endpoint, the file for other endpoint is ignored.
+
+    Returns:
+      dict: same as last_seen of save_poll_checkpoint, empty if the file
+            does not exist or is not usable.
+
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return {}
+    if data.get('endpoint') != endpoint:
+        return {}
+
+    return dict((procedure, dict((prop, datetime.strptime(dt, ISO8601_NO_TZ))
+                                 for prop, dt in props.items()))
+                for procedure, props in data['last_seen'].items())
+
+
+def _thread_pool(max_workers):
+    if ThreadPoolExecutor is None:
+        raise ImportError('futures is required for concurrent requests in python 2')
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def _strict(url, func, *args):
+    # calls func with url raising ExceptionReportError for ows:Exception
+    url['strict'] = True
+    return func(url, *args)
+
+
+class _Flight(object):
+    """a GetObservation/GetResult request shared by concurrent callers."""
+    def __init__(self, properties):
+        self.properties = list(properties)
+        self.issued = False
+        self.callers = 1
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def select_properties(measurements, properties, format='dict'):
+    """returns measurements of specified observed properties only.
+
+    Args:
+      measurements (dict/ColumnarMeasurements): such as get_observation returns
+      properties (list): list of observed properties to be selected
+      format (str): 'dict' or 'columnar', format of measurements
+
+    Returns:
+      dict/ColumnarMeasurements: new one in same format,
+                                 timestamps without selected properties are dropped.
+
+    """
+    if format == 'columnar':
+        values = dict((prop, measurements.values[prop]) for prop in properties
+                      if prop in measurements.values)
+        present = np.zeros(len(measurements.times), dtype=bool)
+        for column in values.values():
+            present |= ~np.isnan(column)
+        return ColumnarMeasurements(measurements.times[present],
+                                    dict((prop, column[present])
+                                         for prop, column in values.items()),
+                                    dict((prop, uom) for prop, uom in measurements.uoms.items()
+                                         if prop in values))
+
+    selected = {}
+    for dt, measure in measurements.items():
+        selected_measure = dict((prop, measure[prop]) for prop in properties if prop in measure)
+        if selected_measure:
+            selected[dt] = selected_measure
+    return selected
+
+
 class SOSServer(object):
     """a class represents SOS Server.
 
@@ -593,6 +3472,37 @@ class SOSServer(object):
     Args:
       endpoint (str): SOS API endpoint on the server
       token (str): Token to use SOS API on the server
+      is_token_header (bool): send token by Authorization header instead of URL parameter
+      pool_size (int): max number of keep-alive connections kept per host
+      idle_timeout (float): keep-alive connections idle longer than this (seconds)
+                            are not reused
+      cache (ObservationCache): if specified, get_observation and get_result fetch
+                                only time ranges which are not cached yet.
+      coalesce_window (float): concurrent get_observation/get_result for same offering
+                               and time range share one request (single-flight).
+                               a request waits this seconds before being sent, and
+                               requests for other properties arriving meanwhile are
+                               merged into it.
+      timeout (float): socket timeout (seconds) of each request, None for default
+      retry (RetryPolicy): if specified, idempotent requests (all operations except
+                           InsertObservation) are retried by it.
+      breaker (CircuitBreaker): if specified, requests fail fast by it
+                                while the endpoint keeps failing.
+      accept_encoding (bool): accept gzip/deflate compressed responses
+      compress_requests (bool): send InsertObservation request bodies compressed
+                                with gzip (the server must accept it)
+      hooks (list): instrumentation hooks, each is called with OperationRecord
+                    after every operation, in the thread executed it.
+                    HistogramAggregator is a hook aggregating them in memory.
+
+    Attributes:
+      pool (ConnectionPool): connections used by all operations of the instance.
+                             pool.hits and pool.misses tell how well they are reused.
+      coalesced (int): number of calls which shared a request of other call
+      retry (RetryPolicy): retry.retries tells how many times requests were retried.
+      breaker (CircuitBreaker): breaker.trips tells how many times the circuit opened.
+      metrics (TransferMetrics): bytes on wire and time for compression
+                                 of all requests of the instance.
 
     Examples:
       server = SOSAPI('https://sos.foo.com/api', 'XXXXXXXX')
@@ -606,15 +3516,77 @@ class SOSServer(object):
 
     """
 
-    def __init__(self, endpoint, token, is_token_header=False):
+    def __init__(self, endpoint, token, is_token_header=False,
+                 pool_size=10, idle_timeout=60.0, cache=None, coalesce_window=0.0,
+                 timeout=None, retry=None, breaker=None,
+                 accept_encoding=True, compress_requests=False, hooks=None):
         self.endpoint = endpoint
         self.token = token
-        self.server = None
-        self.provider = None
-        self.operations = []
-        self.filters = []
-        self.observations = []
+        self.catalog = Catalog()
         self.is_token_header = is_token_header
+        self.pool = ConnectionPool(pool_size, idle_timeout)
+        self.cache = cache
+        self.refresh_thread = None
+        self.coalesce_window = coalesce_window
+        self.coalesced = 0
+        self.timeout = timeout
+        self.retry = retry
+        self.breaker = breaker
+        self.accept_encoding = accept_encoding
+        self.compress_requests = compress_requests
+        self.metrics = TransferMetrics()
+        self.hooks = list(hooks) if hooks else []
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _replace_catalog(self, **kwds):
+        # assigning to an attribute replaces whole catalog as refreshing does
+        catalog = self.catalog
+        fields = dict(server=catalog.server, provider=catalog.provider,
+                      operations=catalog.operations, filters=catalog.filters,
+                      observations=catalog.observations, fetched=catalog.fetched)
+        fields.update(kwds)
+        self.catalog = Catalog(**fields)
+
+    @property
+    def server(self):
+        return self.catalog.server
+
+    @server.setter
+    def server(self, server):
+        self._replace_catalog(server=server)
+
+    @property
+    def provider(self):
+        return self.catalog.provider
+
+    @provider.setter
+    def provider(self, provider):
+        self._replace_catalog(provider=provider)
+
+    @property
+    def operations(self):
+        return self.catalog.operations
+
+    @operations.setter
+    def operations(self, operations):
+        self._replace_catalog(operations=operations)
+
+    @property
+    def filters(self):
+        return self.catalog.filters
+
+    @filters.setter
+    def filters(self, filters):
+        self._replace_catalog(filters=filters)
+
+    @property
+    def observations(self):
+        return self.catalog.observations
+
+    @observations.setter
+    def observations(self, observations):
+        self._replace_catalog(observations=observations)
 
     @staticmethod
     def _get_procedure(offering):
@@ -622,10 +3594,20 @@ class SOSServer(object):
 
     def _get_api_url(self):
         if not self.is_token_header and self.token:
-            return { 'url' : '%s?Key=%s' % (self.endpoint, self.token) }
+            url = { 'url'  : '%s?Key=%s' % (self.endpoint, self.token),
+                    'pool' : self.pool }
         else:
-            return { 'url'    : self.endpoint,
-                     'header' : { 'Authorization' : self.token } }
+            url = { 'url'    : self.endpoint,
+                    'header' : { 'Authorization' : self.token },
+                    'pool'   : self.pool }
+        url['timeout'] = self.timeout
+        url['accept_encoding'] = self.accept_encoding
+        url['metrics'] = self.metrics
+        if self.retry is not None:
+            url['retry'] = self.retry
+        if self.breaker is not None:
+            url['breaker'] = self.breaker
+        return url
 
     def get_capabilities(self):
         """execute GetCapabilities operation in context of the SOSServer instance.
@@ -634,10 +3616,201 @@ class SOSServer(object):
           (Server, Provider, list of Operation (str), list of Filter (str), list of Observation)
 
         """
-        return get_capabilities(self._get_api_url())
+        return self._run('GetCapabilities', None, get_capabilities)
+
+    def add_hook(self, hook):
+        """adds instrumentation hook, which is called with OperationRecord."""
+        self.hooks.append(hook)
+
+    def _notify(self, record):
+        record.finish()
+        for hook in self.hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                print('instrumentation hook failed: %s' % (e))
+
+    def _run(self, operation, procedure, func, *args):
+        """calls func(url, *args), recording it for hooks if there are."""
+        if not self.hooks:
+            return func(self._get_api_url(), *args)
+
+        record = OperationRecord(operation, procedure)
+        url = self._get_api_url()
+        url['record'] = record
+        try:
+            return func(url, *args)
+        except Exception as e:
+            record.error = e
+            raise
+        finally:
+            self._notify(record)
+
+    def _run_iter(self, operation, procedure, func, *args):
+        """same as _run for func returning iterator, recorded when it is exhausted."""
+        if not self.hooks:
+            for item in func(self._get_api_url(), *args):
+                yield item
+            return
+
+        record = OperationRecord(operation, procedure)
+        url = self._get_api_url()
+        url['record'] = record
+        try:
+            for item in func(url, *args):
+                record.observations += 1
+                yield item
+        except Exception as e:
+            record.error = e
+            raise
+        finally:
+            self._notify(record)
+
+    def _call(self, func, procedure, properties, time_range, format):
+        """execute GetObservation/GetResult (func), sharing a request with
+           concurrent calls for same procedure and time range.
+
+        Properties are merged only into GetObservation, whose response names
+        the property of each value. parse_result assigns values of GetResult
+        to properties by order, so a GetResult is shared only for same properties.
+
+        """
+        key = (func.__name__, procedure, tuple(time_range), format)
+        mergeable = func is get_observation
+        with self._inflight_lock:
+            flights = self._inflight.setdefault(key, [])
+            for flight in flights:
+                if not mergeable:
+                    if flight.properties == list(properties):
+                        break
+                    continue
+                if all(prop in flight.properties for prop in properties):
+                    break
+                if not flight.issued:
+                    # merge properties into request not sent yet
+                    flight.properties.extend(prop for prop in properties
+                                             if prop not in flight.properties)
+                    break
+            else:
+                flight = None
+
+            leader = flight is None
+            if leader:
+                flight = _Flight(properties)
+                flights.append(flight)
+            else:
+                flight.callers += 1
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+        else:
+            if self.coalesce_window:
+                time.sleep(self.coalesce_window)
+            with self._inflight_lock:
+                flight.issued = True
+            try:
+                operation = 'GetObservation' if func is get_observation else 'GetResult'
+                flight.result = self._run(operation, procedure, _strict, func, procedure,
+                                          flight.properties, time_range, format)
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._inflight_lock:
+                    flights.remove(flight)
+                    if not flights:
+                        del self._inflight[key]
+                flight.done.set()
+
+        if flight.error is not None:
+            raise flight.error
+        if flight.callers == 1:
+            return flight.result
+        # each caller gets its own copy with its properties
+        return select_properties(flight.result, properties, format)
+
+    def _get_window(self, func, procedure, properties, time_range, format, errors=None):
+        begin = time.time()
+        try:
+            measurements = self._call(func, procedure, properties, time_range, format)
+        except ExceptionReportError as e:
+            print(e)
+            if errors is not None:
+                errors.append(e)
+            measurements = to_columnar({}, properties) if format == 'columnar' else {}
+        return time.time() - begin, measurements
+
+    def _get_data(self, func, offering, properties, time_range, window, max_workers,
+                  format, use_cache):
+        """execute GetObservation/GetResult (func) through the cache if it is enabled.
 
+        """
+        _check_format(format)
+        procedure = self._get_procedure(offering)
+        if self.cache is None or not use_cache or len(time_range) != 2:
+            return self._fetch(func, procedure, properties, time_range, window, max_workers,
+                               format)
+
+        operation = func.__name__
+        measurements = self.cache.load(operation, procedure, properties, time_range)
+        for gap in self.cache.missing(operation, procedure, properties, time_range):
+            errors = []
+            fetched = self._fetch(func, procedure, properties, gap, window, max_workers, 'dict',
+                                  errors)
+            if not errors:
+                # the gap is fetched again next time if the server returned exception
+                self.cache.store(operation, procedure, properties, gap, fetched)
+            merge_measurements(measurements, fetched)
+
+        if format == 'columnar':
+            return to_columnar(measurements, properties)
+        return measurements
+
+    def _fetch(self, func, procedure, properties, time_range, window, max_workers, format,
+               errors=None):
+        """execute GetObservation/GetResult (func), splitting long time range
+           into sub-windows fetched concurrently if window is specified.
+
+        ows:Exception in a response is printed and the (sub-)window has no
+        measurements, ExceptionReportError is appended to errors if it is given.
 
-    def get_observation(self, offering, properties, time_range):
+        """
+        if window is None or len(time_range) != 2:
+            return self._get_window(func, procedure, properties, time_range, format,
+                                    errors)[1]
+
+        if not isinstance(window, AdaptiveWindow):
+            # fixed size, update() cannot change it
+            window = AdaptiveWindow(window, min_size=window, max_size=window)
+
+        measurements = {}
+        results = []
+        (cursor, end) = time_range
+        with _thread_pool(max_workers) as executor:
+            pending = {}
+            while cursor < end or pending:
+                while cursor < end and len(pending) < max_workers:
+                    sub_range = window.split(cursor, end)
+                    future = executor.submit(self._get_window, func, procedure,
+                                             properties, sub_range, format, errors)
+                    pending[future] = sub_range
+                    cursor = sub_range[1]
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sub_range = pending.pop(future)
+                    (elapsed, result) = future.result()
+                    window.update(sub_range[1] - sub_range[0], elapsed, count_samples(result))
+                    if format == 'columnar':
+                        results.append(result)
+                    else:
+                        merge_measurements(measurements, result)
+
+        if format == 'columnar':
+            return concat_columnar(results)
+        return measurements
+
+    def get_observation(self, offering, properties, time_range, window=None, max_workers=4,
+                        format='dict', use_cache=True):
         """execute GetObservation operation in context of the SOSServer instance.
 
         Args:
@@ -646,18 +3819,70 @@ class SOSServer(object):
                                              SOSName, procedure.
           properties (list): list of observed properties. (str) ex. 'air_temperature'
           time_range (list): has 2 datetime object, start time and end time.
+          window (timedelta/AdaptiveWindow): if specified, time_range is split into
+                                             sub-windows of this size and they are
+                                             fetched concurrently. AdaptiveWindow adjusts
+                                             the size from previous responses.
+          max_workers (int): max number of sub-windows fetched concurrently
+          format (str): 'dict' or 'columnar'
+          use_cache (bool): False to bypass the cache of the instance
 
         Returns:
-          dict: has datetime object as key and result (dict) as value.
+          dict: (in dict format) has datetime object as key and result (dict) as value.
                 result (dict) has observed property as key and value (dict) as value.
                 value (dict) has 'value' (value)  and 'uom' (unit name)
+          ColumnarMeasurements: (in columnar format)
+        """
+        return self._get_data(get_observation, offering, properties, time_range,
+                              window, max_workers, format, use_cache)
+
+
+    def iter_observation(self, offering, properties, time_range):
+        """execute GetObservation operation in context of the SOSServer instance,
+           and read its response as a stream.
+
+        Args:
+          offering (Observation object/str): observation offering (sensor node)
+                                             if offering is str, it is treated as
+                                             SOSName, procedure.
+          properties (list): list of observed properties. (str) ex. 'air_temperature'
+          time_range (list): has 2 datetime object, start time and end time.
+
+        Yields:
+          (datetime, str, dict): datetime, observed property and value (dict)
+                                 which has 'value' (value) and 'uom' (unit name)
+        """
+        procedure = self._get_procedure(offering)
+        return self._run_iter('GetObservation', procedure, iter_observation,
+                              procedure, properties, time_range)
+
+
+    def aggregate_observation(self, offering, properties, time_range, size, step=None,
+                              functions=('mean',)):
+        """execute GetObservation operation and aggregate its response stream
+           in time windows, without holding raw samples.
+
+        Args:
+          offering (Observation object/str): observation offering (sensor node)
+                                             if offering is str, it is treated as
+                                             SOSName, procedure.
+          properties (list): list of observed properties. (str) ex. 'air_temperature'
+          time_range (list): has 2 datetime object, start time and end time.
+          size (timedelta): length of a window
+          step (timedelta): interval of window starts, None for tumbling windows
+          functions (list): aggregate functions, 'mean', 'min', 'max', 'count' and 'last'
+
+        Yields:
+          (str, datetime, dict): observed property, start of window and results which has
+                                 aggregate function as key. windows not entirely in
+                                 time_range are not yielded.
         """
-        return get_observation(self._get_api_url(),
-                               self._get_procedure(offering),
-                               properties, time_range)
+        return aggregate_observations(self.iter_observation(offering, properties, time_range),
+                                      size, step, functions, time_range)
 
 
-    def get_result(self, offering, properties, time_range):
+    def get_result(self, offering, properties, time_range, window=None, max_workers=4,
+                   format='dict', use_cache=True):
         """execute GetResult operation in context of the SOSServer instance.
 
         Args:
@@ -666,41 +3891,362 @@ class SOSServer(object):
                                              SOSName, procedure.
           properties (list): list of observed properties. (str) ex. 'air_temperature'
           time_range (list): has 2 datetime object, start time and end time.
+          window (timedelta/AdaptiveWindow): if specified, time_range is split into
+                                             sub-windows of this size and they are
+                                             fetched concurrently. AdaptiveWindow adjusts
+                                             the size from previous responses.
+          max_workers (int): max number of sub-windows fetched concurrently
+          format (str): 'dict' or 'columnar'
+          use_cache (bool): False to bypass the cache of the instance
 
         Returns:
-          dict: has datetime object as key and result (dict) as value.
+          dict: (in dict format) has datetime object as key and result (dict) as value.
                 result (dict) has observed property as key and value (dict) as value.
                 value (dict) has 'value' (value)  and 'uom' (unit name)
+          ColumnarMeasurements: (in columnar format)
 
         Note:
           cloudSense SOS server accepts multiple observed properties for GetResult,
           but in the specification it is not allowed.
 
         """
-        return get_result(self._get_api_url(),
-                          self._get_procedure(offering),
-                          properties, time_range)
+        return self._get_data(get_result, offering, properties, time_range,
+                              window, max_workers, format, use_cache)
 
 
-    def insert_observation(self, offering, measurements):
-        return insert_observation(self._get_api_url(),
-                                  self._get_procedure(offering),
-                                  measurements)
+    def iter_many(self, func, offerings, max_workers=8):
+        """call func for each offering in a bounded thread pool.
 
-    def describe_sensor(self, offering):
-        return describe_sensor(self._get_api_url(), self._get_procedure(offering))
+        Args:
+          func (callable): called as func(offering) in a worker thread
+          offerings (list): list of Observation object/str
+          max_workers (int): max number of concurrent calls
+
+        Yields:
+          (str, object, Exception): procedure of the offering, result of func and
+                                    exception raised by func (None if succeeded),
+                                    in order of completion.
+
+        """
+        with _thread_pool(max_workers) as executor:
+            futures = {}
+            for offering in offerings:
+                futures[executor.submit(func, offering)] = self._get_procedure(offering)
+            for future in as_completed(futures):
+                procedure = futures[future]
+                try:
+                    yield procedure, future.result(), None
+                except Exception as e:
+                    yield procedure, None, e
+
+
+    def get_observations_many(self, offerings, properties, time_range, max_workers=8):
+        """execute GetObservation operation for multiple offerings concurrently.
+
+        At most max_workers requests are in flight at the same time.
+        Connections beyond pool_size are closed after use, so pool_size should
+        be as large as max_workers to keep all of them alive.
+
+        Args:
+          offerings (list): list of Observation object/str (sensor nodes)
+          properties (list): list of observed properties. (str) ex. 'air_temperature'
+                             if None, all properties of each offering (Observation object)
+          time_range (list): has 2 datetime object, start time and end time.
+          max_workers (int): max number of concurrent requests
+
+        Returns:
+          (dict, dict): 1st dict has procedure as key and measurements (dict) as value,
+                        same as get_observation returns.
+                        2nd dict has procedure as key and exception raised for it as value.
+
+        Examples:
+          results, errors = server.get_observations_many(server.observations,
+                                                         ['air_temperature'],
+                                                         [datetime(2017, 1, 1, 0, 0, 0),
+                                                          datetime(2017, 1, 1, 0, 10, 0)])
+        """
+        def get(offering):
+            props = offering.properties if properties is None else properties
+            return self.get_observation(offering, props, time_range)
+
+        results = {}
+        errors = {}
+        for procedure, measurements, error in self.iter_many(get, offerings, max_workers):
+            if error is None:
+                results[procedure] = measurements
+            else:
+                errors[procedure] = error
+        return results, errors
+
+
+    def poll(self, offerings, properties, interval, start=None, checkpoint=None,
+             max_workers=8, lag=timedelta(hours=1)):
+        """execute GetObservation operation for offerings periodically,
+           and yields only samples newer than already seen.
+
+        The last timestamp seen is remembered for each procedure and observed property,
+        and each request covers the time range after it, so samples uploaded late
+        are requested again. For a property without new samples, the time range
+        goes back at most lag before the end of the previous poll, so it does not
+        grow while the property is quiet.
+        If checkpoint is specified, the state is saved into the file after each poll,
+        and polling restarted with the file resumes from it. Samples yielded in a poll
+        interrupted before saving the state are yielded again.
+
+        Args:
+          offerings (list): list of Observation object/str (sensor nodes)
+          properties (list): list of observed properties. (str) ex. 'air_temperature'
+                             if None, all properties of each offering (Observation object)
+          interval (float): seconds between polls
+          start (datetime): start time for procedure and observed property never seen.
+                            if None, it is interval before the first poll.
+          checkpoint (str): path of the file to save the state
+          max_workers (int): max number of concurrent requests
+          lag (timedelta): how late samples can be uploaded to be caught
+
+        Yields:
+          (str, dict, Exception): procedure, new measurements (dict) same as
+                                  get_observation returns and exception raised for
+                                  the procedure (None if succeeded)
+
+        Examples:
+          for procedure, measurements, error in server.poll(server.observations,
+                                                            ['air_temperature'], 60,
+                                                            checkpoint='poll.json'):
+              if error is None:
+                  store(procedure, measurements)
+        """
+        offerings = list(offerings)
+        last_seen = load_poll_checkpoint(checkpoint, self.endpoint) if checkpoint else {}
+        if start is None:
+            start = datetime.now().replace(microsecond=0) - timedelta(seconds=interval)
+        # end of the previous poll, None for the first poll
+        polled = [None]
+
+        def get(offering, end):
+            props = offering.properties if properties is None else properties
+            seen = last_seen.get(self._get_procedure(offering), {})
+            # timestamps have no fraction of seconds
+            sinces = [seen[prop] + timedelta(seconds=1) if prop in seen else start
+                      for prop in props]
+            if polled[0] is not None:
+                sinces = [max(since, polled[0] - lag) for since in sinces]
+            since = min(sinces or [end])
+            if not props or since > end:
+                return props, {}
+            return props, self.get_observation(offering, props, [since, end],
+                                               use_cache=False)
+
+        while True:
+            started = time.time()
+            end = datetime.now().replace(microsecond=0)
+            results = self.iter_many(lambda offering: get(offering, end), offerings,
+                                     max_workers)
+            for procedure, outcome, error in results:
+                if error is not None:
+                    yield procedure, None, error
+                    continue
+
+                (props, measurements) = outcome
+                seen = last_seen.setdefault(procedure, {})
+                new_measurements = {}
+                for dt, measure in measurements.items():
+                    for prop, value in measure.items():
+                        if prop in props and (prop not in seen or dt > seen[prop]):
+                            if dt not in new_measurements:
+                                new_measurements[dt] = {}
+                            new_measurements[dt][prop] = value
+                for dt, measure in new_measurements.items():
+                    for prop in measure:
+                        seen[prop] = max(seen[prop], dt) if prop in seen else dt
+                yield procedure, new_measurements, None
+            polled[0] = end
+
+            if checkpoint:
+                save_poll_checkpoint(checkpoint, last_seen, self.endpoint)
+            time.sleep(max(0.0, interval - (time.time() - started)))
+
+
+    def insert_observation(self, offering, measurements, chunked=False):
+        """execute InsertObservation operation in context of the SOSServer instance.
+
+        Args:
+          offering (Observation object/str): observation offering (sensor node)
+                                             if offering is str, it is treated as
+                                             SOSName, procedure.
+          measurements (dict/iterable): measurements dict, or
+                                        (datetime, property, value) tuples
+          chunked (bool): send request body with chunked transfer encoding
+                          while writing it
+
+        Returns:
+          str: result of insertion, ex. 'Inserted'
+        """
+        procedure = self._get_procedure(offering)
+        return self._run('InsertObservation', procedure, insert_observation,
+                         procedure, measurements, chunked, self.compress_requests)
+
+    def _insert_batch(self, procedure, status, measurements):
+        try:
+            status.result = self._run('InsertObservation', procedure, insert_observation,
+                                      procedure, measurements, False, self.compress_requests)
+        except Exception as e:
+            status.error = e
+        return status
+
+    def insert_observations_many(self, offering, measurements, batch_size=500,
+                                 max_in_flight=4):
+        """execute InsertObservation operation in batches of fixed size concurrently.
+
+        measurements are read lazily, at most max_in_flight batches are sent
+        at the same time and only them are held in memory.
+
+        Args:
+          offering (Observation object/str): observation offering (sensor node)
+                                             if offering is str, it is treated as
+                                             SOSName, procedure.
+          measurements (iterable): (datetime, property, value) tuples, value is dict
+                                   which has 'value' (str) and 'uom' (unit name).
+                                   iter_measurements makes them from measurements dict.
+          batch_size (int): max number of samples in a batch
+          max_in_flight (int): max number of batches sent concurrently
+
+        Returns:
+          list: list of BatchStatus, in order of batches
 
-    def update_capabilities(self):
+        Examples:
+          statuses = server.insert_observations_many('TESTDEV:Field:Sensor',
+                                                     iter_measurements(measurements))
+          failed = [status for status in statuses if not status.succeeded]
+        """
+        procedure = self._get_procedure(offering)
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+        futures = []
+
+        def send(batch, count, first, last):
+            status = BatchStatus(len(futures), count, (first, last))
+            in_flight.acquire()
+            future = executor.submit(self._insert_batch, procedure, status, batch)
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append(future)
+
+        with _thread_pool(max_in_flight) as executor:
+            batch = {}
+            count = 0
+            first = last = None
+            for (dt, prop, value) in measurements:
+                if dt not in batch:
+                    batch[dt] = {}
+                batch[dt][prop] = value
+                count += 1
+                first = dt if first is None else min(first, dt)
+                last = dt if last is None else max(last, dt)
+                if count >= batch_size:
+                    send(batch, count, first, last)
+                    batch = {}
+                    count = 0
+                    first = last = None
+            if count:
+                send(batch, count, first, last)
+
+        return [future.result() for future in futures]
+
+    def describe_sensor(self, offering):
+        procedure = self._get_procedure(offering)
+        return self._run('DescribeSensor', procedure, describe_sensor, procedure)
+
+    def _refresh_catalog(self, catalog_path):
+        catalog = Catalog(*self.get_capabilities())
+        if catalog_path is not None:
+            save_catalog(catalog_path, catalog, self.endpoint)
+        self.catalog = catalog
+
+    def _refresh_catalog_in_background(self, catalog_path):
+        try:
+            self._refresh_catalog(catalog_path)
+        except Exception as e:
+            # keep using current catalog
+            print('failed to refresh capabilities: %s' % (e))
+
+    def update_capabilities(self, catalog_path=None, ttl=3600):
         """execute GetCapabilities operation and holds its result in the instance.
            
           This updates server, provider, operations, filters, observations of the instance.
 
+          If catalog_path is specified, the result is saved into the file and
+          it is loaded at next time instead of executing GetCapabilities.
+          When the saved one is older than ttl, it is used until GetCapabilities
+          executed in background (refresh_thread) replaces it.
+
+        Args:
+          catalog_path (str): path of the file to save the result
+          ttl (float): seconds the saved result is fresh
+
+        """
+        catalog = None
+        if catalog_path is not None:
+            catalog = load_catalog(catalog_path, self.endpoint)
+
+        if catalog is None:
+            self._refresh_catalog(catalog_path)
+            return
+
+        self.catalog = catalog
+        if time.time() - catalog.fetched > ttl:
+            self.refresh_thread = threading.Thread(target=self._refresh_catalog_in_background,
+                                                   args=(catalog_path,))
+            # a slow server does not keep the process alive at exit,
+            # the saved catalog is replaced atomically or not at all
+            self.refresh_thread.daemon = True
+            self.refresh_thread.start()
+
+    def get_offering(self, name):
+        """returns Observation (offering) which has the name or procedure.
+
+        Returns:
+          Observation: None if not found
+
+        """
+        return self.catalog.by_name.get(name) or self.catalog.by_procedure.get(name)
+
+    def find_offerings(self, pattern):
+        """returns Observations (offerings) whose name or procedure matches pattern.
+
+        Args:
+          pattern (str): exact name/procedure, or glob pattern such as 'Weather*'
+
+        Returns:
+          list: list of Observation
+
+        """
+        return self.catalog.find(pattern)
+
+    def offerings_with_property(self, prop):
+        """returns Observations (offerings) which observe the property.
+
+        Returns:
+          list: list of Observation
+
+        """
+        return list(self.catalog.by_property.get(prop, {}).values())
+
+    def has_property(self, offering, prop):
+        """returns True if the offering observes the property."""
+        return self._get_procedure(offering) in self.catalog.by_property.get(prop, {})
+
+    def load_capabilities(self, catalog_path):
+        """loads result of GetCapabilities saved by update_capabilities, without
+           executing GetCapabilities.
+
+        Returns:
+          bool: True if it is loaded
+
         """
-        (self.server,
-         self.provider,
-         self.operations,
-         self.filters,
-         self.observations) = self.get_capabilities()
+        catalog = load_catalog(catalog_path, self.endpoint)
+        if catalog is None:
+            return False
+        self.catalog = catalog
+        return True
 
 
 if __name__ == '__main__':
@@ -0,0 +1,436 @@
+#! /usr/bin/env python
+# -*- coding:utf-8 -*-
+"""asyncio variant of OGC SOS API module
+
+This module provides AsyncSOSServer class, which has same operations as
+ogcsosapi.SOSServer but does not block the event loop.
+Request XML is built and response XML is parsed by functions of ogcsosapi,
+only transport is replaced by asyncio streams.
+
+It requires Python 3.5 or later.
+
+"""
+import asyncio
+import time
+from io import BytesIO
+from urllib.parse import urlsplit
+from urllib.error import HTTPError
+from xml.etree.ElementTree import tostring, ParseError
+
+import ogcsosapi
+from ogcsosapi import (SOSServer, default_ogc_namespaces, TransferMetrics, decode_content,
+                       render_get_capabilities_request, render_get_observation_request,
+                       render_get_result_request, build_insert_observation_request,
+                       render_describe_sensor_request,
+                       parse_response, parse_capabilities, parse_result,
+                       parse_insert_observation_response,
+                       iter_parse_observations, collect_measurements)
+
+
+class AsyncConnectionPool(object):
+    """a pool of persistent HTTP/1.1 (keep-alive) connections per host for asyncio.
+
+    Args:
+      maxsize (int): max number of idle connections kept for each host
+      idle_timeout (float): idle connections older than this (seconds) are not reused
+
+    Attributes:
+      hits (int): number of requests sent on a reused connection
+      misses (int): number of requests which needed a new connection
+
+    """
+    def __init__(self, maxsize=10, idle_timeout=60.0):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.hits = 0
+        self.misses = 0
+        self._idle = {}
+
+    async def get_connection(self, key):
+        """returns ((reader, writer), True if it is reused) for the host key."""
+        now = time.time()
+        idle = self._idle.get(key)
+        while idle:
+            conn, last_used = idle.pop()
+            if now - last_used < self.idle_timeout and not conn[0].at_eof():
+                self.hits += 1
+                return conn, True
+            conn[1].close()
+        self.misses += 1
+        scheme, host, port = key
+        if scheme == 'https':
+            conn = await asyncio.open_connection(host, port or 443, ssl=True)
+        else:
+            conn = await asyncio.open_connection(host, port or 80)
+        return conn, False
+
+    def put_connection(self, key, conn):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.maxsize:
+            idle.append((conn, time.time()))
+        else:
+            conn[1].close()
+
+    def clear(self):
+        """closes all idle connections."""
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn[1].close()
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by server')
+        elms = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        status = int(elms[1])
+        reason = elms[2] if len(elms) > 2 else ''
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # skip trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b''.join(chunks)
+            keep_alive = True
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+            keep_alive = True
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        if headers.get('connection', '').lower() == 'close':
+            keep_alive = False
+        return status, reason, headers, body, keep_alive
+
+    async def request(self, url, body, headers, metrics=None):
+        """sends POST request on a pooled connection and reads whole response.
+
+        Args:
+          url (str): URL of API
+          body (bytes): request body
+          headers (dict): request headers
+          metrics (TransferMetrics): counts bytes and decode time if specified
+
+        Returns:
+          bytes: response body, decompressed if it has Content-Encoding
+
+        Raises:
+          HTTPError: when the server responds with error status.
+
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        host = parts.netloc.rpartition('@')[2]
+
+        lines = ['POST %s HTTP/1.1' % (path),
+                 'Host: %s' % (host),
+                 'Content-Length: %d' % (len(body))]
+        for name, value in headers.items():
+            lines.append('%s: %s' % (name, value))
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        while True:
+            conn, reused = await self.get_connection(key)
+            reader, writer = conn
+            try:
+                writer.write(head + body)
+                await writer.drain()
+                (status, reason, resp_headers,
+                 resp_body, keep_alive) = await self._read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused:
+                    raise
+                # the server has closed the idle connection, try again with another one
+                continue
+            except BaseException:
+                # cancelled (e.g. by timeout) or broken response in the middle of
+                # the exchange, the connection can not be reused
+                writer.close()
+                raise
+            break
+
+        # the whole response has been read, the connection is ready for next request
+        if keep_alive:
+            self.put_connection(key, conn)
+        else:
+            writer.close()
+
+        received = len(resp_body)
+        begin = time.time()
+        resp_body = decode_content(resp_body, resp_headers.get('content-encoding'))
+        if metrics is not None:
+            metrics.add(requests=1, bytes_sent=len(body), bytes_received=received,
+                        bytes_decoded=len(resp_body), decode_time=time.time() - begin)
+
+        if status >= 400:
+            raise HTTPError(url, status, reason, resp_headers, BytesIO(resp_body))
+        return resp_body
+
+
+class AsyncSOSServer(object):
+    """a class represents SOS Server, for asyncio.
+
+    It has same operations as SOSServer, as coroutines.
+
+    Args:
+      endpoint (str): SOS API endpoint on the server
+      token (str): Token to use SOS API on the server
+      is_token_header (bool): send token by Authorization header instead of URL parameter
+      pool_size (int): max number of keep-alive connections kept per host
+      idle_timeout (float): keep-alive connections idle longer than this (seconds)
+                            are not reused
+      max_concurrency (int): max number of requests in flight at the same time
+      timeout (float): timeout (seconds) of each request, None for no timeout
+      retry (RetryPolicy): if specified, idempotent requests (all operations except
+                           InsertObservation) are retried by it.
+      breaker (CircuitBreaker): if specified, requests fail fast by it
+                                while the endpoint keeps failing.
+      accept_encoding (bool): accept gzip/deflate compressed responses
+
+    Attributes:
+      metrics (TransferMetrics): bytes on wire and time for compression
+                                 of all requests of the instance.
+
+    Examples:
+      async def main():
+          server = AsyncSOSServer('https://sos.foo.com/api', 'XXXXXXXX')
+          await server.update_capabilities()
+          results, errors = await server.get_observations_many(
+              server.observations, ['air_temperature'],
+              [datetime(2017, 1, 1, 0, 0, 0), datetime(2017, 1, 1, 0, 10, 0)])
+
+      asyncio.get_event_loop().run_until_complete(main())
+
+    """
+
+    def __init__(self, endpoint, token, is_token_header=False,
+                 pool_size=10, idle_timeout=60.0, max_concurrency=100,
+                 timeout=None, retry=None, breaker=None, accept_encoding=True):
+        self.endpoint = endpoint
+        self.token = token
+        self.server = None
+        self.provider = None
+        self.operations = []
+        self.filters = []
+        self.observations = []
+        self.is_token_header = is_token_header
+        self.pool = AsyncConnectionPool(pool_size, idle_timeout)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retry = retry
+        self.breaker = breaker
+        self.accept_encoding = accept_encoding
+        self.metrics = TransferMetrics()
+        self._semaphore = None
+
+    _get_procedure = staticmethod(SOSServer._get_procedure)
+
+    def _get_api_url(self):
+        if not self.is_token_header and self.token:
+            return { 'url' : '%s?Key=%s' % (self.endpoint, self.token) }
+        else:
+            return { 'url'    : self.endpoint,
+                     'header' : { 'Authorization' : self.token } }
+
+    @staticmethod
+    def _is_transient(error, check):
+        # asyncio errors are not OSError before Python 3.11
+        return isinstance(error, (asyncio.TimeoutError, asyncio.IncompleteReadError)) or \
+               check(error)
+
+    async def _send(self, url, req_body, headers):
+        request = self.pool.request(url['url'], req_body, headers, self.metrics)
+        if self.timeout is not None:
+            request = asyncio.wait_for(request, self.timeout)
+        try:
+            return await request
+        except HTTPError as e:
+            print(e.code, e.reason)
+            print(e.read())
+            raise
+
+    async def _request(self, req_body, verbose=False, idempotent=True):
+        if ogcsosapi.debug or verbose:
+            print(req_body)
+
+        url = self._get_api_url()
+        headers = {'content-type' : 'application/xml; charset="utf-8"'}
+        if 'header' in url:
+            headers.update(url['header'])
+        if self.accept_encoding:
+            headers['accept-encoding'] = 'gzip, deflate'
+
+        if self._semaphore is None:
+            # created lazily to be bound to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        policy = self.retry if idempotent else None
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_request()
+            try:
+                async with self._semaphore:
+                    resp_body = await self._send(url, req_body, headers)
+            except Exception as e:
+                if self.breaker is not None:
+                    if self._is_transient(e, self.breaker.is_failure):
+                        self.breaker.record_failure()
+                    else:
+                        # the server responded (e.g. 4xx), it is not down
+                        self.breaker.record_success()
+                if (policy is None or attempt + 1 >= policy.max_attempts or
+                    not self._is_transient(e, policy.is_retriable)):
+                    raise
+                delay = policy.delay(attempt)
+                policy.record_retry(delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            break
+
+        if ogcsosapi.debug or verbose:
+            print(resp_body)
+        return resp_body
+
+    async def _call(self, req_body, verbose=False, idempotent=True):
+        resp_body = await self._request(req_body, verbose, idempotent)
+        try:
+            return parse_response(resp_body)
+        except ParseError:
+            # some response seems to be illegal.
+            return resp_body, None
+
+    async def get_capabilities(self):
+        """execute GetCapabilities operation in context of the AsyncSOSServer instance.
+
+        Returns:
+          (Server, Provider, list of Operation (str), list of Filter (str), list of Observation)
+
+        """
+        (resp_root, namespaces) = await self._call(render_get_capabilities_request())
+        return parse_capabilities(resp_root, namespaces)
+
+    async def get_observation(self, offering, properties, time_range):
+        """execute GetObservation operation in context of the AsyncSOSServer instance.
+
+        Args:
+          offering (Observation object/str): observation offering (sensor node)
+                                             if offering is str, it is treated as
+                                             SOSName, procedure.
+          properties (list): list of observed properties. (str) ex. 'air_temperature'
+          time_range (list): has 2 datetime object, start time and end time.
+
+        Returns:
+          dict: has datetime object as key and result (dict) as value.
+                result (dict) has observed property as key and value (dict) as value.
+                value (dict) has 'value' (value)  and 'uom' (unit name)
+        """
+        req_body = render_get_observation_request(self._get_procedure(offering),
+                                                  properties, time_range)
+        resp_body = await self._request(req_body)
+        return collect_measurements(iter_parse_observations(BytesIO(resp_body)))
+
+    async def get_result(self, offering, properties, time_range):
+        """execute GetResult operation in context of the AsyncSOSServer instance.
+
+        Args:
+          offering (Observation object/str): observation offering (sensor node)
+                                             if offering is str, it is treated as
+                                             SOSName, procedure.
+          properties (list): list of observed properties. (str) ex. 'air_temperature'
+          time_range (list): has 2 datetime object, start time and end time.
+
+        Returns:
+          dict: has datetime object as key and result (dict) as value.
+                result (dict) has observed property as key and value (dict) as value.
+                value (dict) has 'value' (value)  and 'uom' (unit name)
+        """
+        req_body = render_get_result_request(self._get_procedure(offering),
+                                             properties, time_range)
+        (resp_root, namespaces) = await self._call(req_body)
+        return parse_result(resp_root, namespaces, properties)
+
+    async def insert_observation(self, offering, measurements):
+        req = build_insert_observation_request(self._get_procedure(offering),
+                                               measurements, default_ogc_namespaces())
+        (resp_root, namespaces) = await self._call(tostring(req, 'utf-8'), idempotent=False)
+        return parse_insert_observation_response(resp_root, namespaces)
+
+    async def describe_sensor(self, offering):
+        req_body = render_describe_sensor_request(self._get_procedure(offering))
+        await self._call(req_body, verbose=True)
+        return None
+
+    async def get_observations_many(self, offerings, properties, time_range):
+        """execute GetObservation operation for multiple offerings concurrently.
+
+        At most max_concurrency requests are in flight at the same time.
+
+        Args:
+          offerings (list): list of Observation object/str (sensor nodes)
+          properties (list): list of observed properties. (str) ex. 'air_temperature'
+                             if None, all properties of each offering (Observation object)
+          time_range (list): has 2 datetime object, start time and end time.
+
+        Returns:
+          (dict, dict): 1st dict has procedure as key and measurements (dict) as value,
+                        same as get_observation returns.
+                        2nd dict has procedure as key and exception raised for it as value.
+        """
+        async def get_observation(offering):
+            # an offering without properties fails alone, not whole of them
+            props = offering.properties if properties is None else properties
+            return await self.get_observation(offering, props, time_range)
+
+        offerings = list(offerings)
+        outcomes = await asyncio.gather(*[get_observation(offering) for offering in offerings],
+                                        return_exceptions=True)
+
+        results = {}
+        errors = {}
+        for offering, outcome in zip(offerings, outcomes):
+            procedure = self._get_procedure(offering)
+            if isinstance(outcome, Exception):
+                errors[procedure] = outcome
+            else:
+                results[procedure] = outcome
+        return results, errors
+
+    async def update_capabilities(self):
+        """execute GetCapabilities operation and holds its result in the instance.
+
+          This updates server, provider, operations, filters, observations of the instance.
+
+        """
+        (self.server,
+         self.provider,
+         self.operations,
+         self.filters,
+         self.observations) = await self.get_capabilities()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,1536 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from datetime import datetime, timedelta
+from io import BytesIO
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from xml.etree.ElementTree import fromstring, tostring
+
+import ogcsos_shell
+import ogcsosapi
+from ogcsosapi import (SOSServer, AdaptiveWindow, ObservationCache, Observation,
+                       RetryPolicy, CircuitBreaker, CircuitOpenError, ExceptionReportError,
+                       HTTPError, URLError)
+from ogcsos_mockserver import MockSOSServer, EPOCH
+try:
+    import asyncio
+    from ogcsosapi_async import AsyncSOSServer
+except (ImportError, SyntaxError):
+    # python 2
+    AsyncSOSServer = None
+
+PROPERTIES = ['air_temperature', 'relative_humidity']
+TIME_RANGE = [datetime(2017, 1, 1, 0, 0, 0), datetime(2017, 1, 1, 0, 59, 0)]
+
+
+class MockServerTest(unittest.TestCase):
+    """base of tests against MockSOSServer, which runs while tests of the class run."""
+    mock_options = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mock = MockSOSServer(**cls.mock_options)
+        cls.mock.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.mock.stop()
+
+    def setUp(self):
+        self.procedure = MockSOSServer.procedure(0)
+        self.server = SOSServer(self.mock.endpoint, 'token')
+        # idle connections of the pool are left open otherwise
+        self.addCleanup(lambda: self.server.pool.clear())
+
+    def expected(self, procedure, properties, time_range):
+        """returns measurements dict the mock server has in the time range."""
+        measurements = {}
+        # samples are aligned to step
+        step = timedelta(seconds=self.mock.step)
+        dt = EPOCH + step * int(math.ceil((time_range[0] - EPOCH).total_seconds() /
+                                          self.mock.step))
+        while dt <= time_range[1]:
+            measurements[dt] = dict((prop, {'value' : self.mock.value(procedure, prop, dt),
+                                            'uom' : self.mock.uoms[prop]})
+                                    for prop in properties)
+            dt += step
+        return measurements
+
+    def observation_response(self, procedure, properties, time_range):
+        """returns GetObservation response body the mock server responds."""
+        req_body = ogcsosapi.render_get_observation_request(procedure, properties, time_range)
+        return self.mock.render_GetObservation(fromstring(req_body)).encode('utf-8')
+
+
+class ConnectionPoolTest(MockServerTest):
+    def get_observation(self):
+        return self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE)
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            self.assertEqual(self.get_observation(),
+                             self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertEqual(self.server.pool.misses, 1)
+        self.assertEqual(self.server.pool.hits, 2)
+
+    def test_idle_timeout(self):
+        self.server.pool.idle_timeout = 0.0
+        for _ in range(2):
+            self.get_observation()
+        self.assertEqual(self.server.pool.misses, 2)
+        self.assertEqual(self.server.pool.hits, 0)
+
+    def test_closed_connection_is_replaced(self):
+        self.get_observation()
+        for conns in self.server.pool._idle.values():
+            for conn, _ in conns:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(self.get_observation(),
+                         self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertEqual(self.server.pool.misses, 2)
+
+
+class StreamingDecoderTest(MockServerTest):
+    def test_iter_observation(self):
+        observations = self.server.iter_observation(self.procedure, PROPERTIES, TIME_RANGE)
+        self.assertEqual(ogcsosapi.collect_measurements(observations),
+                         self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+
+    def test_same_as_tree_parser(self):
+        resp_body = self.observation_response(self.procedure, PROPERTIES, TIME_RANGE)
+        (resp_root, namespaces) = ogcsosapi.parse_response(resp_body)
+        elems = resp_root.findall(ogcsosapi.get_cn_tag('.//om:OM_Observation', namespaces))
+        self.assertEqual(list(ogcsosapi.iter_parse_observations(BytesIO(resp_body))),
+                         [ogcsosapi.parse_observation(elem, namespaces) for elem in elems])
+
+    def test_elements_are_cleared(self):
+        resp_body = self.observation_response(self.procedure, PROPERTIES, TIME_RANGE)
+        elems = [elem for elem, _ in ogcsosapi.iter_observation_elements(BytesIO(resp_body))]
+        self.assertEqual(len(elems), 60 * len(PROPERTIES))
+        self.assertEqual([len(elem) for elem in elems], [0] * len(elems))
+
+    def test_exception_report(self):
+        resp_body = self.mock.render_exception('InvalidParameterValue').encode('utf-8')
+        self.assertEqual(list(ogcsosapi.iter_parse_observations(BytesIO(resp_body))), [])
+        elements = ogcsosapi.iter_observation_elements(BytesIO(resp_body), strict=True)
+        self.assertRaises(ExceptionReportError, list, elements)
+
+
+class ManyNodesTest(MockServerTest):
+    mock_options = {'nodes' : 6, 'latency' : 0.2}
+
+    def test_get_observations_many(self):
+        procedures = [MockSOSServer.procedure(i) for i in range(6)]
+        begin = time.time()
+        (results, errors) = self.server.get_observations_many(procedures, PROPERTIES,
+                                                              TIME_RANGE, max_workers=6)
+        # requests are in flight at the same time
+        self.assertLess(time.time() - begin, 0.2 * 3)
+        self.assertEqual(errors, {})
+        self.assertEqual(results, dict((procedure,
+                                        self.expected(procedure, PROPERTIES, TIME_RANGE))
+                                       for procedure in procedures))
+
+    def test_properties_of_offerings(self):
+        self.server.update_capabilities()
+        offerings = self.server.observations[:2] + [MockSOSServer.procedure(2)]
+        (results, errors) = self.server.get_observations_many(offerings, None, TIME_RANGE)
+        # str offering has no properties, it fails alone
+        self.assertEqual(list(errors), [MockSOSServer.procedure(2)])
+        for offering in offerings[:2]:
+            self.assertEqual(results[offering.procedure],
+                             self.expected(offering.procedure, offering.properties,
+                                           TIME_RANGE))
+
+
+@unittest.skipIf(AsyncSOSServer is None, 'asyncio client requires python 3.5 or later')
+class AsyncClientTest(MockServerTest):
+    mock_options = {'nodes' : 3, 'latency' : 0.05}
+
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.server = AsyncSOSServer(self.mock.endpoint, 'token')
+
+    def run_async(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            self.server.pool.clear()
+            # closed transports are released in next iteration
+            loop.run_until_complete(asyncio.sleep(0.01))
+            loop.close()
+
+    def test_get_observation(self):
+        async def get_twice():
+            return [await self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE)
+                    for _ in range(2)]
+        for measurements in self.run_async(get_twice()):
+            self.assertEqual(measurements,
+                             self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertEqual((self.server.pool.misses, self.server.pool.hits), (1, 1))
+
+    def test_get_observations_many(self):
+        procedures = [MockSOSServer.procedure(i) for i in range(3)]
+        (results, errors) = self.run_async(
+            self.server.get_observations_many(procedures, PROPERTIES, TIME_RANGE))
+        self.assertEqual(errors, {})
+        self.assertEqual(results, dict((procedure,
+                                        self.expected(procedure, PROPERTIES, TIME_RANGE))
+                                       for procedure in procedures))
+
+    def test_offering_without_properties(self):
+        (results, errors) = self.run_async(
+            self.server.get_observations_many([self.procedure], None, TIME_RANGE))
+        self.assertEqual(results, {})
+        self.assertIsInstance(errors[self.procedure], AttributeError)
+
+    def test_timeout_closes_connection(self):
+        self.server.timeout = 0.01
+        self.assertRaises(asyncio.TimeoutError, self.run_async,
+                          self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertEqual(self.server.pool._idle, {})
+
+
+class WindowTest(MockServerTest):
+    time_range = [datetime(2017, 1, 1, 0, 0, 0), datetime(2017, 1, 2, 0, 0, 0)]
+
+    def get_observation(self, window):
+        requests = self.mock.counts.get('GetObservation', 0)
+        measurements = self.server.get_observation(self.procedure, PROPERTIES, self.time_range,
+                                                   window=window)
+        self.assertEqual(measurements,
+                         self.expected(self.procedure, PROPERTIES, self.time_range))
+        return self.mock.counts['GetObservation'] - requests
+
+    def test_fixed_window(self):
+        self.assertEqual(self.get_observation(timedelta(hours=1)), 24)
+
+    def test_adaptive_window(self):
+        window = AdaptiveWindow(timedelta(hours=1))
+        self.assertLess(self.get_observation(window), 24)
+        self.assertGreater(window.size, timedelta(hours=1))
+
+    def test_adaptive_window_update(self):
+        window = AdaptiveWindow(timedelta(hours=1), min_size=timedelta(minutes=40),
+                                max_size=timedelta(hours=3), target_time=1.0,
+                                target_samples=1000)
+        # a slow response halves the size at most
+        window.update(timedelta(hours=1), 10.0, 10)
+        self.assertEqual(window.size, timedelta(minutes=40))
+        # too many samples
+        window.update(timedelta(hours=2), 0.1, 2000)
+        self.assertEqual(window.size, timedelta(hours=1))
+        # a fast and small response doubles the size at most
+        window.update(timedelta(hours=2), 0.1, 10)
+        self.assertEqual(window.size, timedelta(hours=3))
+        self.assertEqual(window.split(self.time_range[0], self.time_range[0] +
+                                      timedelta(hours=1)),
+                         [self.time_range[0], self.time_range[0] + timedelta(hours=1)])
+
+
+class ColumnarTest(MockServerTest):
+    @unittest.skipIf(ogcsosapi.np is None, 'requires numpy')
+    def test_get_observation(self):
+        expected = self.expected(self.procedure, PROPERTIES, TIME_RANGE)
+        measurements = self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE,
+                                                   format='columnar')
+        self.assertEqual(measurements.properties, PROPERTIES)
+        self.assertEqual(len(measurements), len(expected))
+        self.assertEqual(measurements.to_dict(), expected)
+
+    @unittest.skipIf(ogcsosapi.np is None, 'requires numpy')
+    def test_windows(self):
+        measurements = self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE,
+                                                   window=timedelta(minutes=7),
+                                                   format='columnar')
+        self.assertEqual(measurements.to_dict(),
+                         self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+
+    @unittest.skipIf(ogcsosapi.np is None, 'requires numpy')
+    def test_to_columnar(self):
+        expected = self.expected(self.procedure, PROPERTIES, TIME_RANGE)
+        # a property without sample is a column of NaN
+        columnar = ogcsosapi.to_columnar(expected, PROPERTIES + ['wind_speed'])
+        self.assertTrue(ogcsosapi.np.isnan(columnar.values['wind_speed']).all())
+        self.assertEqual(columnar.to_dict(), expected)
+
+    @unittest.skipIf(ogcsosapi.np is not None, 'numpy is installed')
+    def test_requires_numpy(self):
+        self.assertRaises(ImportError, self.server.get_observation, self.procedure,
+                          PROPERTIES, TIME_RANGE, format='columnar')
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, self.server.get_observation, self.procedure,
+                          PROPERTIES, TIME_RANGE, format='pandas')
+
+
+class CacheTest(MockServerTest):
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.cache = ObservationCache(':memory:')
+        self.server = SOSServer(self.mock.endpoint, 'token', cache=self.cache)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def get_observation(self, properties, time_range):
+        """returns number of requests sent to get measurements."""
+        requests = self.mock.counts.get('GetObservation', 0)
+        measurements = self.server.get_observation(self.procedure, properties, time_range)
+        self.assertEqual(measurements, self.expected(self.procedure, properties, time_range))
+        return self.mock.counts.get('GetObservation', 0) - requests
+
+    def test_hit(self):
+        self.assertEqual(self.get_observation(PROPERTIES, TIME_RANGE), 1)
+        self.assertEqual(self.get_observation(PROPERTIES, TIME_RANGE), 0)
+        self.assertEqual(self.get_observation(PROPERTIES[:1],
+                                              [TIME_RANGE[0], TIME_RANGE[0] +
+                                               timedelta(minutes=10)]), 0)
+
+    def test_gap_filling(self):
+        half = [TIME_RANGE[0] + timedelta(minutes=20), TIME_RANGE[0] + timedelta(minutes=40)]
+        self.get_observation(PROPERTIES, half)
+        self.assertEqual(self.cache.missing('get_observation', self.procedure, PROPERTIES,
+                                            TIME_RANGE),
+                         [[TIME_RANGE[0], half[0]], [half[1], TIME_RANGE[1]]])
+        self.assertEqual(self.get_observation(PROPERTIES, TIME_RANGE), 2)
+        self.assertEqual(self.cache.missing('get_observation', self.procedure, PROPERTIES,
+                                            TIME_RANGE), [])
+
+    def test_new_property(self):
+        self.get_observation(PROPERTIES[:1], TIME_RANGE)
+        self.assertEqual(self.get_observation(PROPERTIES, TIME_RANGE), 1)
+        self.assertEqual(self.get_observation(PROPERTIES, TIME_RANGE), 0)
+
+    def test_future_is_not_covered(self):
+        now = datetime.now().replace(microsecond=0)
+        time_range = [now - timedelta(minutes=10), now + timedelta(minutes=10)]
+        self.get_observation(PROPERTIES, time_range)
+        self.assertEqual(len(self.cache.missing('get_observation', self.procedure,
+                                                PROPERTIES, time_range)), 1)
+
+    def test_exception_is_not_cached(self):
+        self.mock.render_GetObservation = \
+            lambda root: self.mock.render_exception('NoApplicableCode')
+        try:
+            self.assertEqual(self.server.get_observation(self.procedure, PROPERTIES,
+                                                         TIME_RANGE), {})
+        finally:
+            del self.mock.render_GetObservation
+        self.assertEqual(self.get_observation(PROPERTIES, TIME_RANGE), 1)
+
+    def test_max_samples(self):
+        self.cache.max_samples = 60
+        self.get_observation(PROPERTIES, [TIME_RANGE[0],
+                                          TIME_RANGE[0] + timedelta(minutes=29)])
+        time.sleep(0.01)
+        self.get_observation(PROPERTIES, [TIME_RANGE[0] + timedelta(minutes=30),
+                                          TIME_RANGE[1]])
+        # older samples are evicted with their coverage
+        self.assertEqual(self.cache.missing('get_observation', self.procedure, PROPERTIES,
+                                            TIME_RANGE),
+                         [[TIME_RANGE[0], TIME_RANGE[0] + timedelta(minutes=30)]])
+
+
+class CatalogTest(MockServerTest):
+    mock_options = {'nodes' : 5}
+
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'catalog.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def update_capabilities(self, server, ttl=3600):
+        """returns number of GetCapabilities requests sent to update."""
+        requests = self.mock.counts.get('GetCapabilities', 0)
+        server.update_capabilities(self.path, ttl)
+        if server.refresh_thread is not None:
+            server.refresh_thread.join()
+        return self.mock.counts.get('GetCapabilities', 0) - requests
+
+    def test_save_and_load(self):
+        self.assertEqual(self.update_capabilities(self.server), 1)
+        server = SOSServer(self.mock.endpoint, 'token')
+        self.assertEqual(self.update_capabilities(server), 0)
+        self.assertIsNone(server.refresh_thread)
+        self.assertEqual(server.server.to_dict(), self.server.server.to_dict())
+        self.assertEqual(server.provider.to_dict(), self.server.provider.to_dict())
+        self.assertEqual(server.operations, self.server.operations)
+        self.assertEqual([observation.to_dict() for observation in server.observations],
+                         [observation.to_dict() for observation in self.server.observations])
+        self.assertIs(server.get_offering('Node-0003'), server.observations[3])
+
+    def test_other_endpoint(self):
+        self.update_capabilities(self.server)
+        self.assertIsNone(ogcsosapi.load_catalog(self.path, 'http://localhost/other'))
+        self.assertFalse(SOSServer('http://localhost/other', 'token').load_capabilities(
+            self.path))
+
+    def test_refresh_after_ttl(self):
+        self.update_capabilities(self.server)
+        fetched = self.server.catalog.fetched
+        time.sleep(0.01)
+        server = SOSServer(self.mock.endpoint, 'token')
+        self.addCleanup(server.pool.clear)
+        self.assertEqual(self.update_capabilities(server, ttl=0), 1)
+        self.assertTrue(server.refresh_thread.daemon)
+        self.assertGreater(server.catalog.fetched, fetched)
+        self.assertGreater(ogcsosapi.load_catalog(self.path, self.mock.endpoint).fetched,
+                           fetched)
+
+    def test_assign_observations(self):
+        self.server.update_capabilities()
+        observation = Observation(name='Extra', procedure='MOCK:Field:Extra',
+                                  properties=['rainfall'])
+        self.server.observations = self.server.observations + [observation]
+        self.assertIs(self.server.get_offering('Extra'), observation)
+        self.assertEqual(self.server.offerings_with_property('rainfall'), [observation])
+        self.assertEqual(len(self.server.find_offerings('Node-*')), 5)
+
+
+class LookupTest(MockServerTest):
+    mock_options = {'nodes' : 12, 'properties' : 3}
+
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.server.update_capabilities()
+
+    def names(self, observations):
+        return [observation.name for observation in observations]
+
+    def test_find(self):
+        self.assertEqual(self.names(self.server.find_offerings('Node-0003')), ['Node-0003'])
+        self.assertEqual(self.names(self.server.find_offerings('MOCK:Field:Node-0003')),
+                         ['Node-0003'])
+        self.assertEqual(self.server.find_offerings('Node-9999'), [])
+        # in order of the catalog
+        self.assertEqual(self.names(self.server.find_offerings('Node-001*')),
+                         ['Node-0010', 'Node-0011'])
+        self.assertEqual(self.names(self.server.find_offerings('Node-000[31]')),
+                         ['Node-0001', 'Node-0003'])
+        self.assertEqual(self.names(self.server.find_offerings('*:Node-000?'))[:2],
+                         ['Node-0000', 'Node-0001'])
+        self.assertEqual(len(self.server.find_offerings('?ode-*')), 12)
+
+    def test_properties(self):
+        self.assertEqual(len(self.server.offerings_with_property('air_pressure')), 12)
+        self.assertEqual(self.server.offerings_with_property('wind_speed'), [])
+        self.assertTrue(self.server.has_property(self.procedure, 'air_temperature'))
+        self.assertFalse(self.server.has_property(self.procedure, 'wind_speed'))
+
+    def test_shell(self):
+        self.assertEqual(self.names(ogcsos_shell.get_nodes_from_pattern('2', self.server)),
+                         ['Node-0001'])
+        self.assertEqual(self.names(ogcsos_shell.get_nodes_from_pattern('Node-0002',
+                                                                        self.server)),
+                         ['Node-0002'])
+        self.assertEqual(len(ogcsos_shell.get_nodes_from_pattern('Node-*', self.server)), 12)
+        self.assertEqual(ogcsos_shell.get_nodes_from_pattern('99', self.server), [])
+        node = self.server.observations[0]
+        self.assertEqual(ogcsos_shell.get_props_from_names_or_numbers(
+            ['2', 'air_pressure'], node, self.server), ['relative_humidity', 'air_pressure'])
+        self.assertIsNone(ogcsos_shell.get_props_from_names_or_numbers(
+            ['wind_speed'], node, self.server))
+
+
+class InsertTest(MockServerTest):
+    def measurements(self, count):
+        return dict((TIME_RANGE[0] + timedelta(minutes=i),
+                     {'air_temperature' : {'value' : '%.1f' % (20.0 + i % 10), 'uom' : 'Cel'}})
+                    for i in range(count))
+
+    def assertInserted(self, result):
+        # the mock server responds without namespace definition as the real server,
+        # the result is raw body
+        self.assertIn(b'<sos:observation>Inserted</sos:observation>', result)
+
+    def test_insert_observation(self):
+        measurements = self.measurements(10)
+        self.assertInserted(self.server.insert_observation(self.procedure, measurements))
+        self.assertInserted(self.server.insert_observation(self.procedure, measurements,
+                                                           chunked=True))
+        self.server.compress_requests = True
+        self.assertInserted(self.server.insert_observation(self.procedure, measurements))
+
+    def test_insert_observations_many(self):
+        requests = self.mock.counts.get('InsertObservation', 0)
+        statuses = self.server.insert_observations_many(
+            self.procedure, ogcsosapi.iter_measurements(self.measurements(125)),
+            batch_size=50, max_in_flight=2)
+        self.assertEqual(self.mock.counts['InsertObservation'] - requests, 3)
+        self.assertEqual([status.index for status in statuses], [0, 1, 2])
+        self.assertEqual([status.count for status in statuses], [50, 50, 25])
+        for status in statuses:
+            self.assertTrue(status.succeeded)
+            self.assertInserted(status.result)
+        self.assertEqual(statuses[0].time_range[0], TIME_RANGE[0])
+        self.assertEqual(statuses[-1].time_range[1], TIME_RANGE[0] + timedelta(minutes=124))
+
+
+class InsertSerializerTest(unittest.TestCase):
+    procedure = 'TEST:Field:<Node & "1">'
+
+    def setUp(self):
+        self.measurements = {}
+        for i in range(50):
+            dt = TIME_RANGE[0] + timedelta(minutes=i)
+            self.measurements[dt] = {
+                'air_temperature' : {'value' : '%.1f' % (20.0 + i % 10), 'uom' : 'Cel'},
+                'note & <comment>' : {'value' : 'a < b & "c"', 'uom' : '"quoted"\t\r\n'},
+            }
+
+    def built(self, measurements, namespaces):
+        return tostring(ogcsosapi.build_insert_observation_request(
+            self.procedure, measurements, namespaces), 'utf-8')
+
+    def test_same_as_builder(self):
+        namespaces = ogcsosapi.default_ogc_namespaces()
+        self.assertEqual(b''.join(ogcsosapi.iter_insert_observation_body(self.procedure,
+                                                                          self.measurements)),
+                         self.built(self.measurements, namespaces))
+        del namespaces['xmlns:fes']
+        self.assertEqual(b''.join(ogcsosapi.iter_insert_observation_body(
+            self.procedure, self.measurements, namespaces)),
+                         self.built(self.measurements, namespaces))
+
+    def test_chunks(self):
+        chunks = list(ogcsosapi.iter_insert_observation_body(
+            self.procedure, ogcsosapi.iter_measurements(self.measurements), chunk_size=1024))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(b''.join(chunks),
+                         self.built(self.measurements, ogcsosapi.default_ogc_namespaces()))
+
+    def test_numbers(self):
+        observations = [(TIME_RANGE[0], 'air_temperature', {'value' : 20.5, 'uom' : 'Cel'})]
+        expected = {TIME_RANGE[0] : {'air_temperature' : {'value' : '20.5', 'uom' : 'Cel'}}}
+        self.assertEqual(b''.join(ogcsosapi.iter_insert_observation_body(self.procedure,
+                                                                          observations)),
+                         self.built(expected, ogcsosapi.default_ogc_namespaces()))
+
+
+class TemplateTest(unittest.TestCase):
+    procedure = 'TEST:Field:<Node & "1">'
+    properties = ['air_temperature', 'a < b & "c"']
+
+    def assertSameAsBuilder(self, render, build, *args):
+        namespaces = ogcsosapi.default_ogc_namespaces()
+        self.assertEqual(render(*args), tostring(build(*(args + (namespaces,))), 'utf-8'))
+        del namespaces['xmlns:fes']
+        namespaces['xmlns:foo'] = 'http://example.com/"foo"'
+        self.assertEqual(render(*(args + (namespaces,))),
+                         tostring(build(*(args + (namespaces,))), 'utf-8'))
+
+    def test_get_observation(self):
+        for time_range in (TIME_RANGE, TIME_RANGE[:1]):
+            self.assertSameAsBuilder(ogcsosapi.render_get_observation_request,
+                                     ogcsosapi.build_get_observation_request,
+                                     self.procedure, self.properties, time_range)
+
+    def test_get_result(self):
+        for time_range in (TIME_RANGE, TIME_RANGE[:1]):
+            self.assertSameAsBuilder(ogcsosapi.render_get_result_request,
+                                     ogcsosapi.build_get_result_request,
+                                     self.procedure, self.properties, time_range)
+
+    def test_get_capabilities(self):
+        self.assertSameAsBuilder(ogcsosapi.render_get_capabilities_request,
+                                 ogcsosapi.build_get_capabitilies_request)
+
+    def test_describe_sensor(self):
+        self.assertSameAsBuilder(ogcsosapi.render_describe_sensor_request,
+                                 ogcsosapi.build_describe_sensor_request, self.procedure)
+
+
+class XPathTest(MockServerTest):
+    def parse_observations(self, resp_body):
+        return list(ogcsosapi.iter_parse_observations(BytesIO(resp_body)))
+
+    def test_paths_resolved_once(self):
+        resp_body = self.observation_response(self.procedure, PROPERTIES, TIME_RANGE)
+        (resp_root, namespaces) = ogcsosapi.parse_response(resp_body)
+        elems = resp_root.findall(ogcsosapi.get_cn_tag('.//om:OM_Observation', namespaces))
+        paths = ogcsosapi._observation_paths(namespaces)
+        self.assertEqual([ogcsosapi.parse_observation(elem, namespaces, paths)
+                          for elem in elems],
+                         [ogcsosapi.parse_observation(elem, namespaces) for elem in elems])
+
+    def test_namespaces_declared_later(self):
+        resp_body = self.observation_response(self.procedure, PROPERTIES, TIME_RANGE)
+        # om is declared by each observation, not by the root
+        moved = resp_body.replace(b' xmlns:om="http://www.opengis.net/om/2.0"', b'')
+        moved = moved.replace(b'<om:OM_Observation ',
+                              b'<om:OM_Observation xmlns:om="http://www.opengis.net/om/2.0" ')
+        self.assertEqual(self.parse_observations(moved), self.parse_observations(resp_body))
+
+    def test_capabilities(self):
+        resp_body = self.mock.render_GetCapabilities(None).encode('utf-8')
+        observations = ogcsosapi.parse_capabilities(*ogcsosapi.parse_response(resp_body))[4]
+        self.assertEqual(len(observations), self.mock.nodes)
+        for i, observation in enumerate(observations):
+            self.assertEqual(observation.name, 'Node-%04d' % (i))
+            self.assertEqual(observation.procedure, MockSOSServer.procedure(i))
+            self.assertEqual(observation.description, 'Mock sensor node %d' % (i))
+            self.assertEqual(observation.properties, tuple(self.mock.uoms))
+            self.assertEqual(observation.location, ('%.4f %.4f' % (35.0 + i * 0.001,
+                                                                   139.0 + i * 0.001),) * 2)
+            self.assertEqual(observation.time_range[0], '2017-01-01T00:00:00.000+09:00')
+
+
+class ResultDecoderTest(MockServerTest):
+    text = ('\n2017-01-01T00:00:00+09:00,20.5\n2017-01-01T00:01:00+09:00,21\n'
+            'illegal line\n 2017-01-01T00:00:00+09:00 , -1.5e1\n'
+            '2017-01-01T00:01:00+09:00,60.25\n\n')
+    expected_samples = [(datetime(2017, 1, 1, 0, 0), 0, 20.5),
+                        (datetime(2017, 1, 1, 0, 1), 0, 21.0),
+                        (datetime(2017, 1, 1, 0, 0), 1, -15.0),
+                        (datetime(2017, 1, 1, 0, 1), 1, 60.25)]
+
+    def expected_result(self, properties, time_range):
+        measurements = self.expected(self.procedure, properties, time_range)
+        for measure in measurements.values():
+            for value in measure.values():
+                # GetResult response has no unit
+                value['uom'] = ''
+        return measurements
+
+    def test_get_result(self):
+        self.assertEqual(self.server.get_result(self.procedure, PROPERTIES, TIME_RANGE),
+                         self.expected_result(PROPERTIES, TIME_RANGE))
+
+    @unittest.skipIf(ogcsosapi.np is None, 'requires numpy')
+    def test_get_result_columnar(self):
+        measurements = self.server.get_result(self.procedure, PROPERTIES, TIME_RANGE,
+                                              format='columnar')
+        self.assertEqual(measurements.to_dict(), self.expected_result(PROPERTIES, TIME_RANGE))
+
+    def test_python_decoder(self):
+        (times, prop_ids, values) = ogcsosapi._decode_result_values_python(self.text)
+        self.assertEqual(list(zip(times, prop_ids, values)), self.expected_samples)
+
+    @unittest.skipIf(ogcsosapi.np is None, 'requires numpy')
+    def test_numpy_decoder(self):
+        (times, prop_ids, values) = ogcsosapi._decode_result_values_numpy(self.text)
+        self.assertEqual(list(zip(times.astype(object).tolist(), prop_ids.tolist(),
+                                  values.tolist())), self.expected_samples)
+        for text in ('', '\n\n'):
+            self.assertEqual(len(ogcsosapi._decode_result_values_numpy(text)[0]), 0)
+
+    def test_parse_result(self):
+        resp_body = ('<sos:GetResultResponse xmlns:sos="http://www.opengis.net/sos/2.0">'
+                     '<sos:resultValues>%s</sos:resultValues></sos:GetResultResponse>' %
+                     (self.text)).encode('utf-8')
+        measurements = ogcsosapi.parse_result(*(ogcsosapi.parse_response(resp_body) +
+                                                (['a', 'b'],)))
+        self.assertEqual(measurements, {
+            datetime(2017, 1, 1, 0, 0) : {'a' : {'value' : 20.5, 'uom' : ''},
+                                          'b' : {'value' : -15.0, 'uom' : ''}},
+            datetime(2017, 1, 1, 0, 1) : {'a' : {'value' : 21.0, 'uom' : ''},
+                                          'b' : {'value' : 60.25, 'uom' : ''}}})
+
+
+class PollTest(MockServerTest):
+    mock_options = {'nodes' : 2, 'step' : 10}
+
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.procedures = [MockSOSServer.procedure(i) for i in range(2)]
+        self.start = datetime.now().replace(microsecond=0) - timedelta(minutes=5)
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'poll.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def poll(self, poller):
+        """returns new measurements of each procedure in a poll."""
+        polled = {}
+        for _ in self.procedures:
+            (procedure, measurements, error) = next(poller)
+            self.assertIsNone(error)
+            polled[procedure] = measurements
+        return polled
+
+    def assertNoOverlap(self, polled, other):
+        for procedure, measurements in polled.items():
+            self.assertEqual(set(measurements) & set(other[procedure]), set())
+
+    def test_new_samples_only(self):
+        poller = self.server.poll(self.procedures, PROPERTIES, 0.01, start=self.start)
+        first = self.poll(poller)
+        for procedure in self.procedures:
+            self.assertEqual(first[procedure],
+                             self.expected(procedure, PROPERTIES,
+                                           [self.start, max(first[procedure])]))
+        time.sleep(1.0)
+        self.assertNoOverlap(self.poll(poller), first)
+        poller.close()
+
+    def test_resume_from_checkpoint(self):
+        poller = self.server.poll(self.procedures, PROPERTIES, 0.01, start=self.start,
+                                  checkpoint=self.checkpoint)
+        first = self.poll(poller)
+        # the state is saved after the poll
+        next(poller)
+        poller.close()
+        last_seen = ogcsosapi.load_poll_checkpoint(self.checkpoint, self.mock.endpoint)
+        for procedure in self.procedures:
+            self.assertEqual(last_seen[procedure],
+                             dict((prop, max(first[procedure])) for prop in PROPERTIES))
+        self.assertEqual(ogcsosapi.load_poll_checkpoint(self.checkpoint, 'http://other/'), {})
+
+        poller = self.server.poll(self.procedures, PROPERTIES, 0.01, start=self.start,
+                                  checkpoint=self.checkpoint)
+        self.assertNoOverlap(self.poll(poller), first)
+        poller.close()
+
+    def test_quiet_property(self):
+        time_ranges = []
+        get_observation = self.server.get_observation
+
+        def recording_get_observation(offering, properties, time_range, **kwds):
+            time_ranges.append(time_range)
+            return get_observation(offering, properties, time_range, **kwds)
+
+        self.server.get_observation = recording_get_observation
+        lag = timedelta(seconds=30)
+        # the mock server has no sample of rainfall
+        poller = self.server.poll(self.procedures[:1], ['air_temperature', 'rainfall'], 0.01,
+                                  start=self.start, lag=lag)
+        for _ in range(3):
+            next(poller)
+        poller.close()
+        self.assertEqual(time_ranges[0][0], self.start)
+        # the time range does not go back to start for rainfall
+        for prev, time_range in zip(time_ranges, time_ranges[1:]):
+            self.assertEqual(time_range[0], prev[1] - lag)
+
+    def test_errors(self):
+        poller = self.server.poll(self.procedures + ['MOCK:Field:Unknown'], None, 0.01)
+        errors = dict((procedure, error) for (procedure, _, error) in
+                      [next(poller) for _ in range(3)])
+        poller.close()
+        # str offering has no properties
+        self.assertIsInstance(errors['MOCK:Field:Unknown'], AttributeError)
+
+
+class SingleFlightTest(MockServerTest):
+    mock_options = {'latency' : 0.2}
+
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.server = SOSServer(self.mock.endpoint, 'token', coalesce_window=0.05)
+
+    def call_concurrently(self, operation, properties_list):
+        """returns (results in order of properties_list, number of requests sent)."""
+        name = 'GetObservation' if operation == 'get_observation' else 'GetResult'
+        requests = self.mock.counts.get(name, 0)
+        results = [None] * len(properties_list)
+
+        def call(i):
+            results[i] = getattr(self.server, operation)(self.procedure, properties_list[i],
+                                                         TIME_RANGE)
+
+        threads = [threading.Thread(target=call, args=(i,))
+                   for i in range(len(properties_list))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, self.mock.counts[name] - requests
+
+    def test_same_query(self):
+        (results, requests) = self.call_concurrently('get_observation', [PROPERTIES] * 4)
+        self.assertEqual(requests, 1)
+        self.assertEqual(self.server.coalesced, 3)
+        for measurements in results:
+            self.assertEqual(measurements,
+                             self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+
+    def test_properties_are_merged(self):
+        properties_list = [PROPERTIES[:1], PROPERTIES[1:], PROPERTIES]
+        (results, requests) = self.call_concurrently('get_observation', properties_list)
+        self.assertEqual(requests, 1)
+        for properties, measurements in zip(properties_list, results):
+            self.assertEqual(measurements,
+                             self.expected(self.procedure, properties, TIME_RANGE))
+
+    def test_get_result_is_shared_for_same_properties(self):
+        (results, requests) = self.call_concurrently('get_result', [PROPERTIES] * 2)
+        self.assertEqual(requests, 1)
+        self.assertEqual(results[0], results[1])
+        (results, requests) = self.call_concurrently('get_result',
+                                                     [PROPERTIES[:1], PROPERTIES[1:]])
+        self.assertEqual(requests, 2)
+        self.assertEqual([list(measure) for measure in results[0].values()],
+                         [PROPERTIES[:1]] * len(results[0]))
+        self.assertEqual([list(measure) for measure in results[1].values()],
+                         [PROPERTIES[1:]] * len(results[1]))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def send(self, error=None):
+        def _send():
+            if error is not None:
+                raise error
+            return 'ok'
+        return ogcsosapi._with_retry({'breaker' : self.breaker}, False, _send)
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+
+    def open_circuit(self):
+        self.assertRaises(URLError, self.send, URLError('down'))
+        self.assertTrue(self.breaker.is_open)
+        self.assertRaises(CircuitOpenError, self.send)
+        time.sleep(0.02)
+
+    def test_half_open_success_closes(self):
+        self.open_circuit()
+        self.assertEqual(self.send(), 'ok')
+        self.assertFalse(self.breaker.is_open)
+
+    def test_half_open_failure_opens_again(self):
+        self.open_circuit()
+        self.assertRaises(URLError, self.send, URLError('down'))
+        self.assertTrue(self.breaker.is_open)
+        self.assertRaises(CircuitOpenError, self.send)
+
+    def test_half_open_client_error_closes(self):
+        self.open_circuit()
+        error = HTTPError('http://localhost/', 400, 'Bad Request', {}, None)
+        self.assertRaises(HTTPError, self.send, error)
+        self.assertFalse(self.breaker.is_open)
+        for _ in range(3):
+            self.assertEqual(self.send(), 'ok')
+        self.assertEqual(self.breaker.rejected, 1)
+
+
+class RetryTest(MockServerTest):
+    def fail(self, operation, count):
+        """makes the mock server drop connections of next count requests of operation."""
+        render = getattr(self.mock, 'render_' + operation)
+        failures = [count]
+
+        def flaky_render(root):
+            if failures[0] > 0:
+                failures[0] -= 1
+                raise RuntimeError('mock failure')
+            return render(root)
+
+        setattr(self.mock, 'render_' + operation, flaky_render)
+        self.addCleanup(delattr, self.mock, 'render_' + operation)
+
+    def test_retry(self):
+        self.server.retry = RetryPolicy(max_attempts=3, backoff=0.001)
+        self.fail('GetObservation', 2)
+        self.assertEqual(self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE),
+                         self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertEqual(self.server.retry.retries, 2)
+
+    def test_give_up(self):
+        self.server.retry = RetryPolicy(max_attempts=2, backoff=0.001)
+        self.fail('GetObservation', 2)
+        self.assertRaises(Exception, self.server.get_observation, self.procedure,
+                          PROPERTIES, TIME_RANGE)
+        self.assertEqual(self.server.retry.retries, 1)
+
+    def test_insert_is_not_retried(self):
+        self.server.retry = RetryPolicy(max_attempts=3, backoff=0.001)
+        self.fail('InsertObservation', 1)
+        measurements = {TIME_RANGE[0] : {'air_temperature' : {'value' : '20.0', 'uom' : 'Cel'}}}
+        self.assertRaises(Exception, self.server.insert_observation, self.procedure,
+                          measurements)
+        self.assertEqual(self.server.retry.retries, 0)
+
+    def test_breaker_opens_for_dead_endpoint(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        endpoint = 'http://127.0.0.1:%d/sos' % (sock.getsockname()[1])
+        sock.close()
+        server = SOSServer(endpoint, 'token',
+                           breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        for _ in range(2):
+            self.assertRaises((URLError, socket.error), server.get_observation,
+                              self.procedure, PROPERTIES, TIME_RANGE)
+        self.assertRaises(CircuitOpenError, server.get_observation, self.procedure,
+                          PROPERTIES, TIME_RANGE)
+        self.assertEqual((server.breaker.trips, server.breaker.rejected), (1, 1))
+
+
+class GzipTest(MockServerTest):
+    mock_options = {'compression' : 'gzip'}
+
+    def test_operations(self):
+        self.assertEqual(self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE),
+                         self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertEqual(self.server.get_result(self.procedure, PROPERTIES, TIME_RANGE),
+                         self.server.get_result(self.procedure, PROPERTIES, TIME_RANGE))
+        self.server.update_capabilities()
+        self.assertEqual(len(self.server.observations), self.mock.nodes)
+        self.assertLess(self.server.metrics.compression_ratio, 0.5)
+
+    def test_not_accepted(self):
+        self.server.accept_encoding = False
+        self.assertEqual(self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE),
+                         self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertEqual(self.server.metrics.compression_ratio, 1.0)
+
+
+class DeflateTest(GzipTest):
+    mock_options = {'compression' : 'deflate'}
+
+
+class DecodingResponseTest(unittest.TestCase):
+    body = b''.join([b'<value>%d</value>' % (i) for i in range(5000)])
+
+    @staticmethod
+    def compress(body, wbits):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+        return compressor.compress(body) + compressor.flush()
+
+    def encoded(self):
+        # gzip, zlib and raw deflate (sent as deflate by some servers)
+        return [('gzip', self.compress(self.body, 16 + zlib.MAX_WBITS)),
+                ('deflate', self.compress(self.body, zlib.MAX_WBITS)),
+                ('deflate', self.compress(self.body, -zlib.MAX_WBITS)),
+                (None, self.body)]
+
+    def read_all(self, resp, amt):
+        chunks = []
+        while True:
+            chunk = resp.read(amt)
+            if not chunk:
+                return b''.join(chunks)
+            self.assertLessEqual(len(chunk), amt)
+            chunks.append(chunk)
+
+    def test_read(self):
+        for encoding, data in self.encoded():
+            metrics = ogcsosapi.TransferMetrics()
+            resp = ogcsosapi.DecodingResponse(BytesIO(data), encoding, metrics)
+            self.assertEqual(self.read_all(resp, 100), self.body)
+            self.assertEqual((metrics.bytes_received, metrics.bytes_decoded),
+                             (len(data), len(self.body)))
+            self.assertEqual(ogcsosapi.DecodingResponse(BytesIO(data), encoding).read(),
+                             self.body)
+            self.assertEqual(ogcsosapi.decode_content(data, encoding), self.body)
+
+    def test_corrupted(self):
+        for encoding, data in self.encoded()[:3]:
+            # broken in the middle, not at the start
+            data = data[:len(data) // 2] + b'\xff' * 16 + data[len(data) // 2 + 16:]
+            resp = ogcsosapi.DecodingResponse(BytesIO(data), encoding)
+            self.assertRaises(zlib.error, self.read_all, resp, 100)
+
+    def test_truncated(self):
+        for encoding, data in self.encoded()[:2]:
+            self.assertRaises(zlib.error, ogcsosapi.decode_content, data[:-32], encoding)
+            resp = ogcsosapi.DecodingResponse(BytesIO(data[:-32]), encoding)
+            self.assertRaises(zlib.error, resp.read)
+
+
+class HookTest(MockServerTest):
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.records = []
+        self.server.add_hook(self.records.append)
+
+    def test_record(self):
+        self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE)
+        self.server.update_capabilities()
+        observation, capabilities = self.records
+        self.assertEqual((observation.operation, observation.procedure),
+                         ('GetObservation', self.procedure))
+        self.assertEqual(observation.observations, 60 * len(PROPERTIES))
+        self.assertEqual(observation.requests, 1)
+        self.assertGreater(observation.bytes_received, 0)
+        self.assertIsNone(observation.error)
+        for phase in ('build', 'send', 'wait', 'download', 'parse', 'convert'):
+            self.assertLessEqual(observation.phases[phase], observation.elapsed)
+        self.assertEqual((capabilities.operation, capabilities.procedure),
+                         ('GetCapabilities', None))
+        self.assertEqual(capabilities.observations, self.mock.nodes)
+
+    def test_error(self):
+        def render(root):
+            raise RuntimeError('mock failure')
+        self.mock.render_GetObservation = render
+        self.addCleanup(delattr, self.mock, 'render_GetObservation')
+        self.assertRaises(Exception, self.server.get_observation, self.procedure,
+                          PROPERTIES, TIME_RANGE)
+        self.assertEqual(len(self.records), 1)
+        self.assertIsNotNone(self.records[0].error)
+
+    def test_failing_hook(self):
+        def hook(record):
+            raise ValueError('broken hook')
+        self.server.hooks.insert(0, hook)
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            result = self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(result, self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertIn('broken hook', output.getvalue())
+        self.assertEqual(len(self.records), 1)
+
+    def test_histograms(self):
+        histograms = ogcsosapi.HistogramAggregator()
+        self.server.hooks = [histograms]
+        for i in range(3):
+            self.server.get_observation(MockSOSServer.procedure(i), PROPERTIES, TIME_RANGE)
+        self.server.update_capabilities()
+
+        summary = histograms.summary()
+        self.assertEqual(sorted(summary), ['GetCapabilities', 'GetObservation'])
+        stats = summary['GetObservation']
+        self.assertEqual((stats['count'], stats['errors'], stats['requests'],
+                          stats['observations']), (3, 0, 3, 3 * 60 * len(PROPERTIES)))
+        total = stats['phases']['total']
+        self.assertEqual(total['count'], 3)
+        self.assertLessEqual(total['p50'], total['p90'])
+        self.assertLessEqual(total['p90'], total['max'])
+        self.assertIn('GetObservation: 3 calls, 0 errors', histograms.report())
+        histograms.clear()
+        self.assertEqual(histograms.summary(), {})
+
+    def test_percentile(self):
+        histogram = ogcsosapi._Histogram()
+        for i in range(1, 101):
+            histogram.add(i / 1000.0)
+        # upper bound of a bucket, within 2 ** (1 / STEPS) of the value
+        for q in (0.5, 0.9, 0.99):
+            self.assertGreaterEqual(histogram.percentile(q), q * 0.1)
+            self.assertLessEqual(histogram.percentile(q), q * 0.1 * 2 ** 0.25)
+        self.assertEqual(histogram.percentile(1.0), 0.1)
+
+
+class MockSOSServerTest(MockServerTest):
+    mock_options = {'nodes' : 3, 'properties' : 2, 'step' : 300}
+
+    def test_capabilities(self):
+        self.server.update_capabilities()
+        self.assertEqual([o.procedure for o in self.server.observations],
+                         [MockSOSServer.procedure(i) for i in range(3)])
+        for observation in self.server.observations:
+            self.assertEqual(sorted(observation.properties), sorted(PROPERTIES))
+
+    def test_samples(self):
+        # samples are aligned to step, unknown properties and procedures have none
+        result = self.server.get_observation(self.procedure, PROPERTIES + ['unknown'],
+                                             TIME_RANGE)
+        self.assertEqual(sorted(result), [TIME_RANGE[0] + timedelta(minutes=m)
+                                          for m in range(0, 60, 5)])
+        self.assertEqual(result, self.expected(self.procedure, PROPERTIES, TIME_RANGE))
+        self.assertEqual(self.server.get_observation(MockSOSServer.procedure(99), PROPERTIES,
+                                                     TIME_RANGE), {})
+        self.assertEqual(self.mock.value(self.procedure, PROPERTIES[0], TIME_RANGE[0]),
+                         result[TIME_RANGE[0]][PROPERTIES[0]]['value'])
+
+    def test_time_instant(self):
+        url = self.server._get_api_url()
+        dt = TIME_RANGE[0] + timedelta(minutes=5)
+        self.assertEqual(list(ogcsosapi.get_observation(url, self.procedure, PROPERTIES, [dt])),
+                         [dt])
+        # latest sample
+        (latest,) = ogcsosapi.get_observation(url, self.procedure, PROPERTIES, [])
+        self.assertLessEqual(datetime.now() - latest, timedelta(seconds=600))
+
+    def test_counts(self):
+        counts = dict(self.mock.counts)
+        self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE)
+        self.server.get_result(self.procedure, PROPERTIES, TIME_RANGE)
+        self.server.get_result(self.procedure, PROPERTIES, TIME_RANGE)
+        self.assertEqual(self.mock.counts['GetObservation'], counts.get('GetObservation', 0) + 1)
+        self.assertEqual(self.mock.counts['GetResult'], counts.get('GetResult', 0) + 2)
+
+    def test_unknown_operation(self):
+        request = ogcsosapi.Request(self.mock.endpoint, data=b'<Unknown/>')
+        with self.assertRaises(HTTPError) as cm:
+            ogcsosapi.urlopen(request)
+        self.assertEqual(cm.exception.code, 400)
+        self.assertIn(b'OperationNotSupported', cm.exception.read())
+
+    def test_latency(self):
+        mock = MockSOSServer(nodes=1, latency=0.1)
+        mock.start()
+        self.addCleanup(mock.stop)
+        server = SOSServer(mock.endpoint, 'token')
+        self.addCleanup(server.pool.clear)
+        begin = time.time()
+        server.get_observation(self.procedure, PROPERTIES, TIME_RANGE)
+        self.assertGreaterEqual(time.time() - begin, 0.1)
+
+
+class BenchTest(unittest.TestCase):
+    def test_run(self):
+        # a few calls of every benchmark, against the mock server in another process
+        bench = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ogcsos_bench.py')
+        output = subprocess.check_output([sys.executable, bench, '-n', '10', '--calls', '2',
+                                          '--nodes', '2', '--samples', '20'],
+                                         universal_newlines=True)
+        for name in ('align', 'catalog', 'operations', 'parser', 'result', 'templates'):
+            self.assertIn('# %s' % (name), output)
+        for name in ('update_capabilities (cached)', 'aggregate_observation', 'poll',
+                     'get_observations_many', 'insert_observations_many'):
+            self.assertIn('\n%s ' % (name), output)
+
+
+class ExportTest(MockServerTest):
+    mock_options = {'nodes' : 4, 'step' : 600}
+    ARGS = '-n Node-000* -s 2017-01-01 -e 2017-01-03T12:00 -o %s'
+
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.server.update_capabilities()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export(self, args, *options):
+        """runs export command, returns its output."""
+        (stdout, stderr) = (sys.stdout, sys.stderr)
+        sys.stdout = output = StringIO()
+        sys.stderr = StringIO()
+        try:
+            ogcsos_shell.export_measurements(
+                (self.ARGS % (os.path.join(self.directory, args))).split() + list(options),
+                self.server)
+        finally:
+            (sys.stdout, sys.stderr) = (stdout, stderr)
+        return output.getvalue()
+
+    def read(self, *names):
+        with open(os.path.join(self.directory, *names)) as f:
+            return f.read()
+
+    def fail(self, name):
+        """makes get_observation of the node fail once."""
+        get_observation = self.server.get_observation
+        failures = [1]
+
+        def flaky_get_observation(node, *args, **kwds):
+            if ogcsos_shell.get_node_name(node) == name and failures[0] > 0:
+                failures[0] -= 1
+                raise IOError('mock failure')
+            return get_observation(node, *args, **kwds)
+
+        self.server.get_observation = flaky_get_observation
+
+    def test_chunks(self):
+        self.export('one', '--chunk', '10d')
+        self.export('chunked', '--chunk', '7h')
+        names = sorted(os.listdir(os.path.join(self.directory, 'one')))
+        self.assertEqual(names, ['Node-%04d.csv' % (i) for i in range(4)])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'chunked'))), names)
+        for name in names:
+            self.assertEqual(self.read('one', name), self.read('chunked', name))
+        # 2.5 days of 10 minutes
+        self.assertEqual(len(self.read('one', names[0]).splitlines()), 1 + 6 * 24 * 5 // 2 + 1)
+
+    def test_restart(self):
+        self.fail('Node-0002')
+        output = self.export('nodes')
+        self.assertIn('failed to export MOCK:Field:Node-0002', output)
+        names = sorted(os.listdir(os.path.join(self.directory, 'nodes')))
+        self.assertNotIn('Node-0002.csv', names)
+
+        count = self.mock.counts['GetObservation']
+        output = self.export('nodes')
+        self.assertIn('skip 3 nodes exported already', output)
+        # only the failed node is fetched again, 3 chunks of 1 day
+        self.assertEqual(self.mock.counts['GetObservation'] - count, 3)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'nodes'))),
+                         ['Node-%04d.csv' % (i) for i in range(4)])
+
+        # -f exports all again
+        count = self.mock.counts['GetObservation']
+        self.export('nodes', '-f')
+        self.assertEqual(self.mock.counts['GetObservation'] - count, 4 * 3)
+
+    def test_merge(self):
+        self.export('nodes')
+        self.fail('Node-0001')
+        output = self.export('all.csv', '--merge')
+        self.assertIn('all.csv is not written', output)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'all.csv')))
+
+        self.export('all.csv', '--merge')
+        self.assertEqual(sorted(os.listdir(self.directory)), ['all.csv', 'nodes'])
+        lines = self.read('all.csv').splitlines()
+        properties = self.server.observations[0].properties
+        self.assertEqual(lines[0], 'node,time,%s' % (','.join(properties)))
+        for i in range(4):
+            rows = self.read('nodes', 'Node-%04d.csv' % (i)).splitlines()[1:]
+            self.assertEqual([line for line in lines if line.startswith('Node-%04d,' % (i))],
+                             ['Node-%04d,%s' % (i, row) for row in rows])
+
+    def test_export_paths(self):
+        paths = ogcsos_shell.get_export_paths(['FOO:Node-1', 'foo:node-1', 'FOO:Node-2'],
+                                              'out')
+        self.assertEqual(paths[2], os.path.join('out', 'FOO_Node-2.csv'))
+        self.assertEqual(len(set(path.lower() for path in paths)), 3)
+        for name, path in zip(['FOO_Node-1-', 'foo_node-1-'], paths):
+            self.assertTrue(os.path.basename(path).startswith(name))
+            self.assertEqual(len(os.path.basename(path)), len(name) + 8 + len('.csv'))
+        self.assertRaises(ValueError, ogcsos_shell.get_export_paths,
+                          ['FOO:Node-1', 'FOO:Node-1'], 'out')
+
+
+class ParquetTest(MockServerTest):
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def rows(self, procedure, measurements):
+        return sorted((dt, procedure, prop, float(value['value']), value['uom'])
+                      for dt, measure in measurements.items()
+                      for prop, value in measure.items())
+
+    def read(self, path):
+        table = ogcsosapi.pyarrow.parquet.read_table(path).to_pydict()
+        return sorted(zip(table['timestamp'], table['procedure'], table['property'],
+                          table['value'], table['uom']))
+
+    @unittest.skipIf(ogcsosapi.pyarrow is None, 'requires pyarrow')
+    def test_write(self):
+        path = os.path.join(self.directory, 'a.parquet')
+        procedures = [MockSOSServer.procedure(i) for i in range(3)]
+        expected = []
+        with ogcsosapi.ParquetSink(path, row_group_size=50) as sink:
+            for procedure in procedures:
+                measurements = self.server.get_observation(procedure, PROPERTIES, TIME_RANGE)
+                sink.write(procedure, measurements)
+                expected += self.rows(procedure, measurements)
+        self.assertEqual(sink.rows, len(expected))
+        self.assertEqual(sink.row_groups, (len(expected) + 49) // 50)
+        self.assertEqual(ogcsosapi.pyarrow.parquet.ParquetFile(path).num_row_groups,
+                         sink.row_groups)
+        self.assertEqual(self.read(path), sorted(expected))
+
+    @unittest.skipIf(ogcsosapi.pyarrow is None, 'requires pyarrow')
+    def test_columnar(self):
+        (dict_path, columnar_path) = [os.path.join(self.directory, name)
+                                      for name in ('dict.parquet', 'columnar.parquet')]
+        with ogcsosapi.ParquetSink(dict_path) as sink:
+            sink.write(self.procedure,
+                       self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE))
+        with ogcsosapi.ParquetSink(columnar_path) as sink:
+            sink.write(self.procedure,
+                       self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE,
+                                                   format='columnar'))
+        self.assertEqual(self.read(columnar_path), self.read(dict_path))
+
+    @unittest.skipIf(ogcsosapi.pyarrow is None, 'requires pyarrow')
+    def test_not_a_number(self):
+        path = os.path.join(self.directory, 'a.parquet')
+        with ogcsosapi.ParquetSink(path) as sink:
+            sink.write(self.procedure, {TIME_RANGE[0] : {'status' : {'value' : 'OK',
+                                                                     'uom' : None}}})
+        self.assertEqual(self.read(path), [(TIME_RANGE[0], self.procedure, 'status', None,
+                                            None)])
+
+    @unittest.skipIf(ogcsosapi.pyarrow is None, 'requires pyarrow')
+    def test_write_file(self):
+        paths = [os.path.join(self.directory, '%d.parquet' % (i)) for i in range(3)]
+        expected = []
+        for i, path in enumerate(paths):
+            procedure = MockSOSServer.procedure(i)
+            with ogcsosapi.ParquetSink(path, row_group_size=30) as sink:
+                measurements = self.server.get_observation(procedure, PROPERTIES, TIME_RANGE)
+                sink.write(procedure, measurements)
+                expected += self.rows(procedure, measurements)
+
+        merged = os.path.join(self.directory, 'merged.parquet')
+        with ogcsosapi.ParquetSink(merged, row_group_size=100) as sink:
+            for path in paths:
+                sink.write_file(path)
+        self.assertEqual(sink.rows, len(expected))
+        self.assertEqual(self.read(merged), sorted(expected))
+
+    @unittest.skipIf(ogcsosapi.pyarrow is not None, 'pyarrow is installed')
+    def test_without_pyarrow(self):
+        self.assertRaises(ImportError, ogcsosapi.ParquetSink,
+                          os.path.join(self.directory, 'a.parquet'))
+        self.server.update_capabilities()
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            ogcsos_shell.export_measurements(['-n', 'Node-0000', '-o', self.directory,
+                                              '--format', 'parquet'], self.server)
+        finally:
+            sys.stdout = stdout
+        self.assertIn('pyarrow is required', output.getvalue())
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class AlignTest(MockServerTest):
+    mock_options = {'nodes' : 2, 'step' : 300}
+
+    def minutes(self, *minutes):
+        return [TIME_RANGE[0] + timedelta(minutes=m) for m in minutes]
+
+    def series(self):
+        return [('a', self.minutes(0, 10, 20), [1.0, 2.0, 3.0]),
+                ('b', self.minutes(3, 17), [10.0, 20.0])]
+
+    def align(self, series, *args):
+        """returns aligned rows, also checks numpy gives the same."""
+        table = ogcsosapi.align_series(series, *args)
+        rows = list(table.iter_rows())
+        if ogcsosapi.np is not None:
+            arrays = [(key, ogcsosapi.np.array(times, dtype='datetime64[s]'),
+                       ogcsosapi.np.array(values))
+                      for (key, times, values) in series]
+            self.assertEqual(list(ogcsosapi.align_series(arrays, *args).iter_rows()), rows)
+        return rows
+
+    def test_exact(self):
+        self.assertEqual(self.align(self.series()),
+                         list(zip(self.minutes(0, 3, 10, 17, 20),
+                                  [[1.0, None], [None, 10.0], [2.0, None], [None, 20.0],
+                                   [3.0, None]])))
+        grid = timedelta(minutes=5)
+        self.assertEqual([row for _, row in self.align(self.series(), grid)],
+                         [[1.0, None], [None, None], [2.0, None], [None, None], [3.0, None]])
+
+    def test_nearest(self):
+        grid = timedelta(minutes=5)
+        # ties go to the earlier sample
+        self.assertEqual(self.align(self.series(), grid, 'nearest'),
+                         list(zip(self.minutes(0, 5, 10, 15, 20),
+                                  [[1.0, 10.0], [1.0, 10.0], [2.0, 10.0], [2.0, 20.0],
+                                   [3.0, 20.0]])))
+        self.assertEqual([row for _, row in self.align(self.series(), grid, 'nearest',
+                                                       timedelta(minutes=2))],
+                         [[1.0, None], [None, 10.0], [2.0, None], [None, 20.0], [3.0, None]])
+
+    def test_ffill(self):
+        grid = timedelta(minutes=5)
+        self.assertEqual([row for _, row in self.align(self.series(), grid, 'ffill')],
+                         [[1.0, None], [1.0, 10.0], [2.0, 10.0], [2.0, 10.0], [3.0, 20.0]])
+        self.assertEqual([row for _, row in self.align(self.series(), grid, 'ffill',
+                                                       timedelta(minutes=5))],
+                         [[1.0, None], [1.0, 10.0], [2.0, None], [2.0, None], [3.0, 20.0]])
+
+    def test_grid_list(self):
+        self.assertEqual(self.align(self.series(), self.minutes(1, 18), 'nearest'),
+                         list(zip(self.minutes(1, 18), [[1.0, 10.0], [3.0, 20.0]])))
+        self.assertRaises(ValueError, ogcsosapi.align_series, self.series(), None, 'linear')
+
+    def test_nodes(self):
+        # series of nodes keyed by (procedure, property), on a grid of mock samples
+        procedures = [MockSOSServer.procedure(i) for i in range(2)]
+        series = []
+        for procedure in procedures:
+            measurements = self.server.get_observation(procedure, PROPERTIES, TIME_RANGE)
+            series.extend(ogcsosapi.measurement_series(measurements, PROPERTIES, procedure))
+        table = ogcsosapi.align_series(series, timedelta(minutes=10))
+        self.assertEqual(table.keys, [(procedure, prop) for procedure in procedures
+                                      for prop in PROPERTIES])
+        self.assertEqual(len(table), 6)
+        for dt, row in table.iter_rows():
+            self.assertEqual(row, [self.mock.value(procedure, prop, dt)
+                                   for procedure in procedures for prop in PROPERTIES])
+
+    def test_csv_lines(self):
+        measurements = self.server.get_observation(self.procedure, PROPERTIES, TIME_RANGE)
+        # holes, and a time without value of the properties
+        del measurements[TIME_RANGE[0]][PROPERTIES[0]]
+        del measurements[TIME_RANGE[0] + timedelta(minutes=5)][PROPERTIES[1]]
+        measurements[TIME_RANGE[0] + timedelta(minutes=7)] = {'other' : {'value' : 1.0,
+                                                                         'uom' : 'mm'}}
+        # exact alignment on times of measurements pivots them directly
+        lines = ogcsos_shell.format_csv_lines(measurements, PROPERTIES, 'node,')
+        table = ogcsosapi.align_series(ogcsosapi.measurement_series(measurements, PROPERTIES))
+        self.assertEqual(lines, ['node,%s,%s\n' % (dt, ','.join('' if value is None else
+                                                               str(value) for value in row))
+                                 for dt, row in table.iter_rows(skip_empty=True)])
+        self.assertEqual(len(lines), 12)
+        self.assertTrue(lines[0].startswith('node,2017-01-01 00:00:00,,'))
+
+        lines = ogcsos_shell.format_csv_lines(measurements, PROPERTIES, '',
+                                              (timedelta(minutes=10), 'ffill', None))
+        self.assertEqual(len(lines), 6)
+
+
+class AggregateTest(MockServerTest):
+    FUNCTIONS = ['mean', 'min', 'max', 'count', 'last']
+    HOUR = [TIME_RANGE[0], TIME_RANGE[0] + timedelta(hours=1)]
+
+    def window(self, prop, start, size):
+        values = [self.mock.value(self.procedure, prop, start + timedelta(minutes=m))
+                  for m in range(size)]
+        return (prop, start, {'mean' : sum(values) / len(values), 'min' : min(values),
+                              'max' : max(values), 'count' : len(values),
+                              'last' : values[-1]})
+
+    def test_tumbling(self):
+        windows = list(self.server.aggregate_observation(self.procedure, PROPERTIES, self.HOUR,
+                                                         timedelta(minutes=10),
+                                                         functions=self.FUNCTIONS))
+        # the sample at the end of time range does not make a partial window
+        self.assertEqual(sorted(windows),
+                         sorted(self.window(prop, TIME_RANGE[0] + timedelta(minutes=m), 10)
+                                for prop in PROPERTIES for m in range(0, 60, 10)))
+
+    def test_sliding(self):
+        windows = list(self.server.aggregate_observation(self.procedure, PROPERTIES[:1],
+                                                         self.HOUR, timedelta(minutes=10),
+                                                         timedelta(minutes=5), ['count']))
+        self.assertEqual([(start, results['count']) for (_, start, results) in windows],
+                         [(TIME_RANGE[0] + timedelta(minutes=m), 10) for m in range(0, 55, 5)])
+
+        # without time range, windows starting before first sample are partial
+        aggregator = ogcsosapi.WindowAggregator(timedelta(minutes=10), timedelta(minutes=5),
+                                                ['count'])
+        windows = []
+        for m in range(10):
+            windows.extend(aggregator.add(TIME_RANGE[0] + timedelta(minutes=m), 'a', 1.0))
+        self.assertEqual([(start, results['count']) for (_, start, results)
+                          in windows + aggregator.flush()],
+                         [(TIME_RANGE[0] - timedelta(minutes=5), 5), (TIME_RANGE[0], 10),
+                          (TIME_RANGE[0] + timedelta(minutes=5), 5)])
+
+    def test_late(self):
+        aggregator = ogcsosapi.WindowAggregator(timedelta(minutes=10), functions=['count'])
+        dts = [TIME_RANGE[0] + timedelta(minutes=m) for m in (0, 5, 3, 12, 8, 14, 25)]
+        closed = []
+        for dt in dts:
+            closed.extend(aggregator.add(dt, 'a', 1.0))
+        # 3 is in open window, 8 arrived after its window was closed
+        self.assertEqual(aggregator.late, 1)
+        self.assertEqual(closed, [('a', TIME_RANGE[0], {'count' : 3}),
+                                  ('a', TIME_RANGE[0] + timedelta(minutes=10), {'count' : 2})])
+        self.assertEqual(aggregator.flush(),
+                         [('a', TIME_RANGE[0] + timedelta(minutes=20), {'count' : 1})])
+        # other keys have their own watermark
+        aggregator.add(TIME_RANGE[0], 'b', 1.0)
+        self.assertEqual(aggregator.late, 1)
+
+    def test_observations(self):
+        observations = [(TIME_RANGE[0] + timedelta(minutes=m), 'a', {'value' : value})
+                        for (m, value) in [(0, '1.5'), (1, 'NaN?'), (2, 2.5), (11, 3.0),
+                                           (1, 4.0)]]
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            windows = list(ogcsosapi.aggregate_observations(observations,
+                                                            timedelta(minutes=10),
+                                                            functions=['mean', 'count']))
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(windows, [('a', TIME_RANGE[0], {'mean' : 2.0, 'count' : 2}),
+                                   ('a', TIME_RANGE[0] + timedelta(minutes=10),
+                                    {'mean' : 3.0, 'count' : 1})])
+        self.assertIn('1 samples arrived out of order', output.getvalue())
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, ogcsosapi.WindowAggregator, timedelta(minutes=10),
+                          functions=['median'])
+        self.assertRaises(ValueError, ogcsosapi.WindowAggregator, timedelta(0))
+
+
+class CompactCatalogTest(MockServerTest):
+    mock_options = {'nodes' : 20}
+
+    def setUp(self):
+        MockServerTest.setUp(self)
+        self.server.update_capabilities()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_shared(self):
+        observations = self.server.observations
+        first = observations[0]
+        self.assertFalse(hasattr(first, '__dict__'))
+        for observation in observations[1:]:
+            self.assertIs(observation.properties, first.properties)
+            self.assertIs(observation.time_range, first.time_range)
+            self.assertIs(observation._extents, first._extents)
+        self.assertEqual(len(first._extents.values), 6 * len(observations))
+        self.assertIsInstance(first.properties, tuple)
+
+    def test_numbers(self):
+        for observation in self.server.observations:
+            (lower, upper) = observation.location
+            self.assertEqual(observation.coordinates,
+                             tuple(float(value) for value in (lower + ' ' + upper).split()))
+            self.assertEqual(observation.period[0], datetime(2017, 1, 1))
+            self.assertEqual(observation.period[0].strftime('%Y-%m-%dT%H:%M:%S'),
+                             observation.time_range[0][:19])
+
+    def test_assign(self):
+        observation = Observation(name='Extra', procedure='MOCK:Field:Extra',
+                                  properties=['rainfall'])
+        self.assertEqual(observation.to_dict(), {'name' : 'Extra',
+                                                 'procedure' : 'MOCK:Field:Extra',
+                                                 'properties' : ('rainfall',)})
+        self.assertIsNone(observation.coordinates)
+        self.assertIsNone(observation.period)
+        observation.location = ['35.5 139.5', '35.6 139.6']
+        observation.time_range = ['2017-01-01T00:00:00+09:00', 'unknown']
+        self.assertEqual(observation.coordinates, (35.5, 139.5, 35.6, 139.6))
+        self.assertIsNone(observation.period)
+        observation.time_range = ['2017-01-01T00:00:00+09:00', '2017-01-02T00:00:00+09:00']
+        self.assertEqual(observation.period, (datetime(2017, 1, 1), datetime(2017, 1, 2)))
+        observation.location = ['', '']
+        self.assertIsNone(observation.coordinates)
+        self.assertEqual(observation.location, ('', ''))
+
+    def test_save_and_load(self):
+        path = os.path.join(self.directory, 'catalog.json')
+        ogcsosapi.save_catalog(path, self.server.catalog, self.mock.endpoint)
+        catalog = ogcsosapi.load_catalog(path, self.mock.endpoint)
+        self.assertEqual([observation.to_dict() for observation in catalog.observations],
+                         [observation.to_dict() for observation in self.server.observations])
+        self.assertEqual([(observation.coordinates, observation.period)
+                          for observation in catalog.observations],
+                         [(observation.coordinates, observation.period)
+                          for observation in self.server.observations])
+        self.assertIs(catalog.observations[0].properties, catalog.observations[1].properties)
+        self.assertIsNone(ogcsosapi.load_catalog(path, 'http://other/sos'))
+
+    def test_load_old_file(self):
+        # catalogs saved before records were compact have vars() of plain objects
+        path = os.path.join(self.directory, 'catalog.json')
+        observation = {'name' : 'Node-0000', 'description' : 'old',
+                       'procedure' : 'MOCK:Field:Node-0000',
+                       'properties' : ['air_temperature', 'relative_humidity'],
+                       'location' : ['35.0 139.0', '35.0 139.0'],
+                       'time_range' : ['2017-01-01T00:00:00.000+09:00',
+                                       '2017-01-02T00:00:00.000+09:00']}
+        with open(path, 'w') as f:
+            json.dump({'endpoint' : self.mock.endpoint, 'fetched' : time.time(),
+                       'server' : None, 'provider' : None, 'operations' : [],
+                       'filters' : [], 'observations' : [observation]}, f)
+        (loaded,) = ogcsosapi.load_catalog(path, self.mock.endpoint).observations
+        self.assertEqual(loaded.properties, ('air_temperature', 'relative_humidity'))
+        self.assertEqual(loaded.coordinates, (35.0, 139.0, 35.0, 139.0))
+        self.assertEqual(loaded.period, (datetime(2017, 1, 1), datetime(2017, 1, 2)))
+        self.assertEqual(loaded.to_dict(), dict((name, tuple(value) if type(value) == list
+                                                  else value)
+                                                 for name, value in observation.items()))
+
+
+if __name__ == '__main__':
+    unittest.main()